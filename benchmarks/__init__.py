@@ -0,0 +1 @@
+"""下载性能测试: 本地模拟Hub (fakehub) 和测量吞吐、内存、重试、界面延迟的测试程序 (bench)"""
@@ -0,0 +1,293 @@
+"""下载性能测试
+
+对本地模拟Hub (benchmarks.fakehub) 中的合成仓库运行与GUI、命令行相同的下载流程 (DownloadJob),
+输出每个场景的吞吐、峰值内存、重试次数和界面循环延迟, 修改下载代码前后各运行一次即可对比:
+
+    python -m benchmarks                                   全部场景, 不注入故障
+    python -m benchmarks --scenario tiny --latency 0.05    只测小文件, 每个请求增加50ms延迟
+    python -m benchmarks --drop-rate 0.05 --bandwidth 20MB --json > after.jsonl
+
+模拟Hub在单独的进程中运行, 不占用被测进程的CPU和内存。
+界面循环延迟模拟GUI的事件队列: 下载线程把事件放入队列, 界面线程每50ms取出并处理一次,
+记录每帧比预定时间晚了多少, 以及事件从发出到被处理等了多久。
+"""
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from urllib.request import urlopen
+
+from hfdl import DownloadJob, DownloadTracker, RetryPolicy, format_progress, format_size
+from hfdl.constants import DEFAULT_MAX_WORKERS, DEFAULT_SEGMENTS
+
+from .fakehub import SCENARIOS, add_fault_arguments
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def current_rss():
+    """当前进程占用的物理内存 (字节), 无法获取时返回None"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # 没有/proc时只能得到进程启动以来的峰值; macOS的单位是字节, 其他系统是KB
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+class RssSampler:
+    """在后台线程中定时采样内存占用, 记录峰值"""
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.baseline = current_rss()
+        self.peak = self.baseline
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="bench-rss", daemon=True)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            rss = current_rss()
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+class UiLoopProbe:
+    """按GUI的方式处理下载事件, 测量界面线程的响应延迟
+
+    frame_interval、max_events_per_frame和progress_interval与GUI中的
+    ui_frame_interval、ui_max_events_per_frame和progress_update_interval相同。
+    """
+    frame_interval = 0.05
+    max_events_per_frame = 5000
+    progress_interval = 1.0
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.queue = queue.Queue()
+        self.frame_lag = []      # 每帧比预定时间晚的秒数
+        self.event_latency = []  # 事件从放入队列到被处理的秒数
+        self.max_backlog = 0
+        self.events = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="bench-ui", daemon=True)
+
+    def listener(self, event, data):
+        """交给DownloadTracker的回调, 与GUI的on_tracker_event一样只把事件放入队列"""
+        if "message" in data or event == "progress":
+            self.queue.put((time.perf_counter(), event, data))
+
+    def run(self):
+        next_frame = time.perf_counter() + self.frame_interval
+        next_progress = time.perf_counter() + self.progress_interval
+        while not self.stop_event.is_set():
+            delay = next_frame - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            now = time.perf_counter()
+            self.frame_lag.append(now - next_frame)
+            self.max_backlog = max(self.max_backlog, self.queue.qsize())
+            try:
+                for _ in range(self.max_events_per_frame):
+                    queued_at, event, data = self.queue.get_nowait()
+                    self.event_latency.append(now - queued_at)
+                    self.events += 1
+                    if event == "progress":
+                        format_progress(data)
+            except queue.Empty:
+                pass
+            if now >= next_progress and self.tracker.running:
+                self.tracker.update_speed()
+                next_progress = now + self.progress_interval
+            # 与tkinter的after一样, 下一帧从本帧处理完成后开始计时
+            next_frame = time.perf_counter() + self.frame_interval
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def results(self):
+        return {
+            "ui_frame_lag_p50_ms": percentile(self.frame_lag, 50) * 1000,
+            "ui_frame_lag_p99_ms": percentile(self.frame_lag, 99) * 1000,
+            "ui_frame_lag_max_ms": max(self.frame_lag or [0]) * 1000,
+            "ui_event_latency_p50_ms": percentile(self.event_latency, 50) * 1000,
+            "ui_event_latency_p99_ms": percentile(self.event_latency, 99) * 1000,
+            "ui_events": self.events,
+            "ui_max_backlog": self.max_backlog,
+        }
+
+class FakeHubProcess:
+    """在子进程中运行benchmarks.fakehub"""
+    def __init__(self, args):
+        self.args = args
+        self.process = None
+        self.endpoint = None
+        self.repos = {}
+
+    def start(self):
+        self.process = subprocess.Popen([sys.executable, "-m", "benchmarks.fakehub", "--json"] + self.args,
+                                        cwd=REPO_ROOT, stdout=subprocess.PIPE, universal_newlines=True)
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError("模拟Hub启动失败")
+        info = json.loads(line)
+        self.endpoint = info["endpoint"]
+        self.repos = info["repos"]
+        return self.endpoint
+
+    def stats(self):
+        with urlopen(f"{self.endpoint}/_bench/stats", timeout=10) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+def run_scenario(hub, repo_id, args):
+    """下载一个仓库并返回测量结果"""
+    local_dir = tempfile.mkdtemp(prefix="hfdl-bench-", dir=args.work_dir)
+    tracker = DownloadTracker()
+    probe = UiLoopProbe(tracker)
+    tracker.listener = probe.listener
+    job = DownloadJob(
+        repo_id, local_dir, tracker,
+        endpoint=hub.endpoint,
+        max_workers=args.max_workers,
+        segments=args.segments,
+        adaptive=args.adaptive,
+        proxies={},
+        retry_policy=RetryPolicy(attempts=args.retries + 1, base_delay=args.retry_delay),
+        transfer_mode=args.transfer_mode,
+    )
+    server_before = hub.stats()
+    sampler = RssSampler()
+    sampler.start()
+    probe.start()
+    started = time.perf_counter()
+    error = None
+    try:
+        job.run()
+    except Exception as e:
+        error = str(e)
+    elapsed = time.perf_counter() - started
+    probe.stop()
+    sampler.stop()
+    server_after = hub.stats()
+    if not args.keep:
+        shutil.rmtree(local_dir, ignore_errors=True)
+
+    result = {
+        "scenario": repo_id.split("/", 1)[1],
+        "files": tracker.downloaded_files,
+        "failed": len(tracker.failed_files),
+        "bytes": tracker.transferred_bytes,
+        "seconds": elapsed,
+        "throughput": tracker.transferred_bytes / elapsed if elapsed > 0 else 0.0,
+        "files_per_second": tracker.downloaded_files / elapsed if elapsed > 0 else 0.0,
+        "retries": tracker.retries,
+        "rss_baseline": sampler.baseline,
+        "rss_peak": sampler.peak,
+        "server_requests": server_after["requests"] - server_before["requests"],
+        "server_dropped": server_after["dropped"] - server_before["dropped"],
+        "server_errors": server_after["errors"] - server_before["errors"],
+        "error": error,
+    }
+    result.update(probe.results())
+    return result
+
+def format_result(result):
+    rss = "未知"
+    if result["rss_peak"] is not None:
+        rss = format_size(result["rss_peak"])
+        if result["rss_baseline"] is not None:
+            rss += f" (开始时 {format_size(result['rss_baseline'])})"
+    lines = [
+        f"== {result['scenario']} ==",
+        f"  文件: {result['files']} 成功, {result['failed']} 失败, 共 {format_size(result['bytes'])}, "
+        f"用时 {result['seconds']:.2f} 秒",
+        f"  吞吐: {format_size(result['throughput'])}/s, {result['files_per_second']:.1f} 个文件/秒",
+        f"  峰值内存: {rss}",
+        f"  重试: {result['retries']} 次 (服务器请求 {result['server_requests']}, "
+        f"断开 {result['server_dropped']}, 503 {result['server_errors']})",
+        f"  界面帧延迟: p50 {result['ui_frame_lag_p50_ms']:.1f}ms, p99 {result['ui_frame_lag_p99_ms']:.1f}ms, "
+        f"最大 {result['ui_frame_lag_max_ms']:.1f}ms",
+        f"  事件等待: p50 {result['ui_event_latency_p50_ms']:.1f}ms, p99 {result['ui_event_latency_p99_ms']:.1f}ms, "
+        f"{result['ui_events']} 个事件, 最多积压 {result['ui_max_backlog']}",
+    ]
+    if result["error"]:
+        lines.append(f"  错误: {result['error']}")
+    return "\n".join(lines)
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="对本地模拟Hub测量下载性能")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="测试场景, 可重复指定 (默认: 全部)")
+    parser.add_argument("--scale", type=float, default=1.0, help="文件大小和小文件数量的缩放比例 (默认: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=1, help="每个场景运行的次数 (默认: %(default)s)")
+    parser.add_argument("--max-workers", type=int, default=DEFAULT_MAX_WORKERS)
+    parser.add_argument("--segments", type=int, default=DEFAULT_SEGMENTS)
+    parser.add_argument("--adaptive", action="store_true")
+    parser.add_argument("--transfer-mode", choices=("auto", "threads", "async"), default="auto")
+    parser.add_argument("--retries", type=int, default=RetryPolicy().attempts - 1)
+    parser.add_argument("--retry-delay", type=float, default=0.2, metavar="SECONDS",
+                        help="第一次重试前的等待时间 (默认: %(default)s)")
+    parser.add_argument("--work-dir", default=None, help="下载到该目录下的临时目录 (默认: 系统临时目录)")
+    parser.add_argument("--keep", action="store_true", help="保留下载的文件")
+    parser.add_argument("--json", action="store_true", help="每个场景输出一行JSON")
+    add_fault_arguments(parser)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    scenarios = args.scenario or sorted(SCENARIOS)
+    hub_args = ["--scale", str(args.scale), "--seed", str(args.seed),
+                "--latency", str(args.latency), "--drop-rate", str(args.drop_rate),
+                "--error-rate", str(args.error_rate)]
+    for scenario in scenarios:
+        hub_args += ["--scenario", scenario]
+    if args.bandwidth:
+        hub_args += ["--bandwidth", str(args.bandwidth)]
+    if args.total_bandwidth:
+        hub_args += ["--total-bandwidth", str(args.total_bandwidth)]
+
+    hub = FakeHubProcess(hub_args)
+    hub.start()
+    failed = False
+    try:
+        for scenario in scenarios:
+            for _ in range(max(1, args.repeat)):
+                result = run_scenario(hub, f"bench/{scenario}", args)
+                failed = failed or bool(result["failed"] or result["error"])
+                print(json.dumps(result) if args.json else format_result(result), flush=True)
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        hub.stop()
+    return 1 if failed else 0
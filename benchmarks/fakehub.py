@@ -0,0 +1,470 @@
+"""模拟HuggingFace Hub的本地HTTP服务器, 用于离线性能测试
+
+提供下载器用到的接口:
+    /api/models/<仓库>[/revision/<版本>]          仓库信息 (siblings, 带大小和LFS sha256), 带ETag, 支持If-None-Match
+    /api/models/<仓库>/tree/<版本>[/<目录>]        目录列表, recursive=true时列出全部文件
+    /<仓库>/resolve/<版本>/<文件>                  文件内容, 支持HEAD和Range请求
+数据集和Space仓库的接口为 /api/datasets/、/api/spaces/ 和 /datasets/<仓库>、/spaces/<仓库>。
+
+文件内容由种子生成, 不占用磁盘, 大文件也只在内存中保留一个64KB的数据块。
+测试需要真实的文件格式时可以用ContentFile直接给出文件内容。
+可以注入延迟、带宽限制、连接中断和503错误, 注入的次数可从 /_bench/stats 读取。
+
+单独运行时在后台提供服务, 可把GUI或命令行的下载地址指向它:
+
+    python -m benchmarks.fakehub --scenario mixed --latency 0.05 --bandwidth 20MB
+"""
+import re
+import sys
+import json
+import time
+import socket
+import random
+import hashlib
+import argparse
+import threading
+from functools import lru_cache
+from socketserver import ThreadingMixIn
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from hfdl.utils import parse_size, format_size
+
+BLOCK_SIZE = 64 * 1024
+LFS_THRESHOLD = 1024 * 1024  # 不小于该大小的文件按LFS文件处理, 元数据中带sha256
+MB = 1024 * 1024
+
+# 场景: 仓库名 -> [(文件数, 最小字节数, 最大字节数, 文件名模板)]
+SCENARIOS = {
+    "tiny": [
+        (2000, 200, 16 * 1024, "data/part-{i:05d}.json"),
+    ],
+    "shards": [
+        (1, 800, 800, "config.json"),
+        (3, 256 * MB, 256 * MB, "model-{n:05d}-of-{count:05d}.safetensors"),
+    ],
+    "mixed": [
+        (1, 800, 800, "config.json"),
+        (5, 2 * 1024, 2 * MB, "tokenizer/file-{i}.json"),
+        (500, 200, 64 * 1024, "samples/{i:04d}.txt"),
+        (20, 4 * MB, 16 * MB, "onnx/layer-{i:02d}.onnx"),
+        (2, 128 * MB, 128 * MB, "model-{n:05d}-of-{count:05d}.safetensors"),
+    ],
+}
+
+@lru_cache(maxsize=256)
+def _block(seed):
+    """文件内容是按种子生成的64KB数据块的重复, 返回两份拼接的数据块便于按偏移切片"""
+    block = random.Random(seed).getrandbits(8 * BLOCK_SIZE).to_bytes(BLOCK_SIZE, "little")
+    return block + block
+
+class SyntheticFile:
+    """由种子生成内容的文件"""
+    def __init__(self, path, size, seed):
+        self.path = path
+        self.size = size
+        self.seed = seed
+        self.lfs = size >= LFS_THRESHOLD
+        self._sha256 = None
+        self._blob_id = None
+
+    def chunks(self, start=0, end=None, chunk_size=BLOCK_SIZE):
+        """按顺序生成 [start, end] 范围内的数据"""
+        end = self.size - 1 if end is None else end
+        data = _block(self.seed)
+        position = start
+        while position <= end:
+            offset = position % BLOCK_SIZE
+            length = min(chunk_size, BLOCK_SIZE - offset, end - position + 1)
+            yield data[offset:offset + length]
+            position += length
+
+    @property
+    def sha256(self):
+        if self._sha256 is None:
+            digest = hashlib.sha256()
+            for chunk in self.chunks():
+                digest.update(chunk)
+            self._sha256 = digest.hexdigest()
+        return self._sha256
+
+    @property
+    def blob_id(self):
+        """git blob id; LFS文件使用指针文件的blob id"""
+        if self._blob_id is None:
+            if self.lfs:
+                content = (f"version https://git-lfs.github.com/spec/v1\noid sha256:{self.sha256}\n"
+                           f"size {self.size}\n").encode("ascii")
+            else:
+                content = b"".join(self.chunks())
+            self._blob_id = hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+        return self._blob_id
+
+    def sibling(self):
+        info = {"rfilename": self.path, "size": self.size, "blobId": self.blob_id}
+        if self.lfs:
+            info["lfs"] = {"sha256": self.sha256, "size": self.size, "pointerSize": 134}
+        return info
+
+class ContentFile(SyntheticFile):
+    """内容给定的文件, 用于需要真实文件格式的测试 (safetensors、压缩包等)"""
+    def __init__(self, path, content):
+        super().__init__(path, len(content), None)
+        self.content = bytes(content)
+
+    def chunks(self, start=0, end=None, chunk_size=BLOCK_SIZE):
+        end = self.size - 1 if end is None else end
+        for position in range(start, end + 1, chunk_size):
+            yield self.content[position:min(position + chunk_size, end + 1)]
+
+class SyntheticRepo:
+    def __init__(self, repo_id, files, repo_type="model"):
+        self.repo_id = repo_id
+        self.repo_type = repo_type  # "model"、"dataset"或"space", 决定仓库的网址前缀
+        self.files = {f.path: f for f in files}
+        self.sha = hashlib.sha1(repo_id.encode("utf-8")).hexdigest()
+
+    @property
+    def total_bytes(self):
+        return sum(f.size for f in self.files.values())
+
+    def prepare(self):
+        """预先计算所有sha256, 避免第一次元数据请求被计入下载时间"""
+        for f in self.files.values():
+            f.blob_id
+
+def make_repo(scenario, scale=1.0, seed=0):
+    """按场景生成仓库, scale缩放小文件的数量和大文件 (不小于LFS_THRESHOLD) 的大小"""
+    rng = random.Random(f"{scenario}:{seed}")
+    files = []
+    for count, min_size, max_size, template in SCENARIOS[scenario]:
+        small = max_size < LFS_THRESHOLD
+        if small:
+            count = max(1, int(count * scale))
+        for i in range(count):
+            size = rng.randint(min_size, max_size)
+            if not small:
+                size = max(1, int(size * scale))
+            path = template.format(i=i, n=i + 1, count=count)
+            files.append(SyntheticFile(path, size, f"{scenario}:{seed}:{path}"))
+    return SyntheticRepo(f"bench/{scenario}", files)
+
+class Faults:
+    """注入的故障
+
+    latency: 每个请求在返回响应头前等待的秒数
+    bandwidth: 每个连接的速度上限 (字节/秒), total_bandwidth: 所有连接共用的速度上限
+    drop_rate: 文件响应在传输中途断开连接的概率
+    error_rate: 文件请求直接返回503的概率
+    """
+    def __init__(self, latency=0.0, bandwidth=None, total_bandwidth=None, drop_rate=0.0, error_rate=0.0,
+                 seed=0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.total_bandwidth = total_bandwidth
+        self.drop_rate = drop_rate
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def roll(self, probability):
+        if probability <= 0:
+            return False
+        with self.lock:
+            return self.rng.random() < probability
+
+    def describe(self):
+        parts = []
+        if self.latency:
+            parts.append(f"延迟 {self.latency * 1000:.0f}ms")
+        if self.bandwidth:
+            parts.append(f"每连接 {format_size(self.bandwidth)}/s")
+        if self.total_bandwidth:
+            parts.append(f"总带宽 {format_size(self.total_bandwidth)}/s")
+        if self.drop_rate:
+            parts.append(f"断开连接 {self.drop_rate:.1%}")
+        if self.error_rate:
+            parts.append(f"503错误 {self.error_rate:.1%}")
+        return ", ".join(parts) or "无"
+
+class Pacer:
+    """按固定速度发送: 每次发送n字节都把下一次可发送的时间推后n/rate秒"""
+    def __init__(self, rate):
+        self.rate = rate
+        self.next_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, nbytes):
+        with self.lock:
+            now = time.monotonic()
+            self.next_time = max(now, self.next_time) + nbytes / self.rate
+            wait = self.next_time - now
+        if wait > 0:
+            time.sleep(wait)
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def handle_error(self, request, client_address):
+        # 客户端取消或重试时关闭连接是正常情况
+        if not isinstance(sys.exc_info()[1], (ConnectionError, socket.timeout)):
+            super().handle_error(request, client_address)
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # 响应头和正文分开写入, 否则小文件会被延迟确认拖慢40ms
+    hub = None  # 由FakeHub在子类中设置
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.handle_get(head=True)
+
+    def do_GET(self):
+        self.handle_get(head=False)
+
+    def handle_get(self, head):
+        url = urlsplit(self.path)
+        path = unquote(url.path)
+        self.hub.count("requests")
+        if path == "/_bench/stats":
+            return self.send_json(self.hub.stats())
+        match = re.match(r"^/api/(models|datasets|spaces)/([^/]+/[^/]+)(?:/revision/([^/]+))?/?$", path)
+        if match:
+            return self.send_repo_info((match.group(1)[:-1], match.group(2)), match.group(3) or "main", head)
+        match = re.match(r"^/api/(models|datasets|spaces)/([^/]+/[^/]+)/tree/([^/]+)/?(.*)$", path)
+        if match:
+            recursive = parse_qs(url.query).get("recursive", [""])[0].lower() in ("1", "true")
+            return self.send_tree((match.group(1)[:-1], match.group(2)), match.group(3),
+                                  match.group(4).strip("/"), recursive, head)
+        match = re.match(r"^/(?:(dataset|space)s/)?([^/]+/[^/]+)/resolve/([^/]+)/(.+)$", path)
+        if match:
+            return self.send_file((match.group(1) or "model", match.group(2)), match.group(3), match.group(4), head)
+        self.send_empty(404)
+
+    def find_repo(self, key, revision):
+        """key为 (仓库类型, repo_id), 类型与网址前缀不符时同样返回404"""
+        repo = self.hub.repos.get(key)
+        if repo is None or revision not in ("main", repo.sha):
+            self.send_empty(404, {"X-Error-Code": "RepoNotFound" if repo is None else "RevisionNotFound"})
+            return None
+        return repo
+
+    def send_empty(self, status, headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def send_json(self, data, head=False, headers=None):
+        self.hub.count("api_requests")
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def send_repo_info(self, key, revision, head):
+        repo = self.find_repo(key, revision)
+        if repo is None:
+            return
+        self.hub.delay()
+        # 与Hub一样用弱ETag标识仓库信息, 客户端带上相同的If-None-Match时只返回304
+        etag = f'W/"{repo.sha}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.hub.count("api_requests")
+            self.hub.count("not_modified")
+            return self.send_empty(304, {"ETag": etag})
+        self.send_json({"id": repo.repo_id, "modelId": repo.repo_id, "sha": repo.sha, "private": False,
+                        "siblings": [f.sibling() for f in repo.files.values()]}, head, {"ETag": etag})
+
+    def send_tree(self, key, revision, directory, recursive, head):
+        repo = self.find_repo(key, revision)
+        if repo is None:
+            return
+        self.hub.delay()
+        prefix = directory + "/" if directory else ""
+        entries, dirs = [], set()
+        for f in repo.files.values():
+            if not f.path.startswith(prefix):
+                continue
+            rest = f.path[len(prefix):]
+            if "/" in rest and not recursive:
+                dirs.add(prefix + rest.split("/", 1)[0])
+                continue
+            entry = {"type": "file", "oid": f.blob_id, "size": f.size, "path": f.path}
+            if f.lfs:
+                entry["lfs"] = {"oid": f.sha256, "size": f.size, "pointerSize": 134}
+            entries.append(entry)
+        if not entries and not dirs:
+            return self.send_empty(404, {"X-Error-Code": "EntryNotFound"})
+        entries = [{"type": "directory", "oid": "", "size": 0, "path": d} for d in sorted(dirs)] + entries
+        self.send_json(entries, head)
+
+    def send_file(self, key, revision, filename, head):
+        repo = self.find_repo(key, revision)
+        if repo is None:
+            return
+        f = repo.files.get(filename)
+        if f is None:
+            return self.send_empty(404, {"X-Error-Code": "EntryNotFound"})
+        hub = self.hub
+        hub.delay()
+        if not head and hub.faults.roll(hub.faults.error_rate):
+            hub.count("errors")
+            return self.send_empty(503, {"Retry-After": "1"})
+
+        start, end = 0, f.size - 1
+        status = 200
+        range_header = self.headers.get("Range")
+        if range_header:
+            match = re.match(r"bytes=(\d*)-(\d*)$", range_header.strip())
+            if not match:
+                return self.send_empty(416, {"Content-Range": f"bytes */{f.size}"})
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), f.size - 1) if match.group(2) else f.size - 1
+            else:
+                start = max(0, f.size - int(match.group(2)))
+            if start >= f.size or start > end:
+                return self.send_empty(416, {"Content-Range": f"bytes */{f.size}"})
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", f'"{f.sha256 if f.lfs else f.blob_id}"')
+        self.send_header("X-Repo-Commit", repo.sha)
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{f.size}")
+        self.end_headers()
+        if head:
+            return
+
+        # 需要断开时在正文中随机选一个位置
+        drop_at = None
+        if hub.faults.roll(hub.faults.drop_rate):
+            with hub.faults.lock:
+                drop_at = start + hub.faults.rng.randint(0, end - start)
+        pacer = Pacer(hub.faults.bandwidth) if hub.faults.bandwidth else None
+        position = start
+        for chunk in f.chunks(start, end):
+            if drop_at is not None and position + len(chunk) > drop_at:
+                self.wfile.write(chunk[:drop_at - position])
+                hub.count("bytes_sent", drop_at - position)
+                hub.count("dropped")
+                self.close_connection = True
+                self.connection.shutdown(socket.SHUT_RDWR)
+                return
+            if hub.total_pacer is not None:
+                hub.total_pacer.consume(len(chunk))
+            if pacer is not None:
+                pacer.consume(len(chunk))
+            self.wfile.write(chunk)
+            hub.count("bytes_sent", len(chunk))
+            position += len(chunk)
+
+class FakeHub:
+    """在后台线程中运行的模拟Hub
+
+    示例::
+
+        hub = FakeHub([make_repo("tiny")], Faults(latency=0.05))
+        endpoint = hub.start()
+        ...
+        hub.stop()
+    """
+    def __init__(self, repos, faults=None):
+        self.repos = {(repo.repo_type, repo.repo_id): repo for repo in repos}
+        self.faults = faults or Faults()
+        self.total_pacer = Pacer(self.faults.total_bandwidth) if self.faults.total_bandwidth else None
+        self.counters = {"requests": 0, "api_requests": 0, "not_modified": 0, "bytes_sent": 0, "dropped": 0,
+                         "errors": 0}
+        self.lock = threading.Lock()
+        self.server = None
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+    def delay(self):
+        if self.faults.latency:
+            time.sleep(self.faults.latency)
+
+    def start(self, host="127.0.0.1", port=0):
+        """启动服务器, 返回下载地址"""
+        for repo in self.repos.values():
+            repo.prepare()
+        handler = type("Handler", (_Handler,), {"hub": self})
+        self.server = _Server((host, port), handler)
+        threading.Thread(target=self.server.serve_forever, name="fakehub", daemon=True).start()
+        return f"http://{host}:{self.server.server_address[1]}"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+def add_fault_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.0, metavar="SECONDS",
+                        help="每个请求的额外延迟 (默认: %(default)s)")
+    parser.add_argument("--bandwidth", type=parse_size, default=None, metavar="RATE",
+                        help="每个连接的速度上限, 例如 10MB")
+    parser.add_argument("--total-bandwidth", type=parse_size, default=None, metavar="RATE",
+                        help="所有连接共用的速度上限, 例如 50MB")
+    parser.add_argument("--drop-rate", type=float, default=0.0,
+                        help="文件传输中途断开连接的概率, 0到1 (默认: %(default)s)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="文件请求返回503的概率, 0到1 (默认: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="文件内容和故障注入的随机种子")
+
+def faults_from_args(args):
+    return Faults(latency=args.latency, bandwidth=args.bandwidth, total_bandwidth=args.total_bandwidth,
+                  drop_rate=args.drop_rate, error_rate=args.error_rate, seed=args.seed)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.fakehub", description="本地模拟的HuggingFace Hub")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="提供的仓库, 可重复指定 (默认: 全部)")
+    parser.add_argument("--scale", type=float, default=1.0, help="文件大小和小文件数量的缩放比例")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="端口, 0 表示自动选择")
+    parser.add_argument("--json", action="store_true", help="启动后输出一行JSON (供benchmarks.bench读取)")
+    add_fault_arguments(parser)
+    args = parser.parse_args(argv)
+
+    repos = [make_repo(name, args.scale, args.seed) for name in (args.scenario or sorted(SCENARIOS))]
+    hub = FakeHub(repos, faults_from_args(args))
+    endpoint = hub.start(args.host, args.port)
+    if args.json:
+        print(json.dumps({"endpoint": endpoint, "repos": {repo.repo_id: {"files": len(repo.files),
+                                                                         "bytes": repo.total_bytes}
+                                                          for repo in repos}}), flush=True)
+    else:
+        print(f"模拟Hub已启动: {endpoint} (故障注入: {hub.faults.describe()})")
+        for repo in repos:
+            print(f"  {repo.repo_id}: {len(repo.files)} 个文件, {format_size(repo.total_bytes)}")
+        print("按Ctrl+C停止")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        hub.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
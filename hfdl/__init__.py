@@ -0,0 +1,20 @@
+"""HuggingFace 仓库下载核心库
+
+不依赖tkinter, 可在无图形界面的环境中通过命令行 (python -m hfdl) 或直接导入使用。
+"""
+from .constants import (DEFAULT_ENDPOINT, DEFAULT_REVISION, DEFAULT_REPO_TYPE, REPO_TYPES, DEFAULT_MAX_WORKERS,
+                        DEFAULT_SEGMENTS, DEFAULT_SEGMENT_THRESHOLD, DEFAULT_CANCEL_TIMEOUT, DEFAULT_BLOB_STORE)
+from .blobstore import BlobStore
+from .engine import DownloadEngine
+from .asyncengine import AsyncDownloadEngine
+from .errors import DownloadError, RetryPolicy
+from .job import DownloadJob, VerifyJob, format_preview
+from .metadata import get_repo_file_sizes, get_repo_metadata, MetadataCache
+from .metrics import MetricsLog, MetricsServer
+from .peers import PeerCatalog, PeerNetwork, PeerServer
+from .ratelimit import BandwidthLimiter, BandwidthSchedule
+from .session import HttpSession
+from .tracker import DownloadTracker, format_progress
+from .utils import format_size, parse_size, format_duration, parse_patterns, filter_repo_files, make_proxies
+
+__version__ = "1.0"
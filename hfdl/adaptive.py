@@ -0,0 +1,140 @@
+"""根据实测吞吐自动调整连接数和分段数的AIMD控制器"""
+import time
+import threading
+
+import urllib3
+
+from .utils import format_size
+
+DEFAULT_ADAPTIVE_MAX_CONNECTIONS = 64
+
+class AdaptiveConcurrency:
+    """AIMD (加性增、乘性减) 并发控制器
+
+    DownloadEngine每发起一个请求前调用acquire, 同时最多有limit个连接。
+    控制器每隔interval秒根据DownloadTracker累计的transferred_bytes计算吞吐:
+
+    - 出现超时、连接错误、429或5xx: 连接数乘以decrease_factor
+    - 吞吐比上一次增加连接前提高了increase_gain以上: 连接数加1, 继续探测
+    - 吞吐下降超过drop_tolerance: 视为拥塞, 同样乘性减少
+    - 其他情况保持不变, 每probe_interval个周期再尝试加1
+    - 上个周期连接没有用满时不增加 (文件数比连接数少)
+
+    每个文件的分段数按 连接数 / 正在下载的文件数 计算, 只影响之后开始的文件。
+    每次调整都通过tracker记录日志, 并发出"concurrency"事件。
+    """
+    interval = 3.0
+    increase_gain = 0.05
+    drop_tolerance = 0.2
+    decrease_factor = 0.5
+    probe_interval = 5
+
+    def __init__(self, tracker, initial=4, min_connections=1, max_connections=DEFAULT_ADAPTIVE_MAX_CONNECTIONS,
+                 initial_segments=1, max_segments=8):
+        self.tracker = tracker
+        self.min_connections = max(1, int(min_connections))
+        self.max_connections = max(self.min_connections, int(max_connections))
+        self.max_segments = max(1, int(max_segments))
+        self.limit = min(self.max_connections, max(self.min_connections, int(initial)))
+        self.segments = min(self.max_segments, max(1, int(initial_segments)))
+        self.active = 0
+        self.peak_active = 0
+        self.cond = threading.Condition()
+        self.requests = 0
+        self.errors = 0
+        self.last_time = time.time()
+        self.last_bytes = tracker.transferred_bytes
+        self.baseline_rate = None  # 上次增加连接之前的吞吐
+        self.hold_rounds = 0
+
+    def acquire(self, timeout=None):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.active < self.limit, timeout):
+                return False
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+            self.requests += 1
+            return True
+
+    def release(self):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify_all()
+
+    def record_error(self, error):
+        """记录一次失败的请求, 只有表示拥塞的错误才计入"""
+        if is_congestion_error(error):
+            with self.cond:
+                self.errors += 1
+
+    def _set_limit(self, limit):
+        with self.cond:
+            self.limit = min(self.max_connections, max(self.min_connections, limit))
+            self.cond.notify_all()
+
+    def tick(self):
+        """由下载引擎的主循环定期调用, 到达interval时做一次调整, 返回是否调整"""
+        now = time.time()
+        elapsed = now - self.last_time
+        if elapsed < self.interval:
+            return False
+        with self.tracker.lock:
+            transferred = self.tracker.transferred_bytes
+            active_files = len(self.tracker.active_files)
+        with self.cond:
+            requests, errors = self.requests, self.errors
+            saturated = self.peak_active >= self.limit
+            self.requests = self.errors = 0
+            self.peak_active = self.active
+        rate = (transferred - self.last_bytes) / elapsed
+        self.last_bytes = transferred
+        self.last_time = now
+
+        old_limit, old_segments = self.limit, self.segments
+        if errors and errors >= max(1, requests * 0.05):
+            limit = int(old_limit * self.decrease_factor)
+            reason = f"{errors}/{max(requests, errors)} 个请求超时或被限流"
+            self.baseline_rate = None
+        elif self.baseline_rate is not None and rate < self.baseline_rate * (1 - self.drop_tolerance):
+            limit = int(old_limit * self.decrease_factor)
+            reason = f"吞吐从 {format_size(self.baseline_rate)}/s 下降到 {format_size(rate)}/s"
+            self.baseline_rate = None
+        elif not saturated:
+            limit = old_limit
+            reason = "连接未用满, 保持"
+        elif self.baseline_rate is None or rate > self.baseline_rate * (1 + self.increase_gain):
+            limit = old_limit + 1
+            reason = "吞吐仍在提高" if self.baseline_rate is not None else "开始探测"
+            self.baseline_rate = rate
+            self.hold_rounds = 0
+        else:
+            self.hold_rounds += 1
+            limit = old_limit
+            reason = "增加连接后吞吐没有明显提高, 保持"
+            if self.hold_rounds >= self.probe_interval:
+                limit = old_limit + 1
+                reason = "重新探测更多连接"
+                self.baseline_rate = rate
+                self.hold_rounds = 0
+
+        self._set_limit(limit)
+        self.segments = min(self.max_segments, max(1, -(-self.limit // max(1, active_files))))
+        changed = (self.limit, self.segments) != (old_limit, old_segments)
+        self.tracker.emit("concurrency", connections=self.limit, segments=self.segments, rate=rate,
+                          requests=requests, errors=errors, reason=reason)
+        if changed:
+            self.tracker.log(f"[自适应并发] 吞吐 {format_size(rate)}/s, {reason}: "
+                             f"连接数 {old_limit} -> {self.limit}, 分段数 {old_segments} -> {self.segments}")
+        return changed
+
+def is_congestion_error(error):
+    """超时、连接被重置、429和5xx视为拥塞信号, 404、401等不是"""
+    kind = getattr(error, "kind", None)
+    if kind is not None:
+        return kind in ("network", "server", "rate_limit")
+    status = getattr(error, "status", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(error, (urllib3.exceptions.TimeoutError, urllib3.exceptions.ProtocolError,
+                              urllib3.exceptions.NewConnectionError, urllib3.exceptions.MaxRetryError,
+                              TimeoutError, ConnectionError))
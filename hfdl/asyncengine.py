@@ -0,0 +1,356 @@
+"""小文件模式: 用asyncio同时下载大量小文件"""
+import os
+import time
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from .asynchttp import AsyncConnectionPool, unsupported_proxy
+from .constants import DEFAULT_ASYNC_FILE_LIMIT, DEFAULT_ASYNC_MAX_REQUESTS
+from .engine import DownloadEngine
+from .errors import TransientError, http_error, classify_error
+from .utils import format_size
+from .verify import hash_prefix
+
+class _FileWriter:
+    """在磁盘线程中写入一个临时文件; 从打开到关闭占用一个open_files名额"""
+    def __init__(self, path, offset, open_files, executor):
+        self.path = path
+        self.position = offset
+        self.open_files = open_files
+        self.executor = executor
+        self.f = None
+        self.holding = False
+
+    async def write(self, data, finish=False, complete=False, fsync=False):
+        """写入data; finish为True时随后关闭文件, complete为True时文件已完整 (空文件也会创建), 按fsync落盘
+
+        调用方等待写入完成后才继续接收, 磁盘跟不上时网络读取也随之放慢。
+        """
+        if not self.holding:
+            if not data and not complete:
+                return
+            await self.open_files.acquire()
+            self.holding = True
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(self.executor, self._write, bytes(data), complete and fsync)
+        finally:
+            if finish:
+                self.close()
+
+    def _write(self, data, fsync):
+        if self.f is None:
+            self.f = open(self.path, "r+b" if self.position else "wb", buffering=0)
+            self.f.seek(self.position)
+        view = memoryview(data)
+        written = 0
+        while written < len(view):
+            written += self.f.write(view[written:])
+        self.position += len(data)
+        if fsync:
+            os.fsync(self.f.fileno())
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+        if self.holding:
+            self.holding = False
+            self.open_files.release()
+
+class AsyncDownloadEngine(DownloadEngine):
+    """小文件模式的下载引擎: 不超过file_limit的文件在一个asyncio事件循环中下载, 其余文件交给多线程
+
+    数千个小文件的仓库受限于每个请求的往返延迟而不是带宽。每个文件是一个协程, 同时最多有
+    max_requests个文件在进行, 共用少量keep-alive连接, 连接用完后立即交给下一个文件, 不必为每个文件重新握手。
+    大于file_limit的文件同时在线程池中下载 (最大的最先开始), 两边合计的连接数与多线程模式大致相同。
+    磁盘写入在disk_workers个线程中进行, 协程等待写入完成后才继续接收, 磁盘跟不上时自然放慢下载;
+    同时打开的文件不超过max_open_files个, 能一次写完的小文件收完后才打开。
+    重试、续传、sha256校验、限速和取消与DownloadEngine相同。配置了共享连接数调度器
+    (connection_limiter) 或不支持的代理时全部文件改用多线程下载。
+    """
+    write_buffer_size = 256 * 1024  # 每个文件最多缓存的数据, 同时进行的文件多, 比多线程模式小
+    disk_workers = 4
+    max_open_files = 64
+
+    def __init__(self, repo_id, local_dir, tracker, file_sizes=None, max_requests=DEFAULT_ASYNC_MAX_REQUESTS,
+                 file_limit=DEFAULT_ASYNC_FILE_LIMIT, **kwargs):
+        super().__init__(repo_id, local_dir, tracker, **kwargs)
+        self.file_sizes = file_sizes or {}  # 文件 -> 仓库元数据中的大小
+        self.max_requests = max(1, int(max_requests))
+        self.file_limit = file_limit
+        self.loop = None
+        self.pool = None
+        self.loop_connections = self.pool_size()  # 事件循环的连接数, 与多线程同时进行时在run中减少
+
+    def cancel(self):
+        super().cancel()
+        loop = self.loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._abort_connections)
+            except RuntimeError:
+                pass  # 事件循环已结束
+
+    def _abort_connections(self):
+        if self.pool is not None:
+            self.pool.abort()
+
+    def split_files(self, files):
+        """返回 (用asyncio下载的小文件, 交给线程池的其他文件)
+
+        有分段进度的文件仍按分段续传, 边下载边解压的归档和先从局域网节点获取的文件也交给线程池。
+        """
+        small, large = [], []
+        for filename in files:
+            size = self.file_sizes.get(filename)
+            target = os.path.join(self.local_dir, *filename.split("/"))
+            if (self.extraction is not None and self.extraction.handles(filename)) or self.use_peers(filename):
+                large.append(filename)
+            elif size is not None and size <= self.file_limit and not os.path.exists(target + ".segments.json"):
+                small.append(filename)
+            else:
+                large.append(filename)
+        return small, large
+
+    def run(self, files, refresh=()):
+        refresh = set(refresh)
+        self.tracker.files_queued(files)
+        small, large = self.split_files(files)
+        reason = self.fallback_reason()
+        if reason:
+            self.tracker.log(f"{reason}, 改用多线程下载")
+            small, large = [], files
+        # 大文件在后台线程中与事件循环同时下载, 按调度顺序最大的分片最先开始, 不会等所有小文件下载完
+        large_result = None
+        if large:
+            if small:
+                self.tracker.log(f"其余 {len(large)} 个文件 (大于 {format_size(self.file_limit)}) 同时使用多线程下载")
+            large_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hf-large-files")
+            large_result = large_pool.submit(self._run_threads, large, refresh)
+            large_pool.shutdown(wait=False)
+        succeeded = []
+        if small:
+            self.loop_connections = self._loop_connections(large)
+            self.tracker.log(f"小文件模式: {len(small)} 个文件用asyncio下载, 同时最多 {self.max_requests} 个请求, "
+                             f"共用 {self.loop_connections} 个连接")
+            try:
+                succeeded = self._run_loop(small, refresh)
+            except BaseException:
+                self.cancel()
+                raise
+        if large_result is not None:
+            succeeded += large_result.result()
+        self._report_partial_files()
+        return succeeded
+
+    def _loop_connections(self, large):
+        """事件循环的连接数: 从pool_size()中扣除多线程同时下载大文件占用的连接, 至少保留max_workers个"""
+        threads = min(len(large), self.max_workers) * self.segments
+        return max(self.max_workers, self.pool_size() - threads)
+
+    def fallback_reason(self):
+        """不能使用asyncio时返回原因"""
+        if self.connection_limiter is not None:
+            return "任务队列限制了连接数"
+        proxy = unsupported_proxy(self.http.proxies)
+        if proxy:
+            return f"小文件模式只支持HTTP代理, 当前代理为 {proxy}"
+        return None
+
+    def _run_loop(self, files, refresh):
+        loop = asyncio.new_event_loop()
+        disk = ThreadPoolExecutor(max_workers=self.disk_workers, thread_name_prefix="hf-disk")
+        self.loop = loop
+        try:
+            return loop.run_until_complete(self._download_all(files, refresh, disk))
+        finally:
+            self.loop = None
+            loop.close()
+            disk.shutdown(wait=True)
+
+    async def _download_all(self, files, refresh, disk):
+        self.pool = AsyncConnectionPool(self.loop_connections, proxies=self.http.proxies,
+                                        connect_timeout=self.timeout.connect_timeout,
+                                        read_timeout=self.timeout.read_timeout,
+                                        bypass=self.http.bypasses_proxy)
+        if self.is_cancelled():
+            self.pool.abort()
+        requests = asyncio.Semaphore(self.max_requests)
+        open_files = asyncio.Semaphore(self.max_open_files)
+        succeeded = []
+
+        async def download(filename):
+            async with requests:
+                try:
+                    result = await self._download_file(filename, filename in refresh, open_files, disk)
+                except Exception as e:
+                    self._report_failure(filename, e)
+                    return
+            if result:
+                succeeded.append(filename)
+                self.tracker.add_downloaded_file(filename)
+
+        try:
+            await asyncio.gather(*[download(filename) for filename in files])
+        finally:
+            self.pool.close()
+            self.pool = None
+        return succeeded
+
+    async def _sleep(self, delay):
+        """可被取消的等待, 被取消时返回False"""
+        deadline = time.monotonic() + delay
+        while not self.is_cancelled():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return True
+            await asyncio.sleep(min(remaining, 0.5))
+        return False
+
+    async def _throttle_async(self, nbytes):
+        if self.bandwidth_limiter is not None:
+            delay = self.bandwidth_limiter.reserve(nbytes)
+            if delay > 0:
+                await self._sleep(delay)
+
+    async def _download_file(self, filename, refresh, open_files, disk):
+        """与DownloadEngine.download_file相同: 依次尝试各个下载地址"""
+        if self.is_cancelled():
+            return False
+        self.tracker.file_started(filename)
+        if self.endpoint_selector is None:
+            return await self._download_from_async(filename, refresh, self.endpoint, open_files, disk)
+
+        endpoints = self.endpoint_selector.candidates()
+        for index, endpoint in enumerate(endpoints):
+            try:
+                result = await self._download_from_async(filename, refresh, endpoint, open_files, disk)
+            except Exception as e:
+                if self.is_cancelled():
+                    raise
+                self.endpoint_selector.record_failure(endpoint)
+                if index == len(endpoints) - 1:
+                    raise
+                self.tracker.reset_file(filename)
+                self.tracker.log(f"{filename} 从 {endpoint} 下载失败 ({e}), 改用 {endpoints[index + 1]}")
+                continue
+            if result:
+                self.endpoint_selector.record_success(endpoint)
+            return result
+
+    async def _download_from_async(self, filename, refresh, endpoint, open_files, disk):
+        resume = self.resume_download
+        attempt = 0
+        while True:
+            try:
+                return await self._attempt_async(filename, refresh, endpoint, resume, open_files, disk)
+            except Exception as e:
+                error = classify_error(e)
+                attempt += 1
+                if self.is_cancelled() or not self.retry_policy.should_retry(error, attempt):
+                    if error is e:
+                        raise
+                    raise error from e
+            if not await self._sleep(self._record_retry(filename, error, attempt)):
+                return False
+            self.tracker.reset_file(filename)
+            resume = True
+
+    async def _attempt_async(self, filename, refresh, endpoint, resume, open_files, disk):
+        """下载单个文件一次, 流程与DownloadEngine._attempt_download的单连接部分相同
+
+        创建目录、读取已有数据的哈希和重命名都在磁盘线程中进行, 不阻塞事件循环。
+        """
+        if self.is_cancelled():
+            return False
+        target = os.path.join(self.local_dir, *filename.split("/"))
+        temp_path = target + ".incomplete"
+        loop = asyncio.get_event_loop()
+        complete, offset = await loop.run_in_executor(disk, self._local_state, filename, target, temp_path,
+                                                      refresh, resume)
+        if complete:
+            self.tracker.add_bytes(filename, offset, resumed=True)
+            return True
+        headers = self.get_headers()
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        response = await self.pool.request(self.get_file_url(filename, endpoint), headers)
+        writer = None
+        try:
+            if response.status == 416:
+                await response.discard()
+                if offset and self.holds_whole_file(response, offset):
+                    return await loop.run_in_executor(disk, self._finish_whole_temp, filename, temp_path, target,
+                                                      offset)
+                await loop.run_in_executor(disk, os.remove, temp_path)
+                return await self._attempt_async(filename, refresh, endpoint, resume, open_files, disk)
+            if response.status >= 400:
+                # 读掉错误页, 连接可以继续使用
+                await response.discard()
+                raise http_error(response)
+            if response.status != 206:
+                offset = 0
+            elif offset:
+                self.tracker.add_bytes(filename, offset, resumed=True)
+            content_length = response.headers.get("Content-Length")
+            expected = int(content_length) if content_length is not None else None
+
+            digest = None
+            if filename in self.expected_sha256:
+                if offset:
+                    digest = await loop.run_in_executor(disk, hash_prefix, temp_path, offset)
+                else:
+                    digest = hashlib.sha256()
+            writer = _FileWriter(temp_path, offset, open_files, disk)
+            buffer = bytearray()
+            received = 0
+            while True:
+                chunk = await response.read(self.chunk_size)
+                if not chunk or self.is_cancelled():
+                    break
+                buffer += chunk
+                if digest is not None:
+                    digest.update(chunk)
+                received += len(chunk)
+                self.tracker.add_bytes(filename, len(chunk))
+                await self._throttle_async(len(chunk))
+                if len(buffer) >= self.write_buffer_size:
+                    await writer.write(buffer)
+                    buffer = bytearray()
+            completed = not self.is_cancelled() and (expected is None or received == expected)
+            await writer.write(buffer, finish=True, complete=completed, fsync=self.fsync)
+
+            if self.is_cancelled():
+                self._record_partial(filename, writer.position)
+                return False
+            if not completed:
+                raise TransientError(f"数据传输中断 (IncompleteRead): 接收了{received}字节, 预计{expected}字节")
+            if digest is not None:
+                self._check_sha256(filename, digest.hexdigest(), temp_path)
+        except Exception:
+            if writer is not None:
+                writer.close()
+            if not self.is_cancelled():
+                raise
+            self._record_partial(filename, os.path.getsize(temp_path) if os.path.exists(temp_path) else 0)
+            return False
+        finally:
+            response.release()
+
+        await loop.run_in_executor(disk, os.replace, temp_path, target)
+        return True
+
+    def _local_state(self, filename, target, temp_path, refresh, resume):
+        """在磁盘线程中创建目录并检查本地文件, 返回 (是否已完整, 已有的字节数)
+
+        大小与仓库元数据一致的文件直接跳过, 不必发出请求; 否则返回可续传的临时文件大小。
+        """
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        size = self.file_sizes.get(filename)
+        if not refresh and size is not None and os.path.isfile(target) and os.path.getsize(target) == size:
+            return True, size
+        if resume and os.path.exists(temp_path):
+            return False, os.path.getsize(temp_path)
+        return False, 0
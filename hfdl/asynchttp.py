@@ -0,0 +1,338 @@
+"""asyncio上的最小HTTP/1.1客户端, 供小文件模式 (AsyncDownloadEngine) 使用
+
+只实现下载需要的部分: GET请求、按主机复用的keep-alive连接池、Content-Length和chunked响应体、
+重定向, 以及HTTP代理 (http地址直接转发, https地址通过CONNECT隧道)。
+连接、读取和协议错误都转换为TransientError, 由调用方按RetryPolicy重试。
+"""
+import ssl
+import base64
+import socket
+import asyncio
+import http.client
+from email.parser import Parser
+from urllib.parse import urlsplit, urljoin, unquote
+
+from .errors import DownloadError, TransientError
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+def unsupported_proxy(proxies):
+    """返回不支持的代理地址, 都支持时返回None; 只支持http://形式的代理"""
+    for url in (proxies or {}).values():
+        if urlsplit(url).scheme != "http":
+            return url
+    return None
+
+async def _readline(reader, timeout):
+    try:
+        return await asyncio.wait_for(reader.readline(), timeout)
+    except asyncio.TimeoutError:
+        raise TransientError("网络错误: 读取超时")
+    except ValueError:
+        raise TransientError("网络错误: 响应头过长")
+
+class _Connection:
+    def __init__(self, key, reader, writer):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+
+    def usable(self):
+        return not self.reader.at_eof() and not self.writer.transport.is_closing()
+
+    def abort(self):
+        self.writer.transport.abort()
+
+class AsyncResponse:
+    """一个HTTP响应; 读完响应体或调用release后连接归还连接池"""
+    def __init__(self, pool, connection, version, status, headers, method="GET"):
+        self.pool = pool
+        self.connection = connection
+        self.status = status
+        self.headers = headers
+        self.url = None
+        self.released = False
+        encoding = headers.get("Transfer-Encoding", "").lower()
+        self.chunked = "chunked" in encoding
+        self.chunk_left = 0
+        length = headers.get("Content-Length")
+        self.remaining = int(length) if length is not None and not self.chunked else None
+        if method == "HEAD" or status in (204, 304):
+            self.chunked, self.remaining = False, 0
+        connection_header = headers.get("Connection", "").lower()
+        self.keep_alive = connection_header != "close" and (version == "HTTP/1.1" or connection_header == "keep-alive")
+        if self.remaining is None and not self.chunked:
+            self.keep_alive = False  # 响应体以关闭连接结束
+        self.done = self.remaining == 0
+
+    async def _read(self, size):
+        try:
+            return await asyncio.wait_for(self.connection.reader.read(size), self.pool.read_timeout)
+        except asyncio.TimeoutError:
+            raise TransientError("网络错误: 读取超时")
+
+    async def _readline(self):
+        return await _readline(self.connection.reader, self.pool.read_timeout)
+
+    async def read(self, size=64 * 1024):
+        """读取最多size字节的响应体, 读完时返回b""; 连接中途断开时也返回b"", 由调用方核对长度"""
+        if self.done or self.released:
+            return b""
+        if self.chunked:
+            return await self._read_chunked(size)
+        if self.remaining is None:
+            data = await self._read(size)
+            if not data:
+                self._finish(False)
+            return data
+        data = await self._read(min(size, self.remaining))
+        if not data:
+            self._finish(False)
+            return b""
+        self.remaining -= len(data)
+        if self.remaining == 0:
+            self._finish(self.keep_alive)
+        return data
+
+    async def _read_chunked(self, size):
+        if self.chunk_left == 0:
+            line = await self._readline()
+            try:
+                self.chunk_left = int(line.split(b";", 1)[0].strip(), 16)
+            except ValueError:
+                self._finish(False)
+                if not line:
+                    return b""
+                raise TransientError("网络错误: chunked响应格式错误")
+            if self.chunk_left == 0:
+                # 跳过trailer, 直到空行
+                while True:
+                    line = await self._readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                self._finish(self.keep_alive and line != b"")
+                return b""
+        data = await self._read(min(size, self.chunk_left))
+        if not data:
+            self._finish(False)
+            return b""
+        self.chunk_left -= len(data)
+        if self.chunk_left == 0:
+            await self._readline()  # 分块末尾的CRLF
+        return data
+
+    async def discard(self, limit=1024 * 1024):
+        """读掉不需要的响应体 (重定向、错误页), 超过limit时直接关闭连接"""
+        total = 0
+        while not self.done and not self.released and total < limit:
+            data = await self.read(64 * 1024)
+            if not data:
+                break
+            total += len(data)
+        self.release()
+
+    def _finish(self, reusable):
+        self.done = True
+        self.release(reusable)
+
+    def release(self, reusable=False):
+        """归还连接, 响应体没有读完时关闭连接; 重复调用时只生效一次"""
+        if self.released:
+            return
+        self.released = True
+        self.pool.release(self.connection, reusable and self.done)
+
+class AsyncConnectionPool:
+    """keep-alive连接池, 同时打开的连接不超过max_connections
+
+    必须在事件循环中创建和使用。每个主机 (或代理) 的空闲连接放回池中供后续请求复用,
+    连接数已满时关闭其他主机的空闲连接。proxies格式与HttpSession相同, 只支持http://代理;
+    bypass(主机)返回True的主机不走代理, 一般传入HttpSession.bypasses_proxy。
+    """
+    max_redirects = 10
+
+    def __init__(self, max_connections=16, proxies=None, connect_timeout=10, read_timeout=60, bypass=None):
+        self.max_connections = max(1, int(max_connections))
+        self.proxies = {scheme: urlsplit(url) for scheme, url in (proxies or {}).items() if url}
+        self.bypass = bypass
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.slots = asyncio.Semaphore(self.max_connections)
+        self.idle = {}  # 连接的key -> [空闲连接]
+        self.connections = set()
+        self.ssl_context = ssl.create_default_context()
+        self.closed = False
+
+    async def request(self, url, headers):
+        """发送GET请求并跟随重定向, 返回AsyncResponse; 跨主机重定向时不再发送Authorization"""
+        headers = dict(headers)
+        for _ in range(self.max_redirects + 1):
+            response = await self._send(url, headers)
+            response.url = url
+            location = response.headers.get("Location")
+            if response.status not in REDIRECT_STATUSES or not location:
+                return response
+            await response.discard()
+            next_url = urljoin(url, location)
+            if urlsplit(next_url).netloc != urlsplit(url).netloc:
+                headers.pop("Authorization", None)
+            url = next_url
+        raise DownloadError(f"重定向次数超过 {self.max_redirects} 次")
+
+    async def _send(self, url, headers):
+        parts = urlsplit(url)
+        scheme = parts.scheme or "http"
+        host = parts.hostname
+        port = parts.port or (443 if scheme == "https" else 80)
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        lines = [f"Host: {parts.netloc.rsplit('@', 1)[-1]}", "Accept-Encoding: identity"]
+        proxy = self._proxy(scheme, host)
+        if proxy is not None and scheme == "http":
+            # http地址直接交给代理转发, 请求行使用完整地址, 同一代理的连接可用于所有主机
+            target = f"http://{parts.netloc.rsplit('@', 1)[-1]}{target}"
+            key = ("proxy", proxy.hostname, proxy.port or 80)
+            auth = self._proxy_auth(proxy)
+            if auth:
+                lines.append(f"Proxy-Authorization: {auth}")
+        else:
+            key = (scheme, host, port)
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        data = (f"GET {target} HTTP/1.1\r\n" + "".join(line + "\r\n" for line in lines) + "\r\n").encode("latin-1")
+
+        while True:
+            connection, reused = await self._acquire(key, scheme, host, port)
+            try:
+                connection.writer.write(data)
+                await connection.writer.drain()
+                return await self._read_head(connection)
+            except BaseException as e:
+                self.release(connection, False)
+                # 服务器可能已关闭空闲的keep-alive连接, 换新连接重发一次
+                if reused and isinstance(e, (OSError, TransientError)):
+                    continue
+                if isinstance(e, OSError):
+                    raise TransientError(f"网络错误: {e}") from e
+                raise
+
+    async def _read_head(self, connection):
+        status_line = await _readline(connection.reader, self.read_timeout)
+        if not status_line:
+            raise TransientError("网络错误: 服务器关闭了连接")
+        try:
+            version, status = status_line.decode("latin-1").split(None, 2)[:2]
+            status = int(status)
+        except ValueError:
+            raise TransientError(f"网络错误: 无法识别的响应 {status_line[:40]!r}")
+        lines = []
+        while True:
+            line = await _readline(connection.reader, self.read_timeout)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            lines.append(line)
+        headers = Parser(_class=http.client.HTTPMessage).parsestr(b"".join(lines).decode("latin-1"))
+        return AsyncResponse(self, connection, version, status, headers)
+
+    def _proxy(self, scheme, host):
+        if self.bypass is not None and self.bypass(host):
+            return None
+        return self.proxies.get(scheme)
+
+    @staticmethod
+    def _proxy_auth(proxy):
+        if proxy.username is None:
+            return None
+        credentials = f"{unquote(proxy.username)}:{unquote(proxy.password or '')}"
+        return "Basic " + base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+
+    async def _acquire(self, key, scheme, host, port):
+        """返回 (连接, 是否为复用的空闲连接)"""
+        await self.slots.acquire()
+        idle = self.idle.get(key)
+        while idle:
+            connection = idle.pop()
+            if connection.usable():
+                return connection, True
+            self._close(connection)
+        if len(self.connections) >= self.max_connections:
+            self._close_idle()
+        try:
+            connection = await asyncio.wait_for(self._open(key, scheme, host, port), self.connect_timeout)
+        except BaseException as e:
+            self.slots.release()
+            if isinstance(e, asyncio.TimeoutError):
+                raise TransientError(f"网络错误: 连接 {host}:{port} 超时") from e
+            if isinstance(e, OSError):
+                raise TransientError(f"网络错误: 无法连接 {host}:{port}: {e}") from e
+            raise
+        self.connections.add(connection)
+        return connection, False
+
+    async def _open(self, key, scheme, host, port):
+        proxy = self._proxy(scheme, host)
+        if proxy is None:
+            reader, writer = await asyncio.open_connection(
+                host, port, ssl=self.ssl_context if scheme == "https" else None)
+        elif scheme == "http":
+            reader, writer = await asyncio.open_connection(proxy.hostname, proxy.port or 80)
+        else:
+            sock = await self._tunnel(proxy, host, port)
+            reader, writer = await asyncio.open_connection(sock=sock, ssl=self.ssl_context, server_hostname=host)
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        return _Connection(key, reader, writer)
+
+    async def _tunnel(self, proxy, host, port):
+        """通过HTTP代理的CONNECT建立到host:port的隧道, 返回已连接的socket"""
+        loop = asyncio.get_event_loop()
+        infos = await loop.getaddrinfo(proxy.hostname, proxy.port or 80, type=socket.SOCK_STREAM)
+        family, type_, proto, _, address = infos[0]
+        sock = socket.socket(family, type_, proto)
+        try:
+            sock.setblocking(False)
+            await loop.sock_connect(sock, address)
+            request = f"CONNECT {host}:{port} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+            auth = self._proxy_auth(proxy)
+            if auth:
+                request += f"Proxy-Authorization: {auth}\r\n"
+            await loop.sock_sendall(sock, (request + "\r\n").encode("latin-1"))
+            head = b""
+            while b"\r\n\r\n" not in head:
+                data = await loop.sock_recv(sock, 4096)
+                if not data or len(head) > 65536:
+                    raise TransientError("网络错误: 代理关闭了连接")
+                head += data
+            status_line = head.split(b"\r\n", 1)[0].decode("latin-1")
+            if len(status_line.split()) < 2 or status_line.split()[1] != "200":
+                raise DownloadError(f"代理拒绝建立隧道: {status_line}")
+            return sock
+        except BaseException:
+            sock.close()
+            raise
+
+    def release(self, connection, reusable):
+        if reusable and not self.closed and connection.usable():
+            self.idle.setdefault(connection.key, []).append(connection)
+        else:
+            self._close(connection)
+        self.slots.release()
+
+    def _close(self, connection):
+        self.connections.discard(connection)
+        connection.abort()
+
+    def _close_idle(self):
+        for connections in self.idle.values():
+            if connections:
+                self._close(connections.pop(0))
+                return
+
+    def abort(self):
+        """立即关闭所有连接, 正在读取的请求会收到连接断开"""
+        for connection in list(self.connections):
+            self._close(connection)
+        self.idle.clear()
+
+    def close(self):
+        self.closed = True
+        self.abort()
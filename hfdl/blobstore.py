@@ -0,0 +1,118 @@
+"""按LFS sha256寻址的本地内容存储, 用于跨仓库复用相同文件"""
+import os
+import shutil
+import threading
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from .constants import DEFAULT_BLOB_STORE
+from .verify import hash_file
+
+FICLONE = 0x40049409  # Linux的ioctl(FICLONE), btrfs/xfs等文件系统支持写时复制
+
+def reflink(src, dst):
+    """写时复制地克隆文件, 文件系统不支持时抛出OSError"""
+    if fcntl is None:
+        raise OSError("当前平台不支持reflink")
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+
+class BlobStore:
+    """内容寻址存储: <root>/sha256/<前两位>/<sha256>
+
+    下载完成的LFS文件以sha256为键加入存储, 之后任何仓库中sha256相同的文件
+    都直接从存储中硬链接、reflink或符号链接到local_dir, 不再重复下载。
+    硬链接与local_dir中的文件共用数据, 修改其中一个会影响另一个。
+    """
+    def __init__(self, root=DEFAULT_BLOB_STORE):
+        self.root = root
+        self.lock = threading.Lock()
+
+    def blob_path(self, sha256):
+        return os.path.join(self.root, "sha256", sha256[:2], sha256)
+
+    def has(self, sha256, size=None):
+        """存储中是否有该文件, 给出size时同时检查大小"""
+        try:
+            actual = os.path.getsize(self.blob_path(sha256))
+        except OSError:
+            return False
+        return size is None or actual == size
+
+    def _temp_path(self, path):
+        return f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+
+    def _link(self, src, dst, modes):
+        """按modes的顺序尝试把src放到dst, 返回实际使用的方式"""
+        errors = []
+        for mode in modes:
+            try:
+                if mode == "hardlink":
+                    os.link(src, dst)
+                elif mode == "reflink":
+                    reflink(src, dst)
+                elif mode == "symlink":
+                    try:
+                        os.symlink(os.path.relpath(src, os.path.dirname(dst)), dst)
+                    except ValueError:  # Windows下不在同一个盘符
+                        os.symlink(os.path.abspath(src), dst)
+                else:
+                    shutil.copyfile(src, dst)
+                return mode
+            except OSError as e:
+                errors.append(f"{mode}: {e}")
+        raise OSError("; ".join(errors))
+
+    def link_modes(self, use_symlinks=False):
+        """从存储取出文件时依次尝试的方式, 都失败时退回复制"""
+        if use_symlinks:
+            return ("symlink", "hardlink", "reflink", "copy")
+        return ("hardlink", "reflink", "copy")
+
+    def materialize(self, sha256, target, use_symlinks=False):
+        """把存储中的文件放到target, 返回使用的方式 (hardlink/reflink/symlink/copy)"""
+        blob = self.blob_path(sha256)
+        if os.path.exists(target) and os.path.samefile(blob, target):
+            return "existing"
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp_path = self._temp_path(target)
+        mode = self._link(blob, temp_path, self.link_modes(use_symlinks))
+        os.replace(temp_path, target)
+        return mode
+
+    def ingest(self, path, sha256, use_symlinks=False, verified=False):
+        """把下载完成的文件加入存储
+
+        path已经是存储中的文件时直接返回"existing"。
+        先校验sha256 (下载时已校验过的文件传入verified=True跳过),
+        不一致或path是指向别处的符号链接时返回None而不加入存储。符号链接模式下文件移入存储,
+        原位置换成指向它的符号链接; 否则用硬链接 (或reflink/复制) 在存储中保留一份。
+        存储中已有该文件时, 把path替换为存储中的文件以节省磁盘空间。
+        """
+        blob = self.blob_path(sha256)
+        if os.path.exists(blob) and os.path.samefile(blob, path):
+            return "existing"
+        if os.path.islink(path) or (not verified and hash_file(path) != sha256):
+            return None
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        with self.lock:
+            if self.has(sha256, os.path.getsize(path)):
+                return self.materialize(sha256, path, use_symlinks)
+            if use_symlinks:
+                temp_path = self._temp_path(blob)
+                shutil.move(path, temp_path)
+                os.replace(temp_path, blob)
+                return self.materialize(sha256, path, use_symlinks=True)
+            temp_path = self._temp_path(blob)
+            mode = self._link(path, temp_path, ("hardlink", "reflink", "copy"))
+            os.replace(temp_path, blob)
+            return mode
@@ -0,0 +1,564 @@
+"""命令行入口
+
+    python -m hfdl <仓库ID> [选项]          下载单个仓库
+    python -m hfdl queue <add|list|remove|priority|retry|clear|run> ...  管理和运行下载队列
+    python -m hfdl verify <目录> [--repo-id 仓库ID]  校验已下载的文件
+    python -m hfdl serve <目录>... [--port 端口]    向局域网中的其他节点提供已下载的文件
+
+参数与GUI中的输入项一一对应。使用 --json 时, 每个事件以一行JSON输出到stdout, 便于脚本解析。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from datetime import datetime
+
+from . import __version__
+from .blobstore import BlobStore
+from .constants import (DEFAULT_ENDPOINT, DEFAULT_REVISION, DEFAULT_REPO_TYPE, REPO_TYPES, DEFAULT_MAX_WORKERS,
+                        DEFAULT_SEGMENTS, DEFAULT_BLOB_STORE)
+from .errors import RetryPolicy
+from .job import DownloadJob, VerifyJob, format_preview
+from .metadata import MetadataCache, DEFAULT_METADATA_TTL
+from .metrics import MetricsLog, MetricsServer
+from .peers import PeerCatalog, PeerNetwork, PeerServer, DEFAULT_PEER_PORT, DEFAULT_DISCOVERY_PORT, DEFAULT_BROADCAST
+from .jobqueue import (DownloadQueue, DEFAULT_QUEUE_FILE, DEFAULT_MAX_CONNECTIONS,
+                       DEFAULT_PER_JOB_CONNECTIONS, DEFAULT_MAX_ACTIVE_JOBS)
+from .ratelimit import BandwidthLimiter, BandwidthSchedule
+from .tensors import format_tensor_index
+from .tracker import DownloadTracker, format_progress
+from .utils import parse_patterns, parse_size, make_proxies, format_size
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_CANCELLED = 130
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="hfdl",
+        description="从HuggingFace Hub下载模型仓库 (无图形界面)",
+    )
+    parser.add_argument("repo_id", help="仓库ID, 例如 Systran/faster-whisper-large-v2")
+    parser.add_argument("-d", "--local-dir", help="保存位置, 默认为 ./<仓库名>")
+    parser.add_argument("--repo-type", choices=REPO_TYPES, default=DEFAULT_REPO_TYPE,
+                        help="仓库类型: 模型、数据集或Space (默认: %(default)s)")
+    parser.add_argument("--revision", default=DEFAULT_REVISION, help="分支、标签或提交 (默认: %(default)s)")
+    parser.add_argument("--endpoint", default=os.environ.get("HF_ENDPOINT", DEFAULT_ENDPOINT),
+                        help="Hub地址 (默认: HF_ENDPOINT 或 %(default)s)")
+    parser.add_argument("--mirror", action="append", default=[], metavar="URL",
+                        help="备用的Hub地址或镜像, 可重复指定; 开始时测速, 文件从最快的地址下载并在失败时切换")
+    parser.add_argument("--proxy", help="同时设置HTTP和HTTPS代理")
+    parser.add_argument("--http-proxy", help="HTTP代理")
+    parser.add_argument("--https-proxy", help="HTTPS代理")
+    parser.add_argument("--ignore-patterns", default="", help="忽略文件模式, 逗号分隔, 例如: *.safetensors,*.pt,*.bin")
+    parser.add_argument("--allow-patterns", default="", help="只下载匹配的文件, 逗号分隔, 例如: *.json,onnx/")
+    parser.add_argument("--token", default=None, help="HF Token (默认读取 HF_TOKEN 环境变量)")
+    parser.add_argument("--use-symlinks", action="store_true", help="使用符号链接")
+    parser.add_argument("--blob-store", nargs="?", const=DEFAULT_BLOB_STORE, default=None, metavar="DIR",
+                        help=f"启用跨仓库去重的本地内容存储 (默认目录: {DEFAULT_BLOB_STORE})")
+    parser.add_argument("--no-resume", dest="resume_download", action="store_false", help="关闭断点续传")
+    parser.add_argument("--prune", action="store_true", help="删除远程仓库中已不存在的本地文件 (依据上次下载的清单)")
+    parser.add_argument("--max-workers", type=int, default=DEFAULT_MAX_WORKERS, help="并发下载的文件数 (默认: %(default)s)")
+    parser.add_argument("--segments", type=int, default=DEFAULT_SEGMENTS,
+                        help="大文件的分段连接数, 1 表示不分段 (默认: %(default)s)")
+    add_bandwidth_arguments(parser)
+    add_metrics_arguments(parser)
+    add_peer_arguments(parser)
+    parser.add_argument("--adaptive", action="store_true",
+                        help="根据实测吞吐和错误率自动调整连接数和分段数, --max-workers/--segments 作为初始值")
+    parser.add_argument("--retries", type=int, default=RetryPolicy().attempts - 1,
+                        help="网络中断、5xx、429等错误时每个文件或分段的最多重试次数 (默认: %(default)s)")
+    parser.add_argument("--transfer-mode", choices=("auto", "threads", "async"), default="auto",
+                        help="threads: 线程池; async: 小文件用asyncio同时发出数百个请求; "
+                             "auto: 文件大小中位数低于1MB时使用async (默认: %(default)s)")
+    parser.add_argument("--tensors", default="", metavar="PATTERNS",
+                        help="safetensors分片只下载匹配的张量, 张量名或通配符, 逗号分隔, 例如: model.embed_tokens.*,lm_head.weight")
+    parser.add_argument("--list-tensors", action="store_true",
+                        help="只读取safetensors分片的头部, 列出每个张量的dtype、shape、大小和所在分片, 不下载")
+    parser.add_argument("--extract", dest="extract_archives", action="store_true",
+                        help="tar、tar.gz、tar.bz2、tar.xz和zip归档边下载边解压到去掉扩展名的同名目录")
+    parser.add_argument("--no-keep-archives", dest="keep_archives", action="store_false",
+                        help="与 --extract 一起使用: 解压后不在磁盘上保留归档文件")
+    parser.add_argument("--preview", action="store_true",
+                        help="只显示过滤后的文件数、总大小和可用空间, 不下载")
+    parser.add_argument("--metadata-ttl", type=float, default=DEFAULT_METADATA_TTL, metavar="SECONDS",
+                        help="仓库信息缓存的有效期, 过期后向服务器确认, 0 表示每次都确认 (默认: %(default)s)")
+    parser.add_argument("--json", action="store_true", help="以JSON Lines格式输出进度事件")
+    parser.add_argument("--progress-interval", type=float, default=1.0, help="进度输出间隔(秒) (默认: %(default)s)")
+    parser.add_argument("--version", action="version", version=f"%(prog)s {__version__}")
+    return parser
+
+def add_bandwidth_arguments(parser):
+    parser.add_argument("--limit-rate", type=parse_size, default=None, metavar="RATE",
+                        help="全局带宽上限 (每秒字节数), 例如 200M")
+    parser.add_argument("--schedule", type=BandwidthSchedule.parse, default=None,
+                        help="按时段限速, 例如 \"08:00-20:00=200M,20:00-08:00=0\" (0为不限速)")
+
+def build_bandwidth_limiter(args, printer):
+    """根据 --limit-rate 和 --schedule 创建限速器, 都没有指定时返回None"""
+    if not args.limit_rate and args.schedule is None:
+        return None
+    limiter = BandwidthLimiter(args.limit_rate, args.schedule)
+    limiter.listener = lambda message: printer("log", {"message": message})
+    return limiter
+
+def add_metrics_arguments(parser):
+    parser.add_argument("--metrics-file", default=None, metavar="PATH",
+                        help="把每个文件的指标 (排队等待、首字节时间、字节数、速度、重试、结果) 以JSON Lines追加到该文件")
+    parser.add_argument("--metrics-port", type=int, default=None, metavar="PORT",
+                        help="在 http://127.0.0.1:PORT/metrics 提供Prometheus格式的指标")
+
+def start_metrics(args, printer):
+    """根据 --metrics-file 和 --metrics-port 创建 (MetricsLog, MetricsServer), 未指定的为None"""
+    metrics_log = MetricsLog(args.metrics_file) if args.metrics_file else None
+    metrics_server = None
+    if args.metrics_port is not None:
+        metrics_server = MetricsServer(args.metrics_port)
+        try:
+            url = metrics_server.start()
+        except OSError as e:
+            printer("error", {"error": str(e), "message": f"无法启动指标服务: {e}"})
+            metrics_server = None
+        else:
+            printer("log", {"message": f"Prometheus指标: {url}"})
+    return metrics_log, metrics_server
+
+def stop_metrics(metrics_log, metrics_server):
+    if metrics_log is not None:
+        metrics_log.close()
+    if metrics_server is not None:
+        metrics_server.stop()
+
+def add_discovery_arguments(parser):
+    parser.add_argument("--discovery-port", type=int, default=DEFAULT_DISCOVERY_PORT, metavar="PORT",
+                        help="节点广播和查询使用的UDP端口 (默认: %(default)s)")
+    parser.add_argument("--broadcast", default=DEFAULT_BROADCAST, metavar="ADDR",
+                        help="广播地址, 受限广播不能到达时改为子网的定向广播地址, 例如 10.0.255.255 (默认: %(default)s)")
+
+def add_peer_arguments(parser):
+    parser.add_argument("--peer", action="append", default=[], metavar="URL",
+                        help="局域网节点地址, 例如 http://10.0.0.5:48760, 可重复指定; LFS文件先从节点获取, 失败时从Hub下载")
+    parser.add_argument("--discover-peers", action="store_true",
+                        help="通过局域网广播自动发现运行 --serve-peers 或 hfdl serve 的节点")
+    parser.add_argument("--serve-peers", type=int, nargs="?", const=DEFAULT_PEER_PORT, default=None, metavar="PORT",
+                        help=f"下载期间在该端口向局域网提供本任务已下载的LFS文件并广播 (默认端口: {DEFAULT_PEER_PORT})")
+    add_discovery_arguments(parser)
+
+def start_peers(args, printer, blob_store=None):
+    """根据 --peer、--discover-peers 和 --serve-peers 创建 (PeerNetwork, PeerServer), 未启用的为None"""
+    def log(message):
+        printer("log", {"message": message})
+
+    peer_server = None
+    if args.serve_peers is not None:
+        peer_server = PeerServer(PeerCatalog(blob_store), port=args.serve_peers, discovery_port=args.discovery_port,
+                                 broadcast=args.broadcast)
+        try:
+            log(f"向局域网提供已下载的LFS文件: {peer_server.start()}")
+        except OSError as e:
+            printer("error", {"error": str(e), "message": f"无法启动局域网共享服务: {e}"})
+            peer_server = None
+    peers = None
+    if args.peer or args.discover_peers:
+        peers = PeerNetwork(args.peer, discover=args.discover_peers, discovery_port=args.discovery_port,
+                            broadcast=args.broadcast)
+        peers.listener = log
+        if peer_server is not None:
+            peers.ignore(peer_server.node_id)
+        try:
+            peers.start()
+        except OSError as e:
+            log(f"无法监听局域网广播 (UDP {args.discovery_port}): {e}, 只使用 --peer 指定的节点")
+    return peers, peer_server
+
+def stop_peers(peers, peer_server):
+    if peers is not None:
+        peers.stop()
+    if peer_server is not None:
+        peer_server.stop()
+
+class EventPrinter:
+    """把DownloadTracker事件输出到终端: JSON模式写stdout, 普通模式把日志写stderr"""
+    def __init__(self, json_mode=False, stream=None):
+        self.json_mode = json_mode
+        self.stream = stream or (sys.stdout if json_mode else sys.stderr)
+        self.lock = threading.Lock()
+
+    def __call__(self, event, data):
+        if self.json_mode:
+            record = {"event": event, "time": time.time()}
+            record.update(data)
+            line = json.dumps(record, ensure_ascii=False)
+        elif event == "progress":
+            line = format_progress(data, max_files=0)
+        elif "message" in data:
+            timestamp = datetime.now().strftime("%H:%M:%S")
+            line = f"[{timestamp}] {data['message']}"
+        else:
+            return
+        with self.lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+def build_queue_parser():
+    parser = argparse.ArgumentParser(prog="hfdl queue", description="管理和运行多仓库下载队列")
+    parser.add_argument("--queue-file", default=DEFAULT_QUEUE_FILE, help="队列文件 (默认: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="加入一个仓库")
+    add.add_argument("repo_id")
+    add.add_argument("-d", "--local-dir", help="保存位置, 默认为 ./<仓库名>")
+    add.add_argument("--ignore-patterns", default="", help="忽略文件模式, 逗号分隔")
+    add.add_argument("--allow-patterns", default="", help="只下载匹配的文件, 逗号分隔")
+    add.add_argument("--repo-type", choices=REPO_TYPES, default=DEFAULT_REPO_TYPE, help="仓库类型 (默认: %(default)s)")
+    add.add_argument("--revision", default=DEFAULT_REVISION)
+    add.add_argument("--priority", type=int, default=0, help="优先级, 数值越大越先下载 (默认: %(default)s)")
+    add.add_argument("--max-connections", type=int, default=None, help="该仓库的最大连接数")
+
+    commands.add_parser("list", help="列出队列")
+    remove = commands.add_parser("remove", help="移除条目")
+    remove.add_argument("entry_id")
+    priority = commands.add_parser("priority", help="修改优先级")
+    priority.add_argument("entry_id")
+    priority.add_argument("priority", type=int)
+    retry = commands.add_parser("retry", help="重新排队失败或已取消的条目")
+    retry.add_argument("entry_id")
+    commands.add_parser("clear", help="移除已完成的条目")
+
+    run = commands.add_parser("run", help="处理队列直到全部完成")
+    run.add_argument("--endpoint", default=os.environ.get("HF_ENDPOINT", DEFAULT_ENDPOINT))
+    run.add_argument("--mirror", action="append", default=[], metavar="URL", help="备用的Hub地址或镜像, 可重复指定")
+    run.add_argument("--proxy", help="同时设置HTTP和HTTPS代理")
+    run.add_argument("--token", default=None, help="HF Token (默认读取 HF_TOKEN 环境变量)")
+    run.add_argument("--no-resume", dest="resume_download", action="store_false", help="关闭断点续传")
+    run.add_argument("--max-connections", type=int, default=DEFAULT_MAX_CONNECTIONS,
+                     help="所有仓库合计的最大连接数 (默认: %(default)s)")
+    run.add_argument("--per-repo-connections", type=int, default=DEFAULT_PER_JOB_CONNECTIONS,
+                     help="单个仓库的最大连接数 (默认: %(default)s)")
+    run.add_argument("--max-active-jobs", type=int, default=DEFAULT_MAX_ACTIVE_JOBS,
+                     help="同时下载的仓库数 (默认: %(default)s)")
+    run.add_argument("--segments", type=int, default=DEFAULT_SEGMENTS)
+    run.add_argument("--retries", type=int, default=RetryPolicy().attempts - 1,
+                     help="每个文件或分段的最多重试次数 (默认: %(default)s)")
+    run.add_argument("--use-symlinks", action="store_true", help="使用符号链接")
+    run.add_argument("--adaptive", action="store_true", help="每个仓库根据实测吞吐自动调整连接数")
+    add_bandwidth_arguments(run)
+    add_metrics_arguments(run)
+    add_peer_arguments(run)
+    run.add_argument("--blob-store", nargs="?", const=DEFAULT_BLOB_STORE, default=None, metavar="DIR",
+                     help="启用跨仓库去重的本地内容存储")
+    run.add_argument("--json", action="store_true", help="以JSON Lines格式输出事件")
+    run.add_argument("--progress-interval", type=float, default=5.0, help="进度输出间隔(秒) (默认: %(default)s)")
+    return parser
+
+def queue_main(argv):
+    args = build_queue_parser().parse_args(argv)
+    download_queue = DownloadQueue(args.queue_file)
+
+    if args.command == "add":
+        entry = download_queue.add(args.repo_id.strip(), args.local_dir, parse_patterns(args.ignore_patterns),
+                                   revision=args.revision, repo_type=args.repo_type, priority=args.priority,
+                                   max_connections=args.max_connections,
+                                   allow_patterns=parse_patterns(args.allow_patterns))
+        print(entry["id"])
+        return EXIT_OK
+    if args.command == "list":
+        for entry in download_queue.snapshot():
+            print(f"{entry['id']}  {entry['status']:<9}  优先级 {entry['priority']:>3}  "
+                  f"{entry['repo_id']} -> {entry['local_dir']}" + (f"  ({entry['error']})" if entry["error"] else ""))
+        return EXIT_OK
+    try:
+        if args.command == "remove":
+            download_queue.get(args.entry_id)
+            download_queue.remove(args.entry_id)
+        elif args.command == "priority":
+            download_queue.set_priority(args.entry_id, args.priority)
+        elif args.command == "retry":
+            download_queue.retry(args.entry_id)
+    except KeyError:
+        print(f"队列中没有条目: {args.entry_id}", file=sys.stderr)
+        return EXIT_FAILED
+    if args.command == "clear":
+        download_queue.clear_finished()
+    if args.command != "run":
+        return EXIT_OK
+
+    printer = EventPrinter(json_mode=args.json)
+
+    def on_event(entry_id, event, data):
+        if event == "progress" and not args.json:
+            return
+        if args.json:
+            printer(event, dict(data, entry_id=entry_id))
+        elif "message" in data:
+            printer(event, {"message": f"[{entry_id}] {data['message']}"})
+
+    download_queue.listener = on_event
+    download_queue.token = args.token or os.environ.get("HF_TOKEN")
+    download_queue.per_job_connections = max(1, args.per_repo_connections)
+    download_queue.max_active_jobs = max(1, args.max_active_jobs)
+    download_queue.segments = max(1, args.segments)
+    download_queue.resume_download = args.resume_download
+    download_queue.limiter.set_max_connections(args.max_connections)
+    download_queue.job_options = {
+        "endpoint": args.endpoint.rstrip("/"),
+        "mirrors": args.mirror,
+        "use_symlinks": args.use_symlinks,
+        "blob_store": BlobStore(args.blob_store) if args.blob_store else None,
+        "adaptive": args.adaptive,
+        "bandwidth_limiter": build_bandwidth_limiter(args, printer),
+        # 没有指定代理时沿用环境变量
+        "proxies": make_proxies(args.proxy, args.proxy) if args.proxy else None,
+        "metadata_cache": MetadataCache(),
+        "retry_policy": RetryPolicy(attempts=max(0, args.retries) + 1),
+    }
+    metrics_log, metrics_server = start_metrics(args, printer)
+    download_queue.job_options.update(metrics_log=metrics_log, metrics_server=metrics_server)
+    peers, peer_server = start_peers(args, printer, download_queue.job_options["blob_store"])
+    download_queue.job_options.update(peers=peers, peer_server=peer_server)
+    download_queue.start()
+
+    next_progress = time.time() + args.progress_interval
+    while True:
+        try:
+            if download_queue.wait(0.2):
+                break
+            if time.time() >= next_progress:
+                for entry_id, stats in download_queue.poll_progress().items():
+                    if stats and not args.json:
+                        printer("log", {"message": f"[{entry_id}] {format_progress(stats, max_files=0)}"})
+                next_progress = time.time() + args.progress_interval
+        except KeyboardInterrupt:
+            if not download_queue.running:
+                break  # 第二次Ctrl+C: 不再等待
+            printer("log", {"message": "停止队列, 正在下载的仓库下次运行时续传..."})
+            download_queue.stop()
+
+    stop_metrics(metrics_log, metrics_server)
+    stop_peers(peers, peer_server)
+    entries = download_queue.snapshot()
+    if any(entry["status"] == "pending" for entry in entries):
+        return EXIT_CANCELLED
+    return EXIT_FAILED if any(entry["status"] == "failed" for entry in entries) else EXIT_OK
+
+def build_verify_parser():
+    parser = argparse.ArgumentParser(prog="hfdl verify", description="校验已下载目录中的文件哈希")
+    parser.add_argument("local_dir", help="要校验的目录")
+    parser.add_argument("--repo-id", help="对比该仓库的元数据, 默认使用目录中的下载清单")
+    parser.add_argument("--repo-type", choices=REPO_TYPES, default=DEFAULT_REPO_TYPE, help="仓库类型 (默认: %(default)s)")
+    parser.add_argument("--revision", default=DEFAULT_REVISION)
+    parser.add_argument("--endpoint", default=os.environ.get("HF_ENDPOINT", DEFAULT_ENDPOINT))
+    parser.add_argument("--token", default=None, help="HF Token (默认读取 HF_TOKEN 环境变量)")
+    parser.add_argument("--proxy", help="获取仓库元数据时使用的代理")
+    parser.add_argument("--processes", type=int, default=None, help="校验进程数 (默认: CPU核数)")
+    parser.add_argument("--json", action="store_true", help="以JSON Lines格式输出事件")
+    return parser
+
+def verify_main(argv):
+    args = build_verify_parser().parse_args(argv)
+    printer = EventPrinter(json_mode=args.json)
+    tracker = DownloadTracker(listener=printer)
+    job = VerifyJob(args.local_dir, tracker, repo_id=args.repo_id, repo_type=args.repo_type, token=args.token,
+                    revision=args.revision, endpoint=args.endpoint.rstrip("/"), processes=args.processes,
+                    proxies=make_proxies(args.proxy, args.proxy) if args.proxy else None)
+    try:
+        failed = job.run()
+    except KeyboardInterrupt:
+        return EXIT_CANCELLED
+    except Exception as e:
+        printer("error", {"error": str(e), "message": f"校验失败: {e}"})
+        return EXIT_FAILED
+    if args.json:
+        printer("summary", {"local_dir": os.path.abspath(args.local_dir), "verified_files": tracker.verified_files,
+                            "failed_files": tracker.failed_files_info, "text": tracker.get_summary()})
+    else:
+        printer("summary", {"message": tracker.get_summary()})
+    return EXIT_FAILED if failed else EXIT_OK
+
+def build_serve_parser():
+    parser = argparse.ArgumentParser(prog="hfdl serve",
+                                     description="向局域网中的其他节点提供已下载目录中的LFS文件, 直到按下Ctrl+C")
+    parser.add_argument("local_dir", nargs="+", help="hfdl下载的目录 (按其中的下载清单提供文件)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PEER_PORT, help="HTTP端口 (默认: %(default)s)")
+    parser.add_argument("--host", default="0.0.0.0", help="监听地址 (默认: 所有网卡)")
+    parser.add_argument("--blob-store", nargs="?", const=DEFAULT_BLOB_STORE, default=None, metavar="DIR",
+                        help="同时提供本地内容存储中的文件")
+    parser.add_argument("--no-announce", dest="announce", action="store_false",
+                        help="不广播, 其他节点需要用 --peer 指定本节点的地址")
+    add_discovery_arguments(parser)
+    parser.add_argument("--json", action="store_true", help="以JSON Lines格式输出事件")
+    parser.add_argument("--progress-interval", type=float, default=10.0,
+                        help="输出已发送字节数的间隔(秒) (默认: %(default)s)")
+    return parser
+
+def serve_main(argv):
+    args = build_serve_parser().parse_args(argv)
+    printer = EventPrinter(json_mode=args.json)
+    catalog = PeerCatalog(BlobStore(args.blob_store) if args.blob_store else None)
+    for local_dir in args.local_dir:
+        count = catalog.add_directory(local_dir)
+        if not count:
+            printer("log", {"message": f"{local_dir} 中没有下载清单, 跳过"})
+            continue
+        printer("log", {"message": f"提供 {local_dir} 中的 {count} 个文件"})
+    server = PeerServer(catalog, port=args.port, host=args.host, announce=args.announce,
+                        discovery_port=args.discovery_port, broadcast=args.broadcast)
+    try:
+        url = server.start()
+    except OSError as e:
+        printer("error", {"error": str(e), "message": f"无法启动局域网共享服务: {e}"})
+        return EXIT_FAILED
+    printer("serving", {"url": url, "message": f"局域网共享服务: {url}"
+                        + (f", 每 {server.announce_interval:.0f} 秒广播一次" if args.announce else "")})
+    reported = 0
+    try:
+        while True:
+            time.sleep(args.progress_interval)
+            if server.uploaded_bytes != reported:
+                reported = server.uploaded_bytes
+                printer("uploaded", {"bytes": reported, "message": f"已发送给其他节点: {format_size(reported)}"})
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    return EXIT_OK
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == "queue":
+        return queue_main(argv[1:])
+    if argv and argv[0] == "verify":
+        return verify_main(argv[1:])
+    if argv and argv[0] == "serve":
+        return serve_main(argv[1:])
+    args = build_parser().parse_args(argv)
+
+    repo_id = args.repo_id.strip()
+    local_dir = args.local_dir or os.path.join(".", repo_id.split('/')[-1])
+    proxies = None  # 没有指定代理时沿用环境变量
+    if args.proxy or args.http_proxy or args.https_proxy:
+        proxies = make_proxies(args.http_proxy or args.proxy, args.https_proxy or args.proxy)
+
+    printer = EventPrinter(json_mode=args.json)
+    tracker = DownloadTracker(listener=printer)
+    listing = args.preview or args.list_tensors
+    metrics_log, metrics_server = (None, None) if listing else start_metrics(args, printer)
+    blob_store = BlobStore(args.blob_store) if args.blob_store else None
+    peers, peer_server = (None, None) if listing else start_peers(args, printer, blob_store)
+    job = DownloadJob(
+        repo_id, local_dir, tracker,
+        token=args.token,
+        ignore_patterns=parse_patterns(args.ignore_patterns),
+        allow_patterns=parse_patterns(args.allow_patterns),
+        revision=args.revision,
+        repo_type=args.repo_type,
+        endpoint=args.endpoint.rstrip("/"),
+        max_workers=max(1, args.max_workers),
+        segments=max(1, args.segments),
+        resume_download=args.resume_download,
+        use_symlinks=args.use_symlinks,
+        blob_store=blob_store,
+        prune=args.prune,
+        adaptive=args.adaptive,
+        bandwidth_limiter=build_bandwidth_limiter(args, printer),
+        mirrors=args.mirror,
+        proxies=proxies,
+        metadata_cache=MetadataCache(ttl=args.metadata_ttl),
+        retry_policy=RetryPolicy(attempts=max(0, args.retries) + 1),
+        metrics_log=metrics_log,
+        metrics_server=metrics_server,
+        transfer_mode=args.transfer_mode,
+        tensors=parse_patterns(args.tensors),
+        extract_archives=args.extract_archives,
+        keep_archives=args.keep_archives,
+        peers=peers,
+        peer_server=peer_server,
+    )
+
+    if args.preview:
+        try:
+            preview = job.preview()
+        except Exception as e:
+            printer("error", {"error": str(e), "message": f"获取仓库信息失败: {e}"})
+            return EXIT_FAILED
+        if args.json:
+            printer("preview", dict(preview, repo_id=repo_id, local_dir=os.path.abspath(local_dir)))
+        else:
+            print(format_preview(preview))
+        return EXIT_OK
+
+    if args.list_tensors:
+        try:
+            index = job.tensor_index()
+        except Exception as e:
+            printer("error", {"error": str(e), "message": f"读取张量索引失败: {e}"})
+            return EXIT_FAILED
+        if args.json:
+            for shard, info in sorted(index.shards.items()):
+                for name, (dtype, shape, start, end) in sorted(info["tensors"].items()):
+                    printer("tensor", {"name": name, "dtype": dtype, "shape": shape, "bytes": end - start,
+                                       "file": shard})
+        else:
+            print(format_tensor_index(index))
+        return EXIT_OK
+
+    # 在后台线程中下载, 主线程负责输出进度和响应Ctrl+C
+    error = []
+    def target():
+        try:
+            job.run()
+        except Exception as e:
+            error.append(e)
+            tracker.emit("error", error=str(e), message=f"下载失败: {e}")
+    thread = threading.Thread(target=target, name="hf-job", daemon=True)
+    thread.start()
+
+    next_progress = time.time() + args.progress_interval
+    while thread.is_alive():
+        try:
+            thread.join(0.1)
+            if time.time() >= next_progress and tracker.running:
+                tracker.update_speed()
+                next_progress = time.time() + args.progress_interval
+        except KeyboardInterrupt:
+            if job.cancelled:
+                break  # 第二次Ctrl+C: 不再等待
+            tracker.log("用户请求取消下载...")
+            job.cancel()
+
+    stop_metrics(metrics_log, metrics_server)
+    stop_peers(peers, peer_server)
+    summary = tracker.get_summary()
+    if args.json:
+        printer("summary", {
+            "repo_id": repo_id,
+            "repo_type": args.repo_type,
+            "local_dir": os.path.abspath(local_dir),
+            "downloaded_files": tracker.downloaded_files,
+            "failed_files": tracker.failed_files_info,
+            "failed_kinds": tracker.failed_files_kind,
+            "retries": tracker.retries,
+            "resumable_files": tracker.resumable_files,
+            "done_bytes": tracker.total_bytes,
+            "transferred_bytes": tracker.transferred_bytes,
+            "deduplicated_bytes": tracker.deduplicated_bytes,
+            "peer_bytes": tracker.peer_bytes,
+            "unchanged_files": tracker.unchanged_files,
+            "deleted_remote_files": job.deleted_files,
+            "cancelled": job.cancelled,
+            "text": summary,
+        })
+    else:
+        printer("summary", {"message": summary})
+
+    if job.cancelled:
+        return EXIT_CANCELLED
+    if error or tracker.failed_files:
+        return EXIT_FAILED
+    return EXIT_OK
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,17 @@
+"""下载器的默认配置"""
+import os
+
+DEFAULT_ENDPOINT = "https://huggingface.co"
+DEFAULT_REVISION = "main"
+DEFAULT_REPO_TYPE = "model"
+REPO_TYPES = ("model", "dataset", "space")
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_SEGMENTS = 4
+DEFAULT_SEGMENT_THRESHOLD = 64 * 1024 * 1024  # 超过该大小的文件才分段下载
+DEFAULT_ASYNC_MEDIAN_THRESHOLD = 1024 * 1024  # 文件大小的中位数低于该值时自动使用小文件模式
+DEFAULT_ASYNC_FILE_LIMIT = 8 * 1024 * 1024  # 小文件模式中不超过该大小的文件用asyncio下载, 其余用多线程
+DEFAULT_ASYNC_MAX_REQUESTS = 256  # 小文件模式同时进行的文件数
+DEFAULT_CANCEL_TIMEOUT = 10  # 取消后等待工作线程退出的最长时间(秒), 超时后直接放弃
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "hfdl")
+DEFAULT_BLOB_STORE = os.path.join(DEFAULT_CACHE_DIR, "blobs")  # 跨仓库去重的内容存储
+USER_AGENT = "HuggingFaceDownloadGUI/1.0"
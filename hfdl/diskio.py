@@ -0,0 +1,106 @@
+"""下载文件的磁盘写入: 剩余空间检查、预分配、缓冲写入和落盘"""
+import os
+import errno
+import shutil
+import threading
+
+from .errors import DiskError
+from .utils import format_size
+
+DEFAULT_WRITE_BUFFER = 1024 * 1024  # 每个文件或分段的写缓冲区大小
+
+def existing_parent(path):
+    """返回path或其最近的已存在的上级目录 (保存位置可能还不存在)"""
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return path
+
+def free_space(path):
+    """path所在磁盘的可用字节数"""
+    return shutil.disk_usage(existing_parent(path)).free
+
+def check_free_space(path, required, reserve=0):
+    """可用空间不足以写入required字节并保留reserve字节时抛出DiskError, 否则返回可用字节数"""
+    free = free_space(path)
+    if required + reserve > free:
+        message = f"磁盘空间不足: 还需要写入 {format_size(required)}, 保存位置所在磁盘只剩 {format_size(free)}"
+        if reserve:
+            message += f" (另需保留 {format_size(reserve)})"
+        raise DiskError(message + ", 请清理磁盘、更换保存位置或用忽略模式减少下载的文件")
+    return free
+
+def preallocate(f, size):
+    """为已打开的文件分配size字节的空间, 减少碎片, 空间不足时立即失败而不是写到一半
+
+    支持posix_fallocate的系统上真正分配磁盘块; 其他系统或文件系统不支持时退回truncate,
+    在NTFS等文件系统上同样会预留空间, 在其他文件系统上可能只是稀疏文件。
+    """
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+            return
+        except OSError as e:
+            if e.errno in (errno.ENOSPC, errno.EDQUOT):
+                raise DiskError(f"磁盘空间不足, 无法为 {os.path.basename(f.name)} 分配 {format_size(size)}") from e
+    f.truncate(size)
+
+def fsync(f):
+    """把文件内容写到磁盘, 之后再重命名, 避免断电后出现大小正确但内容不完整的文件"""
+    f.flush()
+    os.fsync(f.fileno())
+
+class BufferPool:
+    """可复用的写缓冲区, 避免每个文件和分段都重新分配; 最多保留max_idle个空闲缓冲区"""
+    def __init__(self, size=DEFAULT_WRITE_BUFFER, max_idle=16):
+        self.size = size
+        self.max_idle = max_idle
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def get(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        return bytearray(self.size)
+
+    def put(self, buffer):
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append(buffer)
+
+class BufferedWriter:
+    """把网络上收到的小块数据攒到缓冲区中, 满了再一次写入文件
+
+    f应以无缓冲方式 (buffering=0) 打开并已定位到position。每次写入文件后调用
+    on_flush(position, data), 此时数据已交给操作系统, 可以据此记录续传进度;
+    data是缓冲区的视图, 只在回调期间有效。
+    """
+    def __init__(self, f, buffer, position=0, on_flush=None):
+        self.f = f
+        self.view = memoryview(buffer)
+        self.position = position  # 缓冲区中第一个字节在文件中的位置
+        self.used = 0
+        self.on_flush = on_flush
+
+    def write(self, chunk):
+        if self.used + len(chunk) > len(self.view):
+            self.flush()
+        if len(chunk) >= len(self.view):
+            self._write(memoryview(chunk))
+            return
+        self.view[self.used:self.used + len(chunk)] = chunk
+        self.used += len(chunk)
+
+    def flush(self):
+        if self.used:
+            data, self.used = self.view[:self.used], 0
+            self._write(data)
+
+    def _write(self, data):
+        written = 0
+        while written < len(data):
+            written += self.f.write(data[written:])
+        if self.on_flush is not None:
+            self.on_flush(self.position, data)
+        self.position += len(data)
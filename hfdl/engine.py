@@ -0,0 +1,624 @@
+"""逐文件并发下载引擎和HTTP传输层"""
+import os
+import time
+import json
+import hashlib
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from urllib.parse import quote
+
+import urllib3
+
+from .constants import (DEFAULT_ENDPOINT, DEFAULT_REVISION, DEFAULT_REPO_TYPE, DEFAULT_MAX_WORKERS,
+                        DEFAULT_SEGMENTS, DEFAULT_SEGMENT_THRESHOLD, DEFAULT_CANCEL_TIMEOUT, USER_AGENT)
+from .diskio import BufferPool, BufferedWriter, preallocate, fsync, DEFAULT_WRITE_BUFFER
+from .errors import (DownloadError, TransientError, IntegrityError, RemoteChangedError, RetryPolicy,
+                     http_error, classify_error)
+from .session import HttpSession
+from .utils import format_size, repo_path
+from .verify import SegmentHasher, hash_prefix
+
+class DownloadEngine:
+    """逐文件并发下载仓库内容的下载引擎
+
+    接收仓库文件列表, 在线程池中并发下载每个文件,
+    并通过DownloadTracker逐个报告文件的成功或失败。
+    expected_sha256中给出的文件在写入的同时计算sha256, 不一致时算作下载失败。
+    可恢复的错误 (网络中断、5xx、429、校验失败) 按retry_policy对每个文件和每个分段单独重试,
+    重试时从已写入的最后一个字节续传。
+    给出extraction (ArchiveExtraction) 时, 其中的tar和zip归档改为单连接顺序下载并同时解压。
+    给出peers (PeerNetwork) 时, 有sha256的文件先尝试从局域网节点获取, 失败时再从Hub下载。
+    """
+    chunk_size = 64 * 1024  # 每次读取64KB, 同时决定取消和进度更新的粒度
+
+    # urllib3只负责跟随重定向, 连接、读取错误和Retry-After都交给RetryPolicy处理
+    transport_retries = urllib3.Retry(total=10, connect=0, read=0, redirect=10, respect_retry_after_header=False)
+
+    segment_state_save_interval = 32 * 1024 * 1024  # 分段进度文件的保存间隔(字节)
+    write_buffer_size = DEFAULT_WRITE_BUFFER  # 收到的数据攒够该大小再写入文件
+    fsync = True  # 完成的文件在重命名前写到磁盘
+
+    def __init__(self, repo_id, local_dir, tracker, token=None, max_workers=DEFAULT_MAX_WORKERS,
+                 resume_download=True, revision=DEFAULT_REVISION, endpoint=DEFAULT_ENDPOINT,
+                 should_continue=None, segments=DEFAULT_SEGMENTS,
+                 segment_threshold=DEFAULT_SEGMENT_THRESHOLD, cancel_timeout=DEFAULT_CANCEL_TIMEOUT,
+                 connection_limiter=None, expected_sha256=None, adaptive=None, bandwidth_limiter=None,
+                 endpoint_selector=None, session=None, retry_policy=None, extraction=None, peers=None,
+                 repo_type=DEFAULT_REPO_TYPE):
+        self.repo_id = repo_id
+        self.repo_path = repo_path(repo_id, repo_type)  # 文件网址中的仓库路径, 数据集为 datasets/repo_id
+        self.local_dir = local_dir
+        self.tracker = tracker
+        self.token = token
+        self.max_workers = max(1, int(max_workers))
+        self.segments = max(1, int(segments))
+        self.segment_threshold = segment_threshold
+        self.resume_download = resume_download
+        self.revision = revision
+        self.endpoint = endpoint.rstrip("/")
+        self.should_continue = should_continue or (lambda: True)
+        self.cancel_timeout = cancel_timeout
+        self.connection_limiter = connection_limiter  # 多任务共享的连接数调度器 (可选)
+        self.adaptive = adaptive  # AdaptiveConcurrency, 根据吞吐调整连接数和分段数 (可选)
+        self.bandwidth_limiter = bandwidth_limiter  # 所有传输共用的BandwidthLimiter (可选)
+        self.endpoint_selector = endpoint_selector  # EndpointSelector, 配置了多个镜像时按文件故障切换
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.extraction = extraction  # ArchiveExtraction, 边下载边解压归档文件 (可选)
+        self.peers = peers  # PeerNetwork, 先从局域网节点获取LFS文件 (可选)
+        self.expected_sha256 = expected_sha256 or {}  # 文件 -> 仓库元数据中的LFS sha256
+        self.verified_files = set()  # 本次下载并通过sha256校验的文件
+        self.cancel_event = threading.Event()
+        self.timeout = urllib3.Timeout(connect=10, read=60)
+        # 任务的HttpSession (代理、连接池和DNS缓存), 单独使用引擎时按环境变量中的代理创建
+        self.http = session or HttpSession(maxsize=self.pool_size())
+        self.buffers = BufferPool(self.write_buffer_size)
+        self.lock = threading.Lock()
+        self.active_responses = set()
+        self.partial_files = {}  # 取消时保留的部分文件 -> 已保存字节数
+
+    def pool_size(self):
+        """每个主机需要的连接池容量: 每个文件最多同时占用segments个连接"""
+        maxsize = self.max_workers * self.segments
+        if self.adaptive is not None:
+            maxsize = max(maxsize, self.adaptive.max_connections)
+        return maxsize
+
+    def get_file_url(self, filename, endpoint=None):
+        endpoint = endpoint or self.endpoint
+        return f"{endpoint}/{self.repo_path}/resolve/{quote(self.revision, safe='')}/{quote(filename)}"
+
+    def get_headers(self):
+        headers = {"User-Agent": USER_AGENT}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        return headers
+
+    def is_cancelled(self):
+        return self.cancel_event.is_set() or not self.should_continue()
+
+    def cancel(self):
+        """取消下载: 未开始的文件不再下载, 并立即关闭所有正在传输的连接"""
+        self.cancel_event.set()
+        with self.lock:
+            responses = list(self.active_responses)
+        for response in responses:
+            self._abort_response(response)
+
+    def _abort_response(self, response):
+        # 关闭底层socket, 让阻塞在读取上的工作线程立即返回
+        sock = getattr(getattr(response, "connection", None), "sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _gates(self):
+        return [gate for gate in (self.adaptive, self.connection_limiter) if gate is not None]
+
+    def _release_gates(self, gates):
+        for gate in gates:
+            gate.release()
+
+    def _request(self, filename, headers, endpoint=None):
+        # 先向自适应控制器和调度器申请连接名额, 等待期间仍响应取消
+        acquired = []
+        for gate in self._gates():
+            while not gate.acquire(timeout=0.5):
+                if self.is_cancelled():
+                    self._release_gates(acquired)
+                    raise DownloadError("下载已取消")
+            acquired.append(gate)
+        try:
+            response = self.http.request("GET", self.get_file_url(filename, endpoint), headers=headers,
+                                         preload_content=False, timeout=self.timeout,
+                                         retries=self.transport_retries)
+        except Exception:
+            self._release_gates(acquired)
+            raise
+        with self.lock:
+            self.active_responses.add(response)
+        if self.cancel_event.is_set():
+            self._abort_response(response)
+        return response
+
+    def _release(self, response, completed):
+        """归还连接, 对同一响应重复调用时只生效一次"""
+        with self.lock:
+            if response not in self.active_responses:
+                return
+            self.active_responses.discard(response)
+        # 未读完的响应不能放回连接池, 直接关闭连接
+        if completed:
+            response.release_conn()
+        else:
+            response.close()
+        self._release_gates(self._gates())
+
+    def _check_sha256(self, filename, actual, temp_path, state_path=None):
+        """校验下载结果, 不一致时删除临时文件 (无法续传损坏的数据) 并抛出IntegrityError"""
+        expected = self.expected_sha256.get(filename)
+        if expected is None:
+            return
+        if actual != expected:
+            for path in (temp_path, state_path):
+                if path and os.path.exists(path):
+                    os.remove(path)
+            raise IntegrityError(f"sha256校验失败: 下载内容为 {(actual or '不完整')[:16]}..., "
+                                f"仓库记录为 {expected[:16]}...")
+        with self.lock:
+            self.verified_files.add(filename)
+        self.tracker.add_verified_file(filename)
+
+    def _throttle(self, nbytes):
+        if self.bandwidth_limiter is not None:
+            self.bandwidth_limiter.consume(nbytes, self.is_cancelled)
+
+    def _record_retry(self, filename, error, attempt, segment=None):
+        """记录一次重试, 返回退避时间"""
+        if self.adaptive is not None:
+            self.adaptive.record_error(error)
+        delay = self.retry_policy.delay(error, attempt)
+        self.tracker.add_retry(filename, str(error), attempt, self.retry_policy.attempts - 1, delay,
+                               kind=error.kind, segment=segment)
+        return delay
+
+    def _wait_before_retry(self, filename, error, attempt, segment=None):
+        """记录一次重试并等待退避时间, 等待期间被取消时返回False"""
+        delay = self._record_retry(filename, error, attempt, segment)
+        deadline = time.time() + delay
+        while not self.is_cancelled():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return True
+            self.cancel_event.wait(min(remaining, 0.5))
+        return False
+
+    def _record_partial(self, filename, saved_bytes):
+        if saved_bytes:
+            with self.lock:
+                self.partial_files[filename] = saved_bytes
+
+    def run(self, files, refresh=()):
+        """并发下载文件列表, 返回成功下载的文件
+
+        refresh中的文件已知与远程不一致, 即使本地大小相同也重新下载。
+        取消后最多等待cancel_timeout秒让工作线程保存进度并退出, 超时后不再等待。
+        """
+        self.tracker.files_queued(files)
+        succeeded = self._run_threads(files, set(refresh))
+        self._report_partial_files()
+        return succeeded
+
+    def _run_threads(self, files, refresh):
+        """在线程池中下载files, 返回成功下载的文件"""
+        succeeded = []
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hf-download")
+        futures = {pool.submit(self.download_file, filename, filename in refresh): filename for filename in files}
+        pending = set(futures)
+        deadline = None
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._report_result(future, futures[future], succeeded)
+                if self.adaptive is not None:
+                    self.adaptive.tick()
+                if not pending or not self.is_cancelled():
+                    continue
+                if deadline is None:
+                    deadline = time.time() + self.cancel_timeout
+                    self.cancel()
+                    for future in pending:
+                        future.cancel()
+                elif time.time() >= deadline:
+                    self.tracker.log(f"取消超时, 放弃 {len(pending)} 个仍未退出的下载线程")
+                    break
+        finally:
+            pool.shutdown(wait=False)
+        return succeeded
+
+    def _report_partial_files(self):
+        for filename, saved_bytes in sorted(self.partial_files.items()):
+            self.tracker.add_resumable_file(filename, saved_bytes)
+        if self.partial_files:
+            saved = sum(self.partial_files.values())
+            self.tracker.log(f"已保留 {len(self.partial_files)} 个部分下载的文件 (共 {format_size(saved)}), "
+                             f"开启断点续传后可继续下载")
+
+    def _report_result(self, future, filename, succeeded):
+        if future.cancelled():
+            return
+        try:
+            if future.result():
+                succeeded.append(filename)
+                self.tracker.add_downloaded_file(filename)
+        except Exception as e:
+            self._report_failure(filename, e)
+
+    def _report_failure(self, filename, error):
+        # 取消后出现的错误都是关闭连接造成的, 不算下载失败
+        if not self.is_cancelled():
+            if self.adaptive is not None:
+                self.adaptive.record_error(error)
+            self.tracker.add_failed_file(filename, str(error), kind=getattr(error, "kind", None))
+
+    def download_file(self, filename, refresh=False):
+        """下载单个文件, 被取消时返回False; refresh为True时不因本地文件大小一致而跳过
+
+        配置了多个镜像时依次尝试各个地址, 已下载的部分在下一个地址上续传。
+        """
+        if self.is_cancelled():
+            return False
+        self.tracker.file_started(filename)
+        if self.use_peers(filename, refresh) and self.peers.download(
+                self, filename, self.expected_sha256[filename], self.target_path(filename)):
+            return True
+        if self.endpoint_selector is None:
+            return self._download_from(filename, refresh, self.endpoint)
+
+        endpoints = self.endpoint_selector.candidates()
+        for index, endpoint in enumerate(endpoints):
+            try:
+                result = self._download_from(filename, refresh, endpoint)
+            except Exception as e:
+                if self.is_cancelled():
+                    raise
+                self.endpoint_selector.record_failure(endpoint)
+                if index == len(endpoints) - 1:
+                    raise
+                self.tracker.reset_file(filename)
+                self.tracker.log(f"{filename} 从 {endpoint} 下载失败 ({e}), 改用 {endpoints[index + 1]}")
+                continue
+            if result:
+                self.endpoint_selector.record_success(endpoint)
+            return result
+
+    def target_path(self, filename):
+        return os.path.join(self.local_dir, *filename.split("/"))
+
+    def use_peers(self, filename, refresh=False):
+        """是否先从局域网节点获取: 有sha256、不是边下载边解压的归档, 且本地还没有该文件 (或需要刷新)"""
+        if self.peers is None or filename not in self.expected_sha256:
+            return False
+        if self.extraction is not None and self.extraction.handles(filename):
+            return False
+        return refresh or not os.path.exists(self.target_path(filename))
+
+    def _download_from(self, filename, refresh, endpoint):
+        """从指定地址下载单个文件, 可恢复的错误按retry_policy重试并从已下载的位置续传"""
+        resume = self.resume_download
+        attempt = 0
+        while True:
+            try:
+                return self._attempt_download(filename, refresh, endpoint, resume)
+            except Exception as e:
+                error = classify_error(e)
+                attempt += 1
+                if self.is_cancelled() or not self.retry_policy.should_retry(error, attempt):
+                    if error is e:
+                        raise
+                    raise error from e
+            if not self._wait_before_retry(filename, error, attempt):
+                return False
+            # 下一次尝试会把本地已有的部分重新计入进度
+            self.tracker.reset_file(filename)
+            resume = True
+
+    def _attempt_download(self, filename, refresh, endpoint, resume):
+        """下载单个文件一次; resume为True时从.incomplete文件或分段进度续传"""
+        if self.is_cancelled():
+            return False
+        if self.extraction is not None and self.extraction.handles(filename):
+            return self.extraction.attempt(self, filename, refresh, endpoint, resume)
+
+        target = os.path.join(self.local_dir, *filename.split("/"))
+        temp_path = target + ".incomplete"
+        state_path = target + ".segments.json"
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+
+        # 存在分段进度文件时, 只续传未完成的分段
+        if os.path.exists(state_path):
+            state = self._load_segment_state(state_path) if resume else None
+            if state and os.path.exists(temp_path):
+                return self._download_segmented(filename, target, state, endpoint)
+            os.remove(state_path)
+
+        offset = 0
+        if resume and os.path.exists(temp_path):
+            offset = os.path.getsize(temp_path)
+
+        headers = self.get_headers()
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        response = self._request(filename, headers, endpoint)
+        completed = False
+        received = 0
+        try:
+            if response.status == 416:
+                self._release(response, False)
+                if offset and self.holds_whole_file(response, offset):
+                    return self._finish_whole_temp(filename, temp_path, target, offset)
+                # 本地的临时文件已与远程文件不匹配, 从头下载
+                os.remove(temp_path)
+                return self._attempt_download(filename, refresh, endpoint, resume)
+            if response.status >= 400:
+                raise http_error(response)
+            if response.status != 206:
+                offset = 0
+            elif offset:
+                self.tracker.add_bytes(filename, offset, resumed=True)
+
+            content_length = response.headers.get("Content-Length")
+            expected = int(content_length) if content_length is not None else None
+
+            # 目标文件已存在且大小一致时跳过
+            if offset == 0 and not refresh and expected is not None and os.path.exists(target) \
+                    and os.path.getsize(target) == expected:
+                self.tracker.add_bytes(filename, expected, resumed=True)
+                return True
+
+            # 大文件且服务器支持Range时, 改为多连接分段下载
+            segments = self.adaptive.segments if self.adaptive is not None else self.segments
+            if offset == 0 and segments > 1 and expected is not None \
+                    and expected >= self.segment_threshold \
+                    and response.headers.get("Accept-Ranges", "").lower() == "bytes":
+                self._release(response, False)
+                return self._download_segmented(filename, target, self._new_segment_state(expected, segments),
+                                                endpoint)
+
+            # 边写入边计算sha256, 续传时先补算已有部分
+            digest = None
+            if filename in self.expected_sha256:
+                digest = hash_prefix(temp_path, offset) if offset else hashlib.sha256()
+            buffer = self.buffers.get()
+            try:
+                with open(temp_path, "r+b" if offset else "wb", buffering=0) as f:
+                    f.seek(offset)
+                    # 预分配完整大小; 没有完成时截断到已写入的位置, 续传仍以文件大小为准
+                    if not offset and expected is not None and expected > len(buffer):
+                        preallocate(f, expected)
+                    writer = BufferedWriter(f, buffer, offset)
+                    try:
+                        for chunk in response.stream(self.chunk_size):
+                            if self.is_cancelled():
+                                break
+                            writer.write(chunk)
+                            if digest is not None:
+                                digest.update(chunk)
+                            self._throttle(len(chunk))
+                            received += len(chunk)
+                            self.tracker.add_bytes(filename, len(chunk))
+                        writer.flush()
+                        completed = not self.is_cancelled() and (expected is None or received == expected)
+                        if completed and self.fsync:
+                            fsync(f)
+                    finally:
+                        if not completed:
+                            self._truncate_partial(f, writer)
+            finally:
+                self.buffers.put(buffer)
+
+            if self.is_cancelled():
+                # 保留.incomplete文件, 下次通过Range请求续传
+                self._record_partial(filename, writer.position)
+                return False
+            if not completed:
+                raise TransientError(f"数据传输中断 (IncompleteRead): 接收了{received}字节, 预计{expected}字节")
+            if digest is not None:
+                self._check_sha256(filename, digest.hexdigest(), temp_path)
+        except Exception:
+            # 取消时关闭连接导致的读取错误不算下载失败
+            if not self.is_cancelled():
+                raise
+            self._record_partial(filename, os.path.getsize(temp_path) if os.path.exists(temp_path) else 0)
+            return False
+        finally:
+            self._release(response, completed)
+
+        os.replace(temp_path, target)
+        return True
+
+    @staticmethod
+    def _truncate_partial(f, writer):
+        """下载中断时写出缓冲区中的数据, 并去掉预分配的剩余部分"""
+        try:
+            writer.flush()
+        except OSError:
+            pass
+        try:
+            f.truncate(writer.position)
+        except OSError:
+            pass
+
+    def _new_segment_state(self, size, segments):
+        """把文件按字节范围平均切分为若干分段"""
+        segment_size = -(-size // segments)
+        segments = []
+        for start in range(0, size, segment_size):
+            end = min(start + segment_size, size) - 1
+            segments.append({"start": start, "end": end, "done": 0})
+        return {"size": size, "segments": segments}
+
+    def _load_segment_state(self, state_path):
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if isinstance(state.get("size"), int) and state.get("segments"):
+                return state
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def _save_segment_state(self, state_path, state):
+        tmp_path = state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
+
+    @staticmethod
+    def holds_whole_file(response, offset):
+        """对 Range: bytes=<offset>- 的416响应: 远程文件大小正好是offset, 即临时文件已包含全部数据"""
+        return response.headers.get("Content-Range", "").strip() == f"bytes */{offset}"
+
+    def _finish_whole_temp(self, filename, temp_path, target, size):
+        """临时文件已完整 (上次在重命名前中断): 补算sha256后直接重命名, 不再重新下载"""
+        self.tracker.add_bytes(filename, size, resumed=True)
+        if filename in self.expected_sha256:
+            self._check_sha256(filename, hash_prefix(temp_path, size).hexdigest(), temp_path)
+        os.replace(temp_path, target)
+        return True
+
+    def _download_segmented(self, filename, target, state, endpoint=None):
+        """多连接分段下载单个文件
+
+        每个分段用一个Range请求写入预分配文件的对应偏移,
+        进度保存在<文件名>.segments.json中, 续传时只下载未完成的部分。
+        sha256由SegmentHasher按文件顺序计算, 不需要在下载完成后重新读取整个文件。
+        """
+        temp_path = target + ".incomplete"
+        state_path = target + ".segments.json"
+        size = state["size"]
+
+        # 预分配完整大小的临时文件
+        with open(temp_path, "r+b" if os.path.exists(temp_path) else "wb") as f:
+            current = os.path.getsize(temp_path)
+            if current > size:
+                f.truncate(size)
+            if current != size:
+                preallocate(f, size)
+        self._save_segment_state(state_path, state)
+
+        lock = threading.Lock()
+        failed = threading.Event()
+        unsaved = [0]
+
+        resumed = sum(seg["done"] for seg in state["segments"])
+        if resumed:
+            self.tracker.add_bytes(filename, resumed, resumed=True)
+
+        hasher = SegmentHasher(temp_path, state) if filename in self.expected_sha256 else None
+
+        def on_progress(segment, chunk):
+            # chunk已写入文件, 分段进度只记录已交给系统的数据
+            with lock:
+                position = segment["start"] + segment["done"]
+                segment["done"] += len(chunk)
+                unsaved[0] += len(chunk)
+                if unsaved[0] >= self.segment_state_save_interval:
+                    unsaved[0] = 0
+                    self._save_segment_state(state_path, state)
+            if hasher is not None:
+                hasher.update(position, chunk)
+
+        pending = [seg for seg in state["segments"] if seg["start"] + seg["done"] <= seg["end"]]
+        errors = []
+        with ThreadPoolExecutor(max_workers=len(pending) or 1, thread_name_prefix="hf-segment") as pool:
+            futures = [pool.submit(self._fetch_segment, filename, temp_path, size, seg, on_progress, failed,
+                                   endpoint)
+                       for seg in pending]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    failed.set()
+                    errors.append(e)
+
+        with lock:
+            self._save_segment_state(state_path, state)
+        if self.is_cancelled():
+            self._record_partial(filename, sum(seg["done"] for seg in state["segments"]))
+            return False
+        if errors:
+            raise errors[0]
+
+        if hasher is not None:
+            self._check_sha256(filename, hasher.hexdigest(), temp_path, state_path)
+        if self.fsync:
+            with open(temp_path, "r+b") as f:
+                fsync(f)
+        os.remove(state_path)
+        os.replace(temp_path, target)
+        return True
+
+    def _fetch_segment(self, filename, temp_path, size, segment, on_progress, failed, endpoint=None):
+        """下载一个分段, 可恢复的错误单独重试, 从该分段已写入的位置继续"""
+        attempt = 0
+        while True:
+            try:
+                return self._fetch_segment_once(filename, temp_path, size, segment, on_progress, failed, endpoint)
+            except Exception as e:
+                error = classify_error(e)
+                attempt += 1
+                if failed.is_set() or self.is_cancelled() or not self.retry_policy.should_retry(error, attempt):
+                    # 分段已重试过, 整个文件不再重复重试
+                    error.retries_exhausted = error.retryable
+                    if error is e:
+                        raise
+                    raise error from e
+            position = f"{segment['start']}-{segment['end']}"
+            if not self._wait_before_retry(filename, error, attempt, segment=position) or failed.is_set():
+                return
+
+    def _fetch_segment_once(self, filename, temp_path, size, segment, on_progress, failed, endpoint=None):
+        """下载一个分段的剩余部分, 写入临时文件中对应的偏移处"""
+        start = segment["start"] + segment["done"]
+        end = segment["end"]
+        if start > end:
+            return
+
+        headers = self.get_headers()
+        headers["Range"] = f"bytes={start}-{end}"
+        response = self._request(filename, headers, endpoint)
+        completed = False
+        try:
+            if response.status != 206:
+                raise http_error(response, "分段请求失败: HTTP")
+            content_range = response.headers.get("Content-Range", "")
+            if not content_range.endswith(f"/{size}"):
+                raise RemoteChangedError(f"远程文件大小已变化 ({content_range}), 请关闭断点续传后重新下载")
+
+            # 数据先攒在缓冲区中, 写入文件后才计入分段进度; 退出时写出缓冲区中剩余的数据
+            buffer = self.buffers.get()
+            try:
+                with open(temp_path, "r+b", buffering=0) as f:
+                    f.seek(start)
+                    writer = BufferedWriter(f, buffer, start, on_flush=lambda position, data: on_progress(segment, data))
+                    try:
+                        for chunk in response.stream(self.chunk_size):
+                            if failed.is_set() or self.is_cancelled():
+                                return
+                            writer.write(chunk)
+                            self.tracker.add_bytes(filename, len(chunk))
+                            self._throttle(len(chunk))
+                    finally:
+                        writer.flush()
+            finally:
+                self.buffers.put(buffer)
+
+            if segment["start"] + segment["done"] <= end:
+                raise TransientError(f"数据传输中断 (IncompleteRead): 分段 {segment['start']}-{end} 未接收完整")
+            completed = True
+        finally:
+            self._release(response, completed)
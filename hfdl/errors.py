@@ -0,0 +1,126 @@
+"""下载错误类型和重试策略"""
+import errno
+import random
+import socket
+import time
+import http.client
+from email.utils import parsedate_to_datetime
+
+import urllib3
+
+class DownloadError(Exception):
+    """单个文件下载失败时抛出的异常
+
+    kind标识错误类型, 下载摘要按类型给出建议; retryable表示稍后重试可能成功。
+    """
+    kind = "error"
+    retryable = False
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after  # 服务器要求的等待秒数 (Retry-After)
+        self.retries_exhausted = False  # 内层 (分段) 已经重试过, 外层不再重试
+
+class TransientError(DownloadError):
+    """连接失败、超时、连接被重置或数据传输中断"""
+    kind = "network"
+    retryable = True
+
+class NotFoundError(DownloadError):
+    """HTTP 404: 文件或仓库不存在"""
+    kind = "not_found"
+
+class AuthError(DownloadError):
+    """HTTP 401/403: 需要Token或没有权限"""
+    kind = "auth"
+
+class ServerError(DownloadError):
+    """HTTP 5xx"""
+    kind = "server"
+    retryable = True
+
+class RateLimitError(DownloadError):
+    """HTTP 429, retry_after为服务器要求的等待时间"""
+    kind = "rate_limit"
+    retryable = True
+
+class IntegrityError(DownloadError):
+    """下载内容的sha256与仓库元数据不一致, 临时文件已删除, 重新下载可能成功"""
+    kind = "hash"
+    retryable = True
+
+class RemoteChangedError(DownloadError):
+    """下载过程中远程文件大小发生变化"""
+    kind = "changed"
+
+class DiskError(DownloadError):
+    """写入本地文件失败, 例如磁盘已满或没有权限"""
+    kind = "disk"
+
+class ArchiveError(DownloadError):
+    """归档文件无法解压: 格式错误、不支持的压缩方法或加密"""
+    kind = "archive"
+
+def parse_retry_after(value):
+    """解析Retry-After头 (秒数或HTTP日期), 返回秒数, 无法解析时返回None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def http_error(response, prefix="HTTP"):
+    """根据响应状态码生成对应类型的DownloadError"""
+    status = response.status
+    reason = http.client.responses.get(status, "")
+    message = f"{prefix} {status} {reason}".strip()
+    if status == 404:
+        return NotFoundError(message, status=status)
+    if status in (401, 403):
+        return AuthError(message, status=status)
+    if status == 429:
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        return RateLimitError(message, status=status, retry_after=retry_after)
+    if status >= 500:
+        return ServerError(message, status=status, retry_after=parse_retry_after(response.headers.get("Retry-After")))
+    return DownloadError(message, status=status)
+
+def classify_error(error):
+    """把urllib3和系统异常转换为对应类型的DownloadError, 已是DownloadError的原样返回"""
+    if isinstance(error, DownloadError):
+        return error
+    if isinstance(error, (urllib3.exceptions.HTTPError, socket.timeout, TimeoutError, ConnectionError)):
+        # urllib3的连接、超时和协议错误, 以及被对端重置的连接
+        return TransientError(f"网络错误: {error}")
+    if isinstance(error, OSError) and error.errno in (errno.ENOSPC, errno.EDQUOT, errno.EACCES, errno.EROFS):
+        return DiskError(f"写入文件失败: {error}")
+    return DownloadError(str(error) or type(error).__name__)
+
+class RetryPolicy:
+    """按文件和分段重试可恢复的错误
+
+    第n次重试前等待 base_delay * 2^(n-1) 秒 (不超过max_delay), 再在其一半到全部之间随机抖动,
+    避免大量连接同时重连。服务器给出Retry-After时按其等待 (不超过max_retry_after)。
+    attempts为包括第一次在内的最多尝试次数。
+    """
+    def __init__(self, attempts=5, base_delay=1.0, max_delay=30.0, max_retry_after=300.0):
+        self.attempts = max(1, int(attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+
+    def should_retry(self, error, attempt):
+        """attempt为已经失败的次数"""
+        return error.retryable and not error.retries_exhausted and attempt < self.attempts
+
+    def delay(self, error, attempt):
+        if error.retry_after is not None:
+            return min(error.retry_after, self.max_retry_after)
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(delay / 2, delay)
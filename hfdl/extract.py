@@ -0,0 +1,703 @@
+"""边下载边解压tar和zip归档
+
+tar系列归档 (.tar、.tar.gz/.tgz、.tar.bz2/.tbz2、.tar.xz/.txz) 是顺序格式: 下载线程把收到的数据
+交给解压线程, 由tarfile以流模式 ("r|*") 逐个成员解压, 下载完成时解压也随之完成。
+zip的文件列表 (中央目录) 在文件末尾: 先用Range请求读取末尾的中央目录, 得到每个成员的位置、
+大小和压缩方法, 之后下载的数据按本地文件头顺序逐个解压并核对CRC。含有加密成员或不支持的
+压缩方法的zip改为下载完成后再用zipfile解压。
+
+解压结果先写入 <目录>.incomplete, 全部成功后再改名为与归档同名 (去掉扩展名) 的目录,
+目录中的 .hfdl-extracted.json 记录归档的大小和sha256, 再次下载时据此跳过。
+keep_archives为False时不在磁盘上保存归档本身, 断点续传从解压器已处理的位置继续。
+"""
+import os
+import bz2
+import json
+import zlib
+import queue
+import shutil
+import struct
+import hashlib
+import tarfile
+import zipfile
+import threading
+from datetime import datetime
+
+from .diskio import fsync
+from .errors import ArchiveError, IntegrityError, TransientError, http_error
+
+EXTRACTED_RECORD = ".hfdl-extracted.json"
+ZIP_TAIL_SIZE = 128 * 1024  # 第一次读取的zip末尾字节数, 通常已包含整个中央目录
+LOCAL_HEADER = struct.Struct("<4s22xHH")  # zip本地文件头: 签名、文件名长度和扩展字段长度
+LOCAL_HEADER_SIGNATURE = b"PK\003\004"
+ARCHIVE_SUFFIXES = [(".tar.gz", "tar"), (".tar.bz2", "tar"), (".tar.xz", "tar"), (".tgz", "tar"),
+                    (".tbz2", "tar"), (".txz", "tar"), (".tar", "tar"), (".zip", "zip")]
+
+def archive_suffix(filename):
+    """返回 (扩展名, 归档类型), 不是支持的归档时返回 (None, None)"""
+    lower = filename.lower()
+    for suffix, kind in ARCHIVE_SUFFIXES:
+        if lower.endswith(suffix) and len(lower) > len(suffix):
+            return suffix, kind
+    return None, None
+
+def archive_kind(filename):
+    """"tar"、"zip"或None"""
+    return archive_suffix(filename)[1]
+
+def extraction_dir(path):
+    """归档的解压目录: 去掉扩展名的同名目录"""
+    suffix = archive_suffix(path)[0]
+    return path[:-len(suffix)] if suffix else path + ".extracted"
+
+def safe_path(root, name):
+    """成员在root中的路径; 含有..或盘符等会写到root之外的路径时返回None"""
+    parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".")]
+    if not parts or any(part == ".." or ":" in part for part in parts):
+        return None
+    return os.path.join(root, *parts)
+
+def read_extracted_record(dest):
+    try:
+        with open(os.path.join(dest, EXTRACTED_RECORD), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+class ArchiveExtractor:
+    """一个归档的解压状态; feed按顺序接收归档的数据, position为已接收的字节数
+
+    同一次任务中重试时保留解压器, 从position续传即可继续解压; reset后从头开始。
+    """
+    kind = None
+
+    def __init__(self, filename, dest):
+        self.filename = filename
+        self.dest = dest
+        self.temp_dir = dest + ".incomplete"
+        self.needs_archive = False  # 为True时必须先完整保存归档, 下载完成后再解压
+        self._reset_state()
+
+    def _reset_state(self):
+        self.position = 0
+        self.digest = hashlib.sha256()
+        self.files = 0
+        self.bytes = 0
+        self.skipped = []
+
+    def reset(self):
+        """丢弃已解压的内容, 从归档开头重新开始"""
+        self.abort()
+        self._reset_state()
+
+    def abort(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def feed(self, data):
+        self.digest.update(data)
+        self._feed(data)
+        self.position += len(data)
+
+    def _feed(self, data):
+        raise NotImplementedError
+
+    def finish(self, archive_path=None):
+        """归档已全部接收, 完成解压; archive_path为完整保存的归档 (needs_archive时必须给出)"""
+        raise NotImplementedError
+
+    def extract_file(self, path):
+        """解压本地已有的完整归档"""
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(1024 * 1024)
+                if not data:
+                    break
+                self.feed(data)
+        self.finish(path)
+
+    def commit(self, record):
+        """写入解压记录并把临时目录改名为解压目录, 替换之前的解压结果"""
+        os.makedirs(self.temp_dir, exist_ok=True)
+        with open(os.path.join(self.temp_dir, EXTRACTED_RECORD), "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=1, sort_keys=True)
+        if os.path.isdir(self.dest):
+            shutil.rmtree(self.dest)
+        elif os.path.exists(self.dest):
+            os.remove(self.dest)
+        os.replace(self.temp_dir, self.dest)
+
+    def _output(self, name):
+        """成员的输出路径, 不安全的路径记入skipped并返回None"""
+        path = safe_path(self.temp_dir, name)
+        if path is None:
+            self.skipped.append(name)
+        return path
+
+class _Pipe:
+    """从下载线程传给解压线程的数据流, 队列满时写入方等待, 解压跟不上时下载也随之放慢"""
+    def __init__(self, maxsize=16):
+        self.queue = queue.Queue(maxsize)
+        self.buffer = bytearray()
+        self.eof = False
+        self.closed = False  # 读取方已退出, 之后写入的数据直接丢弃
+        self.aborted = False
+
+    def put(self, data):
+        while not self.closed:
+            try:
+                self.queue.put(data, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def read(self, size=-1):
+        while (size < 0 or len(self.buffer) < size) and not self.eof:
+            data = self.queue.get()
+            if self.aborted:
+                raise EOFError("解压已取消")
+            if data is None:
+                self.eof = True
+            else:
+                self.buffer += data
+        if size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def close_reader(self):
+        self.closed = True
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def abort(self):
+        self.aborted = True
+        self.close_reader()
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+class TarExtractor(ArchiveExtractor):
+    """在后台线程中用tarfile的流模式解压; 只解压普通文件和目录, 跳过链接和设备文件"""
+    kind = "tar"
+    queue_size = 16
+
+    def _reset_state(self):
+        super()._reset_state()
+        self.pipe = None
+        self.thread = None
+        self.error = None
+
+    def _start(self):
+        self.pipe = _Pipe(self.queue_size)
+        self.thread = threading.Thread(target=self._run, name="hf-extract", daemon=True)
+        self.thread.start()
+
+    def _feed(self, data):
+        if self.thread is None:
+            self._start()
+        self.pipe.put(bytes(data))
+
+    def _run(self):
+        try:
+            os.makedirs(self.temp_dir, exist_ok=True)
+            with tarfile.open(fileobj=self.pipe, mode="r|*") as tar:
+                for member in tar:
+                    self._extract_member(tar, member)
+        except Exception as e:
+            if not self.pipe.aborted:
+                self.error = e
+        finally:
+            # 归档结束标记之后的填充数据不再需要
+            self.pipe.close_reader()
+
+    def _extract_member(self, tar, member):
+        if not (member.isfile() or member.isdir()):
+            self.skipped.append(member.name)
+            return
+        path = self._output(member.name)
+        if path is None:
+            return
+        if member.isdir():
+            os.makedirs(path, exist_ok=True)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        source = tar.extractfile(member)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(source, f, 1024 * 1024)
+        os.utime(path, (member.mtime, member.mtime))
+        self.files += 1
+        self.bytes += member.size
+
+    def finish(self, archive_path=None):
+        if self.thread is None:
+            self._start()
+        self.pipe.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise ArchiveError(f"无法解压 {os.path.basename(self.filename)}: {self.error}")
+
+    def abort(self):
+        if self.thread is not None:
+            self.pipe.abort()
+            self.thread.join()
+        super().abort()
+
+class _TailFile:
+    """只含有归档末尾部分数据的文件对象, 供zipfile解析中央目录; 读取更前面的位置时抛出_NeedMore"""
+    def __init__(self, start, data, size):
+        self.start = start
+        self.data = data
+        self.size = size
+        self.pos = 0
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            offset += self.size
+        self.pos = offset
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def seekable(self):
+        return True
+
+    def read(self, n=-1):
+        if self.pos < self.start:
+            raise _NeedMore(self.pos)
+        end = self.size if n is None or n < 0 else min(self.size, self.pos + n)
+        data = self.data[self.pos - self.start:end - self.start]
+        self.pos += len(data)
+        return data
+
+class _NeedMore(Exception):
+    def __init__(self, offset):
+        super().__init__(offset)
+        self.offset = offset
+
+class ZipExtractor(ArchiveExtractor):
+    """先读取中央目录, 再按本地文件头顺序流式解压各个成员"""
+    kind = "zip"
+    decompressors = {
+        zipfile.ZIP_STORED: lambda: None,
+        zipfile.ZIP_DEFLATED: lambda: zlib.decompressobj(-15),
+        zipfile.ZIP_BZIP2: bz2.BZ2Decompressor,
+        zipfile.ZIP_LZMA: zipfile.LZMADecompressor,
+    }
+
+    def __init__(self, filename, dest):
+        super().__init__(filename, dest)
+        self.entries = None  # 按本地文件头位置排序的ZipInfo
+        self.size = None
+
+    def _reset_state(self):
+        super()._reset_state()
+        self.next_entry = 0
+        self.header = bytearray()
+        self.header_size = LOCAL_HEADER.size
+        self.entry = None
+        self.out = None
+
+    def prepare(self, engine, filename, endpoint=None):
+        """用Range请求读取归档末尾并解析中央目录"""
+        start, data, size = self._fetch_tail(engine, filename, f"-{ZIP_TAIL_SIZE}", endpoint)
+        for _ in range(2):
+            try:
+                with zipfile.ZipFile(_TailFile(start, data, size)) as archive:
+                    infos = archive.infolist()
+                break
+            except _NeedMore as e:
+                # 中央目录比第一次读取的部分大, 补读缺少的部分
+                more = self._fetch_tail(engine, filename, f"{e.offset}-{start - 1}", endpoint)[1]
+                start, data = e.offset, more + data
+            except (zipfile.BadZipFile, struct.error, ValueError) as e:
+                raise ArchiveError(f"{os.path.basename(filename)} 不是有效的zip文件: {e}")
+        else:
+            raise ArchiveError(f"{os.path.basename(filename)} 的中央目录无法解析")
+        self.size = size
+        self.entries = sorted(infos, key=lambda info: info.header_offset)
+        unsupported = [info.filename for info in infos
+                       if info.flag_bits & 0x1 or info.compress_type not in self.decompressors]
+        if unsupported:
+            # 加密或不支持的压缩方法不能流式解压, 下载完成后交给zipfile
+            self.needs_archive = True
+            engine.tracker.log(f"{filename} 中有 {len(unsupported)} 个成员加密或使用了不支持流式解压的压缩方法 "
+                               f"(如 {unsupported[0]}), 下载完成后再解压")
+
+    @staticmethod
+    def _fetch_tail(engine, filename, byte_range, endpoint):
+        """返回 (数据在归档中的起始位置, 数据, 归档大小)"""
+        headers = engine.get_headers()
+        headers["Range"] = f"bytes={byte_range}"
+        response = engine._request(filename, headers, endpoint)
+        completed = False
+        try:
+            if response.status >= 400:
+                raise http_error(response)
+            data = b"".join(response.stream(engine.chunk_size))
+            completed = True
+        finally:
+            engine._release(response, completed)
+        if response.status != 206:
+            # 服务器不支持Range时返回了整个文件
+            return 0, data, len(data)
+        content_range = response.headers.get("Content-Range", "")
+        try:
+            first, size = content_range.split(" ", 1)[1].split("/")
+            start = int(first.split("-")[0])
+            size = int(size)
+        except (IndexError, ValueError):
+            raise TransientError(f"无法识别的Content-Range: {content_range!r}")
+        return start, data, size
+
+    def _feed(self, data):
+        if self.needs_archive:
+            return
+        view = memoryview(data)
+        position = self.position
+        i = 0
+        while i < len(view):
+            if self.entry is None:
+                if self.next_entry >= len(self.entries):
+                    return  # 中央目录, 不需要解析
+                info = self.entries[self.next_entry]
+                if position + i < info.header_offset:
+                    # 成员之间的数据描述符等
+                    i += min(info.header_offset - position - i, len(view) - i)
+                    continue
+                if position + i > info.header_offset + len(self.header):
+                    raise ArchiveError(f"{info.filename} 的本地文件头位置无效")
+                take = min(self.header_size - len(self.header), len(view) - i)
+                self.header += view[i:i + take]
+                i += take
+                if len(self.header) < self.header_size:
+                    continue
+                if self.header_size == LOCAL_HEADER.size:
+                    signature, name_length, extra_length = LOCAL_HEADER.unpack(bytes(self.header))
+                    if signature != LOCAL_HEADER_SIGNATURE:
+                        raise ArchiveError(f"{info.filename} 的本地文件头无效")
+                    self.header_size += name_length + extra_length
+                    if len(self.header) < self.header_size:
+                        continue
+                self._open_entry(info)
+                if info.compress_size == 0:
+                    self._close_entry()
+            else:
+                take = min(self.remaining, len(view) - i)
+                self._write_entry(view[i:i + take])
+                i += take
+                self.remaining -= take
+                if self.remaining == 0:
+                    self._close_entry()
+
+    def _open_entry(self, info):
+        self.entry = info
+        self.remaining = info.compress_size
+        self.decompressor = self.decompressors[info.compress_type]()
+        self.crc = 0
+        self.written = 0
+        self.out = None
+        path = self._output(info.filename)
+        if path is None:
+            return
+        if info.is_dir():
+            os.makedirs(path, exist_ok=True)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.out = open(path, "wb")
+
+    def _write_entry(self, data):
+        if self.decompressor is not None:
+            try:
+                data = self.decompressor.decompress(data)
+            except (zlib.error, OSError, EOFError) as e:
+                raise IntegrityError(f"解压 {self.entry.filename} 失败: {e}")
+        self._emit(data)
+
+    def _emit(self, data):
+        self.crc = zlib.crc32(data, self.crc)
+        self.written += len(data)
+        if self.out is not None:
+            self.out.write(data)
+
+    def _close_entry(self):
+        info = self.entry
+        if hasattr(self.decompressor, "flush"):
+            self._emit(self.decompressor.flush())
+        out, self.out = self.out, None
+        self.entry = None
+        self.header = bytearray()
+        self.header_size = LOCAL_HEADER.size
+        self.next_entry += 1
+        if out is not None:
+            out.close()
+            try:
+                timestamp = datetime(*info.date_time).timestamp()
+                os.utime(out.name, (timestamp, timestamp))
+            except (ValueError, OverflowError):
+                pass  # 无效的修改时间
+        if self.crc != info.CRC or self.written != info.file_size:
+            raise IntegrityError(f"解压 {info.filename} 时CRC校验失败, 归档数据可能已损坏")
+        if out is not None:
+            self.files += 1
+            self.bytes += self.written
+
+    def finish(self, archive_path=None):
+        if self.needs_archive:
+            self._extract_archive(archive_path)
+            return
+        if self.next_entry < len(self.entries):
+            raise ArchiveError(f"{os.path.basename(self.filename)} 不完整: "
+                               f"只解压了 {self.next_entry}/{len(self.entries)} 个成员")
+
+    def extract_file(self, path):
+        self.needs_archive = True
+        self.finish(path)
+
+    def _extract_archive(self, path):
+        """用zipfile解压完整保存的归档"""
+        os.makedirs(self.temp_dir, exist_ok=True)
+        try:
+            with zipfile.ZipFile(path) as archive:
+                for info in archive.infolist():
+                    output = self._output(info.filename)
+                    if output is None:
+                        continue
+                    if info.is_dir():
+                        os.makedirs(output, exist_ok=True)
+                        continue
+                    os.makedirs(os.path.dirname(output), exist_ok=True)
+                    with archive.open(info) as source, open(output, "wb") as f:
+                        shutil.copyfileobj(source, f, 1024 * 1024)
+                    self.files += 1
+                    self.bytes += info.file_size
+        except (zipfile.BadZipFile, NotImplementedError, RuntimeError, zlib.error, EOFError) as e:
+            raise ArchiveError(f"无法解压 {os.path.basename(self.filename)}: {e}")
+
+    def abort(self):
+        if self.out is not None:
+            self.out.close()
+            self.out = None
+        super().abort()
+
+class ArchiveExtraction:
+    """边下载边解压的设置和各个归档的解压器, 通过DownloadEngine(extraction=...)接入下载流程
+
+    file_sizes为仓库元数据中的文件大小, 用于判断归档是否已经解压过。
+    keep_archives为False时归档不写入磁盘 (不支持流式解压的zip除外, 解压后删除)。
+    """
+    def __init__(self, file_sizes=None, keep_archives=True):
+        self.file_sizes = file_sizes or {}
+        self.keep_archives = keep_archives
+        self.extractors = {}
+        self.lock = threading.Lock()
+
+    def handles(self, filename):
+        return archive_kind(filename) is not None
+
+    def _extractor(self, filename, dest):
+        with self.lock:
+            extractor = self.extractors.get(filename)
+            if extractor is None:
+                extractor_class = ZipExtractor if archive_kind(filename) == "zip" else TarExtractor
+                extractor = extractor_class(filename, dest)
+                extractor.abort()  # 清除上次中断时留下的临时目录
+                self.extractors[filename] = extractor
+            return extractor
+
+    def _drop(self, filename):
+        with self.lock:
+            extractor = self.extractors.pop(filename, None)
+        if extractor is not None:
+            extractor.abort()
+
+    def close(self):
+        """放弃所有未完成的解压 (任务结束、取消或文件最终失败)"""
+        for filename in list(self.extractors):
+            self._drop(filename)
+
+    def is_extracted(self, filename, target, expected_sha256=None):
+        """解压目录中的记录与远程归档一致 (保留归档时归档本身也要存在)"""
+        size = self.file_sizes.get(filename)
+        record = read_extracted_record(extraction_dir(target))
+        if size is None or record is None or record.get("archive") != filename or record.get("size") != size:
+            return False
+        if expected_sha256 and record.get("sha256") != expected_sha256:
+            return False
+        return not self.keep_archives or (os.path.isfile(target) and os.path.getsize(target) == size)
+
+    def attempt(self, engine, filename, refresh, endpoint, resume):
+        """下载并解压归档一次, 流程与DownloadEngine._attempt_download的单连接部分相同
+
+        归档不分段下载, 数据必须按顺序交给解压器。
+        """
+        if engine.is_cancelled():
+            return False
+        target = os.path.join(engine.local_dir, *filename.split("/"))
+        temp_path = target + ".incomplete"
+        dest = extraction_dir(target)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        size = self.file_sizes.get(filename)
+        expected_sha256 = engine.expected_sha256.get(filename)
+
+        if not refresh and self.is_extracted(filename, target, expected_sha256):
+            engine.tracker.add_bytes(filename, size, resumed=True)
+            return True
+        extractor = self._extractor(filename, dest)
+        if not refresh and size is not None and os.path.isfile(target) and os.path.getsize(target) == size:
+            # 之前已下载但没有解压的归档
+            extractor.reset()
+            return self._extract_local(engine, filename, target, extractor)
+
+        if extractor.kind == "zip" and extractor.entries is None:
+            extractor.prepare(engine, filename, endpoint)
+        keep = self.keep_archives or extractor.needs_archive
+        if not resume:
+            extractor.reset()
+        if keep:
+            # 先把上次保存的部分交给解压器, 再从文件末尾续传
+            offset = os.path.getsize(temp_path) if resume and os.path.exists(temp_path) else 0
+            if extractor.position > offset:
+                extractor.reset()
+            self._replay(extractor, temp_path, offset)
+        else:
+            offset = extractor.position
+
+        headers = engine.get_headers()
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        response = engine._request(filename, headers, endpoint)
+        completed = False
+        try:
+            if response.status == 416:
+                engine._release(response, False)
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                extractor.reset()
+                return self.attempt(engine, filename, refresh, endpoint, False)
+            if response.status >= 400:
+                raise http_error(response)
+            if response.status != 206 and offset:
+                offset = 0
+                extractor.reset()
+            elif offset:
+                engine.tracker.add_bytes(filename, offset, resumed=True)
+            content_length = response.headers.get("Content-Length")
+            expected = int(content_length) if content_length is not None else None
+
+            received = 0
+            f = open(temp_path, "r+b" if offset else "wb") if keep else None
+            try:
+                if f is not None:
+                    f.seek(offset)
+                for chunk in response.stream(engine.chunk_size):
+                    if engine.is_cancelled():
+                        break
+                    if f is not None:
+                        f.write(chunk)
+                    extractor.feed(chunk)
+                    engine._throttle(len(chunk))
+                    received += len(chunk)
+                    engine.tracker.add_bytes(filename, len(chunk))
+                completed = not engine.is_cancelled() and (expected is None or received == expected)
+                if completed and f is not None and engine.fsync:
+                    fsync(f)
+            finally:
+                if f is not None:
+                    f.close()
+
+            if engine.is_cancelled():
+                return self._cancelled(engine, filename, temp_path)
+            if not completed:
+                raise TransientError(f"数据传输中断 (IncompleteRead): 接收了{received}字节, 预计{expected}字节")
+            engine._check_sha256(filename, extractor.digest.hexdigest(), temp_path if keep else None)
+        except IntegrityError:
+            # 损坏的数据无法续传, 下次从头下载和解压
+            extractor.reset()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        except Exception:
+            if not engine.is_cancelled():
+                raise
+            return self._cancelled(engine, filename, temp_path)
+        finally:
+            engine._release(response, completed)
+        return self._complete(engine, filename, target, temp_path, extractor, keep)
+
+    @staticmethod
+    def _replay(extractor, path, end):
+        """把本地部分下载的归档中解压器还没处理的数据交给解压器"""
+        if extractor.position >= end:
+            return
+        with open(path, "rb") as f:
+            f.seek(extractor.position)
+            while extractor.position < end:
+                data = f.read(min(1024 * 1024, end - extractor.position))
+                if not data:
+                    break
+                extractor.feed(data)
+
+    def _cancelled(self, engine, filename, temp_path):
+        # 保留归档时.incomplete文件可以续传, 已解压的部分下次重新生成
+        self._drop(filename)
+        engine._record_partial(filename, os.path.getsize(temp_path) if os.path.exists(temp_path) else 0)
+        return False
+
+    def _complete(self, engine, filename, target, temp_path, extractor, keep):
+        try:
+            extractor.finish(temp_path if keep else None)
+        except IntegrityError:
+            extractor.reset()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        except ArchiveError as e:
+            self._drop(filename)
+            if not keep:
+                raise ArchiveError(f"{e} (未保留归档, 可保留归档后重新下载)")
+            # 归档本身已完整下载, 只是无法解压
+            os.replace(temp_path, target)
+            engine.tracker.add_extracted_archive(filename, 0, 0, extraction_dir(target), error=str(e))
+            return True
+        if keep and self.keep_archives:
+            os.replace(temp_path, target)
+        else:
+            for path in (temp_path, target):
+                if os.path.exists(path):
+                    os.remove(path)
+        self._commit(engine, filename, extractor, extractor.position, extractor.digest.hexdigest())
+        return True
+
+    def _extract_local(self, engine, filename, target, extractor):
+        size = os.path.getsize(target)
+        try:
+            extractor.extract_file(target)
+        except (ArchiveError, IntegrityError) as e:
+            self._drop(filename)
+            engine.tracker.add_bytes(filename, size, resumed=True)
+            engine.tracker.add_extracted_archive(filename, 0, 0, extractor.dest, error=str(e))
+            return True
+        engine.tracker.add_bytes(filename, size, resumed=True)
+        if not self.keep_archives:
+            os.remove(target)
+        # 本地归档与下载引擎跳过同样大小的文件时一样不再校验, 记录仓库元数据中的sha256
+        self._commit(engine, filename, extractor, size, engine.expected_sha256.get(filename))
+        return True
+
+    def _commit(self, engine, filename, extractor, size, sha256):
+        extractor.commit({"archive": filename, "size": size, "sha256": sha256, "files": extractor.files,
+                          "bytes": extractor.bytes, "archive_kept": self.keep_archives})
+        with self.lock:
+            self.extractors.pop(filename, None)
+        if extractor.skipped:
+            engine.tracker.log(f"{filename} 中有 {len(extractor.skipped)} 个链接、设备文件或不安全的路径未解压 "
+                               f"(如 {extractor.skipped[0]})")
+        engine.tracker.add_extracted_archive(filename, extractor.files, extractor.bytes, extractor.dest)
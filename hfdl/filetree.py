@@ -0,0 +1,161 @@
+"""文件选择器使用的仓库目录树和选择状态 (不依赖tkinter)"""
+import glob
+
+class FileTree:
+    """由仓库元数据构建的目录树, 记录每个目录的总大小和文件数
+
+    构建时只做一次线性扫描, 子节点列表在第一次展开时才排序, 适合几万个文件的数据集仓库。
+    选择状态只保存用户勾选过的节点 (marks), 文件是否下载由离它最近的带标记的上级决定,
+    没有标记时使用default_selected。to_patterns把选择转换为允许模式或忽略模式。
+    """
+    def __init__(self, files):
+        self.sizes = {}          # 文件 -> 字节数
+        self.dir_sizes = {"": 0}
+        self.dir_counts = {"": 0}
+        self.child_dirs = {"": set()}
+        self.child_files = {"": []}
+        self.sorted_children = {}  # 目录 -> [(路径, 是否目录)], 第一次访问时生成
+        self.default_selected = True
+        self.marks = {}          # 路径 -> 是否下载
+        for filename, info in files.items():
+            size = info["size"] if isinstance(info, dict) else info
+            self.sizes[filename] = size
+            parent = self._add_dirs(filename)
+            self.child_files[parent].append(filename)
+            directory = parent
+            while True:
+                self.dir_sizes[directory] += size
+                self.dir_counts[directory] += 1
+                if not directory:
+                    break
+                directory = self.parent(directory)
+
+    @staticmethod
+    def parent(path):
+        return path.rsplit("/", 1)[0] if "/" in path else ""
+
+    @staticmethod
+    def name(path):
+        return path.rsplit("/", 1)[-1]
+
+    def _add_dirs(self, filename):
+        """登记filename的所有上级目录, 返回直接上级"""
+        parent = self.parent(filename)
+        directory, child = parent, None
+        while directory not in self.child_dirs:
+            self.child_dirs[directory] = {child} if child is not None else set()
+            self.child_files[directory] = []
+            self.dir_sizes[directory] = 0
+            self.dir_counts[directory] = 0
+            directory, child = self.parent(directory), directory
+        if child is not None:
+            self.child_dirs[directory].add(child)
+        return parent
+
+    def is_dir(self, path):
+        return path in self.child_dirs
+
+    def children(self, directory=""):
+        """返回 [(路径, 是否目录)], 目录在前, 各自按名称排序"""
+        children = self.sorted_children.get(directory)
+        if children is None:
+            children = ([(d, True) for d in sorted(self.child_dirs[directory])] +
+                        [(f, False) for f in sorted(self.child_files[directory])])
+            self.sorted_children[directory] = children
+        return children
+
+    def size(self, path):
+        return self.dir_sizes[path] if self.is_dir(path) else self.sizes[path]
+
+    def file_count(self, path):
+        return self.dir_counts[path] if self.is_dir(path) else 1
+
+    # --- 选择状态 ---
+
+    def is_selected(self, path):
+        """path (或其所在目录) 当前是否下载, 只看离它最近的标记"""
+        while True:
+            if path in self.marks:
+                return self.marks[path]
+            if not path:
+                return self.default_selected
+            path = self.parent(path)
+
+    def set_selected(self, path, selected):
+        """设置文件或整个目录是否下载, 目录下原有的标记被清除"""
+        if self.is_dir(path):
+            prefix = path + "/" if path else ""
+            for marked in [m for m in self.marks if m.startswith(prefix)]:
+                del self.marks[marked]
+        if not path:
+            self.default_selected = selected
+            return
+        self.marks.pop(path, None)
+        if self.is_selected(path) != selected:
+            self.marks[path] = selected
+
+    def select_all(self, selected):
+        self.set_selected("", selected)
+
+    def state(self, path):
+        """返回 "selected"、"unselected" 或 "partial" (目录中部分文件被选中)"""
+        selected = self.is_selected(path)
+        if self.is_dir(path):
+            prefix = path + "/" if path else ""
+            if any(m.startswith(prefix) and value != selected for m, value in self.marks.items()):
+                return "partial"
+        return "selected" if selected else "unselected"
+
+    def _has_marks_below(self, directory):
+        prefix = directory + "/" if directory else ""
+        return any(m.startswith(prefix) for m in self.marks)
+
+    def selection_totals(self, directory=""):
+        """返回directory中被选中的 (文件数, 字节数)"""
+        if not self._has_marks_below(directory):
+            if self.is_selected(directory):
+                return self.dir_counts[directory], self.dir_sizes[directory]
+            return 0, 0
+        count, size = 0, 0
+        for path, is_dir in self.children(directory):
+            if is_dir:
+                sub_count, sub_size = self.selection_totals(path)
+                count += sub_count
+                size += sub_size
+            elif self.is_selected(path):
+                count += 1
+                size += self.sizes[path]
+        return count, size
+
+    def _cover(self, directory, selected):
+        """选出覆盖directory中所有 (被选中/未选中) 文件的最少目录和文件"""
+        if not self._has_marks_below(directory):
+            return [directory] if self.is_selected(directory) == selected else []
+        cover = []
+        for path, is_dir in self.children(directory):
+            if is_dir:
+                cover.extend(self._cover(path, selected))
+            elif self.is_selected(path) == selected:
+                cover.append(path)
+        # 目录中的文件全部被覆盖时用目录本身代替
+        if directory and sum(self.file_count(p) for p in cover) == self.dir_counts[directory]:
+            return [directory]
+        return cover
+
+    def to_patterns(self):
+        """把当前选择转换为 ("allow", 模式列表) 或 ("ignore", 模式列表), 选用模式较少的一种
+
+        全部选中时返回 ("ignore", []), 全部未选中时返回 ("ignore", ["*"]);
+        模式中的特殊字符已转义, 目录以"/"结尾; 逗号是模式列表的分隔符, 用"?"代替。
+        """
+        def patterns(paths):
+            if paths == [""]:
+                return ["*"]
+            escaped = [glob.escape(p).replace(",", "?") for p in paths]
+            return [e + "/" if self.is_dir(p) else e for p, e in zip(paths, escaped)]
+
+        ignore = patterns(self._cover("", False))
+        allow = patterns(self._cover("", True))
+        if allow and len(allow) < len(ignore):
+            return "allow", allow
+        return "ignore", ignore
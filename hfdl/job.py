@@ -0,0 +1,556 @@
+"""完整的仓库下载任务, 由GUI、命令行和库调用共用"""
+import os
+import threading
+
+from .constants import (DEFAULT_ENDPOINT, DEFAULT_REVISION, DEFAULT_REPO_TYPE, DEFAULT_MAX_WORKERS,
+                        DEFAULT_SEGMENTS, DEFAULT_ASYNC_MEDIAN_THRESHOLD)
+from .adaptive import AdaptiveConcurrency, DEFAULT_ADAPTIVE_MAX_CONNECTIONS
+from .asyncengine import AsyncDownloadEngine
+from .diskio import check_free_space, free_space
+from .engine import DownloadEngine
+from .extract import ArchiveExtraction
+from .manifest import load_manifest, save_manifest, new_manifest, make_entry, plan_sync, prune_files
+from .metadata import get_repo_metadata
+from .mirrors import EndpointSelector
+from .schedule import schedule_files
+from .session import HttpSession
+from .tensors import TensorDownloader, TensorIndex, split_tensor_files
+from .tracker import DownloadTracker
+from .utils import filter_repo_files, format_size, repo_path
+from .verify import verify_directory
+
+class DownloadJob:
+    """下载一个仓库: 获取文件列表和大小, 按允许模式和忽略模式过滤后交给DownloadEngine
+
+    repo_type为"model" (默认)、"dataset"或"space", 决定元数据接口和文件网址的前缀。
+
+    local_dir中的清单 (.hfdl-manifest.json) 记录了提交sha和每个文件的大小、修改时间、sha256,
+    再次运行时只用一次API调用对比远程文件列表, 只下载新增或变化的文件。
+    远程已删除的文件记录在deleted_files中, prune为True时直接删除, 否则可稍后调用prune_deleted。
+
+    mirrors为备用的Hub地址 (官方或兼容HF_ENDPOINT的镜像): 任务开始时对endpoint和所有镜像测速,
+    文件优先从最快的地址下载, 失败时换到下一个地址; 获取元数据时也按顺序尝试。
+
+    给出blob_store时, 本地内容存储中已有的LFS文件直接链接到local_dir,
+    新下载的LFS文件在完成后加入存储。use_symlinks决定优先使用符号链接还是硬链接。
+
+    任务的所有请求 (元数据、测速和文件下载) 共用一个HttpSession, 连接池按并发数设置容量。
+    proxies只作用于本任务, 格式为 {"http": 地址, "https": 地址}; None表示沿用环境变量, {}表示不使用代理。
+    给出metadata_cache (MetadataCache) 时仓库元数据优先从缓存读取, preview()可在下载前查看文件数和总大小。
+    retry_policy (RetryPolicy) 决定网络中断、5xx、429等可恢复错误的重试次数和退避时间。
+    metrics_log (MetricsLog) 接收每个文件的JSONL指标, metrics_server (MetricsServer) 在/metrics中输出本任务,
+    两者都可由多个任务共用。
+    transfer_mode为"threads"时用线程池下载; 为"async"时不超过8MB的文件改用asyncio的小文件模式
+    (AsyncDownloadEngine), 数百个请求共用少量keep-alive连接; 为"auto"时, 待下载文件大小的中位数
+    低于1MB且文件数不少于async_min_files时使用小文件模式。
+    文件按schedule.py的顺序下载: 配置、分词器和分片索引文件最先下载, 全部就绪后tracker发出
+    "metadata_ready"事件; 其余文件从大到小下载, 缩短整体用时。
+    tensors为张量名或通配符列表: 给出时safetensors分片只下载匹配的张量 (见tensors.py),
+    写出只包含这些张量的分片和精简的分片索引文件, 其他文件照常下载。
+    extract_archives为True时tar系列和zip归档边下载边解压到去掉扩展名的同名目录 (见extract.py),
+    keep_archives为False时不在磁盘上保留归档本身。
+    peers (PeerNetwork) 给出时LFS文件先从局域网节点获取 (见peers.py), 没有节点有该文件或传输失败时
+    再从Hub下载; peer_server (PeerServer) 给出时本任务的LFS文件下载完成后即可提供给其他节点。
+    两者都由调用方启动和停止, 可由多个任务共用。
+
+    示例::
+
+        job = DownloadJob("Systran/faster-whisper-large-v2", "./faster-whisper-large-v2")
+        succeeded = job.run()
+        print(job.tracker.get_summary())
+    """
+    free_space_reserve = 100 * 1024 * 1024  # 下载完成后保存位置至少还剩的空间
+    async_min_files = 32  # 自动选择小文件模式所需的最少文件数
+
+    def __init__(self, repo_id, local_dir, tracker=None, token=None, ignore_patterns=None, allow_patterns=None,
+                 revision=DEFAULT_REVISION, endpoint=DEFAULT_ENDPOINT, max_workers=DEFAULT_MAX_WORKERS,
+                 segments=DEFAULT_SEGMENTS, resume_download=True, use_symlinks=False,
+                 connection_limiter=None, blob_store=None, prune=False, adaptive=False,
+                 bandwidth_limiter=None, mirrors=None, proxies=None, metadata_cache=None, retry_policy=None,
+                 metrics_log=None, metrics_server=None, transfer_mode="auto", tensors=None,
+                 extract_archives=False, keep_archives=True, peers=None, peer_server=None,
+                 repo_type=DEFAULT_REPO_TYPE):
+        self.repo_id = repo_id
+        self.repo_type = repo_type
+        self.repo_path = repo_path(repo_id, repo_type)  # 仓库类型不正确时在这里抛出ValueError
+        self.local_dir = local_dir
+        self.tracker = tracker or DownloadTracker()
+        self.tracker.labels.update(repo_id=repo_id, revision=revision)
+        if metrics_log is not None:
+            self.tracker.metrics_log = metrics_log
+        if metrics_server is not None:
+            metrics_server.add(self.tracker)
+        self.token = token or os.environ.get("HF_TOKEN")
+        self.ignore_patterns = ignore_patterns
+        self.allow_patterns = allow_patterns
+        self.revision = revision
+        self.endpoint = endpoint
+        self.mirrors = [m for m in (mirrors or []) if m and m.rstrip("/") != endpoint.rstrip("/")]
+        self.max_workers = max_workers
+        self.segments = segments
+        self.resume_download = resume_download
+        self.use_symlinks = use_symlinks
+        self.connection_limiter = connection_limiter
+        self.blob_store = blob_store  # BlobStore, 启用后按LFS sha256跨仓库复用文件
+        self.prune = prune
+        self.adaptive = adaptive  # 为True时max_workers和segments只是初始值, 由AdaptiveConcurrency调整
+        self.bandwidth_limiter = bandwidth_limiter  # BandwidthLimiter, 可与其他任务共用
+        self.proxies = proxies
+        self.metadata_cache = metadata_cache
+        self.retry_policy = retry_policy
+        self.transfer_mode = transfer_mode  # "auto"、"threads"或"async"
+        self.tensors = tensors
+        self.extract_archives = extract_archives
+        self.keep_archives = keep_archives
+        self.peers = peers
+        self.peer_server = peer_server
+        self.deleted_files = []  # 远程已删除、但仍留在本地的文件
+        self.cancel_event = threading.Event()
+        self.session = None
+        self.engine = None
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        """取消任务, 可在任意线程中调用"""
+        self.cancel_event.set()
+        if self.engine is not None:
+            self.engine.cancel()
+
+    def run(self):
+        """执行下载并返回成功下载的文件列表, 获取元数据失败时抛出异常"""
+        tracker = self.tracker
+        tracker.start()
+        self.session = HttpSession(maxsize=self.pool_size(), proxies=self.proxies)
+        try:
+            tracker.log(f"仓库主页: {self.endpoint.rstrip('/')}/{self.repo_path}")
+            tracker.log(f"代理设置: {self.session.describe_proxies()}")
+            tracker.log(f"开始下载 {self.repo_id} 到 {self.local_dir}...")
+            if self.allow_patterns:
+                tracker.log(f"只下载匹配的文件: {', '.join(self.allow_patterns)}")
+            if self.ignore_patterns:
+                tracker.log(f"忽略文件模式: {', '.join(self.ignore_patterns)}")
+
+            # 获取仓库文件列表和大小, 按文件模式过滤后交给下载引擎
+            metadata = self.fetch_metadata()
+            file_sizes = {f: info["size"] for f, info in metadata["files"].items()}
+            files = filter_repo_files(file_sizes, self.ignore_patterns, self.allow_patterns)
+
+            os.makedirs(self.local_dir, exist_ok=True)
+
+            # 按张量下载时, safetensors分片和分片索引文件不走普通的下载流程
+            tensor_downloader, tensor_plans, tensor_indexes = None, [], []
+            if self.tensors:
+                files, shards, tensor_indexes = split_tensor_files(files)
+                tracker.log(f"只下载匹配的张量: {', '.join(self.tensors)}")
+                self.engine = self.create_engine()
+                tensor_downloader = TensorDownloader(self.engine, self.local_dir, metadata["files"], metadata["sha"])
+                tensor_plans = tensor_downloader.plan(self.tensors, shards, tensor_indexes)
+                selected = sum(len(plan.names) for plan in tensor_plans)
+                tracker.log(f"选中 {len(tensor_plans)} 个分片中的 {selected} 个张量, 共 "
+                            f"{format_size(sum(plan.size for plan in tensor_plans))} "
+                            f"(完整分片共 {format_size(sum(file_sizes[f] for f in shards))})")
+
+            # 先下载加载模型所需的小文件, 其余文件从大到小下载
+            files, ready_files = schedule_files(files, file_sizes)
+            tracker.set_ready_files(ready_files)
+            if ready_files:
+                tracker.log(f"优先下载 {len(ready_files)} 个配置和分词器文件, 其余文件按从大到小的顺序下载")
+
+            tracker.set_total_files(len(files) + len(tensor_plans))
+            expected_sizes = {f: file_sizes[f] for f in files}
+            expected_sizes.update((plan.shard, plan.size) for plan in tensor_plans)
+            tracker.set_file_sizes(expected_sizes)
+            if self.peer_server is not None:
+                # 已有的和之后下载完成的LFS文件都提供给局域网中的其他节点
+                lfs_files = {f: (metadata["files"][f]["sha256"], file_sizes[f])
+                             for f in files if metadata["files"][f]["sha256"]}
+                self.peer_server.share_files(self.local_dir, lfs_files)
+
+            if self.cancelled: # 用户可能在此期间取消下载
+                tracker.log("下载在开始前被取消。")
+                return []
+
+            # 与上次的清单对比, 跳过没有变化的文件
+            remote_files = metadata["files"]
+            manifest = load_manifest(self.local_dir, self.repo_id)
+            if manifest is not None and manifest.get("commit") == metadata["sha"]:
+                tracker.log(f"仓库提交未变化 ({metadata['sha'][:12]}), 只检查本地文件")
+            files, unchanged, self.deleted_files = plan_sync(manifest, self.local_dir, remote_files, files)
+            refresh = [f for f in files if manifest and f in manifest["files"]]
+            extraction = None
+            if self.extract_archives:
+                extraction = ArchiveExtraction(file_sizes, keep_archives=self.keep_archives)
+                # 已是最新但还没有解压的归档也交给下载引擎, 由引擎直接解压本地的归档
+                local_archives = [f for f in unchanged if extraction.handles(f) and not extraction.is_extracted(
+                    f, self.target_path(f), remote_files[f]["sha256"])]
+                if local_archives:
+                    files += local_archives
+                    unchanged = [f for f in unchanged if f not in local_archives]
+            if unchanged:
+                tracker.add_unchanged_files(unchanged)
+            if self.deleted_files:
+                self.handle_deleted_files()
+            if manifest is None:
+                manifest = new_manifest(self.repo_id, self.revision, metadata["sha"])
+            manifest["revision"] = self.revision
+            manifest["commit"] = metadata["sha"]
+
+            hashes = {f: remote_files[f]["sha256"] for f in files if remote_files[f]["sha256"]}
+            if extraction is not None:
+                archives = [f for f in files if extraction.handles(f)]
+                if archives:
+                    tracker.log(f"边下载边解压 {len(archives)} 个归档"
+                                + ("" if self.keep_archives else ", 不保留归档文件"))
+            reused = []
+            if self.blob_store is not None and files:
+                # 要解压的归档不从本地存储复用, 否则不会被解压
+                store_files = [f for f in files if extraction is None or not extraction.handles(f)]
+                reused = self.materialize_from_store(store_files, file_sizes, hashes)
+                reused_set = set(reused)
+                files = [f for f in files if f not in reused_set]
+            if (not files and not tensor_plans) or self.cancelled:
+                self.update_manifest(manifest, remote_files, reused)
+                return unchanged + reused
+
+            # 已解压过的归档会被跳过, 不计入需要写入的大小
+            pending = [f for f in files if extraction is None or not extraction.handles(f)
+                       or not extraction.is_extracted(f, self.target_path(f), hashes.get(f))]
+            self.check_free_space(pending, file_sizes, refresh, sum(plan.size for plan in tensor_plans
+                                                                    if not plan.matches(self.target_path(plan.shard))))
+
+            adaptive = None
+            max_workers = self.max_workers
+            if self.adaptive:
+                adaptive = AdaptiveConcurrency(tracker, initial=self.max_workers, initial_segments=self.segments)
+                max_workers = adaptive.max_connections
+                tracker.log(f"自适应并发: 从 {self.max_workers} 个连接开始, 根据吞吐在 "
+                            f"{adaptive.min_connections}-{adaptive.max_connections} 之间调整")
+            else:
+                tracker.log(f"使用 {self.max_workers} 个线程并发下载")
+            if self.bandwidth_limiter is not None:
+                tracker.log(f"带宽上限: {self.bandwidth_limiter.describe()}")
+            if self.peers is not None:
+                tracker.log(f"LFS文件先从局域网节点获取: {self.peers.describe()}")
+            succeeded = []
+            if files:
+                engine_class, engine_options = DownloadEngine, {}
+                if self.use_async(files, file_sizes):
+                    engine_class, engine_options = AsyncDownloadEngine, {"file_sizes": file_sizes}
+                self.engine = self.create_engine(engine_class, max_workers=max_workers, adaptive=adaptive,
+                                                 expected_sha256=hashes, extraction=extraction, **engine_options)
+                if self.mirrors:
+                    self.engine.endpoint_selector = self.probe_endpoints(files, file_sizes)
+                try:
+                    succeeded = self.engine.run(files, refresh=refresh)
+                finally:
+                    if extraction is not None:
+                        extraction.close()
+                if self.blob_store is not None:
+                    # 不保留的归档已不在磁盘上
+                    self.add_to_store([f for f in succeeded if os.path.isfile(self.target_path(f))], hashes)
+            self.update_manifest(manifest, remote_files, reused + succeeded)
+            if tensor_plans and not self.cancelled:
+                # 只包含部分张量的分片不记入清单, 之后的完整下载会重新下载它们
+                self.engine = tensor_downloader.engine
+                tensors = tensor_downloader.download(tensor_plans)
+                tensor_downloader.write_index([plan for plan in tensor_plans if plan.shard in tensors],
+                                              tensor_indexes)
+                succeeded += tensors
+            return unchanged + reused + succeeded
+        finally:
+            self.session.close()
+            tracker.end()
+
+    def create_engine(self, engine_class=DownloadEngine, max_workers=None, **options):
+        """创建使用本任务会话、限速器、调度器和重试策略的下载引擎"""
+        return engine_class(
+            self.repo_id, self.local_dir, self.tracker,
+            token=self.token,
+            max_workers=max_workers or self.max_workers,
+            segments=self.segments,
+            resume_download=self.resume_download,
+            revision=self.revision,
+            endpoint=self.endpoint,
+            should_continue=lambda: not self.cancelled,
+            connection_limiter=self.connection_limiter,
+            bandwidth_limiter=self.bandwidth_limiter,
+            session=self.session,
+            retry_policy=self.retry_policy,
+            peers=self.peers,
+            repo_type=self.repo_type,
+            **options
+        )
+
+    def pool_size(self):
+        """每个主机的连接池容量, 与同时进行的传输数一致"""
+        if self.adaptive:
+            return max(self.max_workers * self.segments, DEFAULT_ADAPTIVE_MAX_CONNECTIONS)
+        return max(1, self.max_workers * self.segments)
+
+    def use_async(self, files, file_sizes):
+        """按transfer_mode和待下载文件的大小决定是否使用小文件模式"""
+        if self.transfer_mode == "threads" or self.connection_limiter is not None or not files:
+            return False
+        if self.transfer_mode == "auto":
+            sizes = sorted(file_sizes[f] for f in files)
+            median = sizes[len(sizes) // 2]
+            if len(files) < self.async_min_files or median >= DEFAULT_ASYNC_MEDIAN_THRESHOLD:
+                return False
+            self.tracker.log(f"待下载的 {len(files)} 个文件大小中位数为 {format_size(median)}, 自动使用小文件模式")
+        return True
+
+    def fetch_metadata(self):
+        """依次从endpoint和各个镜像获取仓库元数据, 全部失败时抛出第一个错误"""
+        errors = []
+        for endpoint in [self.endpoint] + self.mirrors:
+            try:
+                metadata = get_repo_metadata(self.repo_id, token=self.token, revision=self.revision,
+                                             endpoint=endpoint, session=self.session, cache=self.metadata_cache,
+                                             repo_type=self.repo_type)
+            except Exception as e:
+                if not self.mirrors:
+                    raise
+                errors.append(e)
+                self.tracker.log(f"从 {endpoint} 获取仓库信息失败: {e}")
+                continue
+            if metadata["source"] == "cache":
+                self.tracker.log(f"使用缓存的仓库信息 (提交 {(metadata['sha'] or '')[:12]})")
+            elif metadata["source"] == "revalidated":
+                self.tracker.log("服务器确认缓存的仓库信息仍是最新")
+            return metadata
+        raise errors[0]
+
+    def load_metadata(self):
+        """在run之外获取仓库元数据 (预览和文件选择使用), 优先使用缓存"""
+        own_session = self.session is None
+        if own_session:
+            self.session = HttpSession(proxies=self.proxies)
+        try:
+            return self.fetch_metadata()
+        finally:
+            if own_session:
+                self.session.close()
+                self.session = None
+
+    def tensor_index(self):
+        """读取仓库中 (按文件模式过滤后) 所有safetensors分片的头部, 返回TensorIndex, 不下载张量数据"""
+        own_session = self.session is None
+        if own_session:
+            self.session = HttpSession(proxies=self.proxies)
+        try:
+            metadata = self.fetch_metadata()
+            files = filter_repo_files(metadata["files"], self.ignore_patterns, self.allow_patterns)
+            shards = split_tensor_files(files)[1]
+            downloader = TensorDownloader(self.create_engine(), self.local_dir, metadata["files"], metadata["sha"])
+            downloader.index_shards(shards)
+            index = downloader.index
+            return TensorIndex(index.commit, {shard: index.shards[shard] for shard in shards if shard in index.shards})
+        finally:
+            if own_session:
+                self.session.close()
+                self.session = None
+
+    def required_space(self, files, file_sizes, refresh=()):
+        """估算下载files还需要写入的字节数: 扣除已有的部分下载, 本地大小一致且无需刷新的文件会被跳过"""
+        refresh = set(refresh)
+        required = 0
+        for filename in files:
+            target = self.target_path(filename)
+            size = file_sizes[filename]
+            if filename not in refresh and os.path.isfile(target) and os.path.getsize(target) == size:
+                continue
+            partial = target + ".incomplete"
+            # 分段下载的临时文件已预分配完整大小, 单连接下载的临时文件大小就是已下载的部分
+            required += max(0, size - os.path.getsize(partial)) if os.path.isfile(partial) else size
+        return required
+
+    def check_free_space(self, files, file_sizes, refresh=(), extra=0):
+        """开始下载前检查保存位置的剩余空间, 不足时抛出DiskError, 避免下载到一半才写满磁盘
+
+        extra为files之外还要写入的字节数 (按张量下载的分片)。
+        """
+        required = self.required_space(files, file_sizes, refresh) + extra
+        free = check_free_space(self.local_dir, required, self.free_space_reserve)
+        self.tracker.log(f"需要写入 {format_size(required)}, 保存位置可用空间 {format_size(free)}")
+
+    def preview(self):
+        """下载前预览: 获取元数据 (优先使用缓存) 并按文件模式过滤, 不下载任何文件
+
+        返回 {"commit", "files", "total_bytes", "ignored_files", "ignored_bytes",
+        "download_files", "download_bytes", "free_bytes", "largest"}, download_*扣除了清单中已是最新的文件。
+        """
+        metadata = self.load_metadata()
+        remote_files = metadata["files"]
+        files = filter_repo_files(remote_files, self.ignore_patterns, self.allow_patterns)
+        sizes = {f: remote_files[f]["size"] for f in files}
+        manifest = load_manifest(self.local_dir, self.repo_id)
+        to_download = plan_sync(manifest, self.local_dir, remote_files, files)[0] if manifest else files
+        total_bytes = sum(sizes.values())
+        return {
+            "commit": metadata["sha"],
+            "files": len(files),
+            "total_bytes": total_bytes,
+            "ignored_files": len(remote_files) - len(files),
+            "ignored_bytes": sum(info["size"] for info in remote_files.values()) - total_bytes,
+            "download_files": len(to_download),
+            "download_bytes": sum(sizes[f] for f in to_download),
+            "free_bytes": free_space(self.local_dir),
+            "largest": sorted(sizes.items(), key=lambda item: item[1], reverse=True)[:5],
+        }
+
+    def probe_endpoints(self, files, file_sizes):
+        """用待下载的最大文件对所有地址测速, 返回排好序的EndpointSelector"""
+        selector = EndpointSelector([self.endpoint] + self.mirrors, self.tracker)
+        sizes = sorted(file_sizes[f] for f in files)
+        sample = max(files, key=lambda f: file_sizes[f])
+        self.tracker.log(f"正在对 {len(selector.endpoints)} 个下载地址测速...")
+        selector.probe(self.engine, sample, sizes[len(sizes) // 2])
+        return selector
+
+    def update_manifest(self, manifest, remote_files, filenames):
+        """把本次完成的文件写入清单, 去掉远程已不存在的文件"""
+        entries = manifest["files"]
+        for filename in list(entries):
+            if filename not in remote_files and filename not in self.deleted_files:
+                del entries[filename]
+        for filename in filenames:
+            try:
+                entries[filename] = make_entry(self.local_dir, filename, remote_files[filename])
+            except OSError:
+                entries.pop(filename, None)
+        try:
+            save_manifest(self.local_dir, manifest)
+        except OSError as e:
+            self.tracker.log(f"无法保存下载清单: {e}")
+
+    def handle_deleted_files(self):
+        preview = ", ".join(self.deleted_files[:5]) + (" ..." if len(self.deleted_files) > 5 else "")
+        if self.prune:
+            self.prune_deleted()
+        else:
+            self.tracker.log(f"远程仓库已删除 {len(self.deleted_files)} 个本地仍保留的文件: {preview}"
+                             f" (可选择清理这些文件)")
+
+    def prune_deleted(self):
+        """删除远程已不存在的本地文件, 返回删除的文件"""
+        removed = prune_files(self.local_dir, self.deleted_files)
+        if removed:
+            manifest = load_manifest(self.local_dir, self.repo_id)
+            if manifest is not None:
+                for filename in removed:
+                    manifest["files"].pop(filename, None)
+                save_manifest(self.local_dir, manifest)
+            self.tracker.log(f"已清理 {len(removed)} 个远程已删除的文件")
+        removed_set = set(removed)
+        self.deleted_files = [f for f in self.deleted_files if f not in removed_set]
+        return removed
+
+    def target_path(self, filename):
+        return os.path.join(self.local_dir, *filename.split("/"))
+
+    def materialize_from_store(self, files, file_sizes, hashes):
+        """把内容存储中已有的文件链接到local_dir, 返回这些文件"""
+        reused = []
+        for filename in files:
+            sha256 = hashes.get(filename)
+            if self.cancelled:
+                break
+            if not sha256 or not self.blob_store.has(sha256, file_sizes[filename]):
+                continue
+            try:
+                mode = self.blob_store.materialize(sha256, self.target_path(filename), self.use_symlinks)
+            except OSError as e:
+                self.tracker.log(f"无法从本地存储复用 {filename}, 改为下载: {e}")
+                continue
+            self.tracker.add_bytes(filename, file_sizes[filename], resumed=True)
+            self.tracker.add_deduplicated_file(filename, file_sizes[filename], mode)
+            self.tracker.add_downloaded_file(filename)
+            reused.append(filename)
+        if reused:
+            self.tracker.log(f"从本地存储复用了 {len(reused)} 个文件, "
+                             f"节省下载 {format_size(self.tracker.deduplicated_bytes)}")
+        return reused
+
+    def add_to_store(self, filenames, hashes):
+        """校验新下载的LFS文件并加入内容存储"""
+        for filename in filenames:
+            sha256 = hashes.get(filename)
+            if not sha256 or self.cancelled:
+                continue
+            try:
+                verified = filename in self.engine.verified_files
+                if self.blob_store.ingest(self.target_path(filename), sha256, self.use_symlinks, verified) is None:
+                    self.tracker.log(f"{filename} 的sha256与仓库元数据不一致 (或是符号链接), 未加入本地存储")
+            except OSError as e:
+                self.tracker.log(f"无法把 {filename} 加入本地存储: {e}")
+
+class VerifyJob:
+    """校验local_dir中已有的文件, 不下载任何内容
+
+    默认使用目录中的下载清单; 给出repo_id时改为对比仓库元数据 (LFS文件用sha256,
+    其他文件用git blob id), repo_type为仓库类型。文件在进程池中用mmap读取并计算哈希。
+    """
+    def __init__(self, local_dir, tracker=None, repo_id=None, token=None, revision=DEFAULT_REVISION,
+                 endpoint=DEFAULT_ENDPOINT, processes=None, proxies=None, repo_type=DEFAULT_REPO_TYPE):
+        self.local_dir = local_dir
+        self.tracker = tracker or DownloadTracker()
+        self.repo_id = repo_id
+        self.repo_type = repo_type
+        self.token = token or os.environ.get("HF_TOKEN")
+        self.revision = revision
+        self.endpoint = endpoint
+        self.processes = processes
+        self.proxies = proxies
+        self.cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        """执行校验并返回校验失败的文件列表, 找不到可对比的哈希时抛出ValueError"""
+        tracker = self.tracker
+        tracker.start()
+        session = None
+        try:
+            if self.repo_id:
+                tracker.log(f"从仓库 {self.repo_id} 获取文件哈希...")
+                session = HttpSession(proxies=self.proxies)
+                files = get_repo_metadata(self.repo_id, token=self.token, revision=self.revision,
+                                          endpoint=self.endpoint, session=session,
+                                          repo_type=self.repo_type)["files"]
+            else:
+                manifest = load_manifest(self.local_dir)
+                if manifest is None:
+                    raise ValueError(f"{self.local_dir} 中没有下载清单, 请指定仓库ID")
+                files = manifest["files"]
+            tracker.log(f"开始校验 {self.local_dir} 中的 {len(files)} 个文件...")
+            return verify_directory(self.local_dir, files, tracker, processes=self.processes,
+                                    should_continue=lambda: not self.cancelled)
+        finally:
+            if session is not None:
+                session.close()
+            tracker.end()
+
+def format_preview(preview):
+    """把DownloadJob.preview()的结果格式化为多行文本"""
+    lines = [f"仓库提交: {preview['commit']}",
+             f"文件数: {preview['files']}, 总大小: {format_size(preview['total_bytes'])}"]
+    if preview["ignored_files"]:
+        lines.append(f"按文件模式排除: {preview['ignored_files']} 个文件, {format_size(preview['ignored_bytes'])}")
+    if preview["download_files"] != preview["files"]:
+        lines.append(f"需要下载: {preview['download_files']} 个文件, {format_size(preview['download_bytes'])} "
+                     f"(其余已是最新)")
+    lines.append(f"保存位置可用空间: {format_size(preview['free_bytes'])}")
+    if preview["download_bytes"] > preview["free_bytes"]:
+        lines.append("警告: 可用空间不足, 请调整忽略模式或更换保存位置")
+    if preview["largest"]:
+        lines.append("最大的文件:")
+        lines.extend(f"  {filename}  {format_size(size)}" for filename, size in preview["largest"])
+    return "\n".join(lines)
@@ -0,0 +1,364 @@
+"""多仓库下载队列和全局连接调度"""
+import os
+import json
+import time
+import uuid
+import threading
+
+from .constants import DEFAULT_REVISION, DEFAULT_REPO_TYPE, DEFAULT_SEGMENTS, DEFAULT_CACHE_DIR
+from .job import DownloadJob
+from .tracker import DownloadTracker
+from .utils import repo_path
+
+DEFAULT_QUEUE_FILE = os.path.join(DEFAULT_CACHE_DIR, "queue.json")
+DEFAULT_MAX_CONNECTIONS = 16      # 所有任务合计的最大连接数
+DEFAULT_PER_JOB_CONNECTIONS = 8   # 单个仓库的最大连接数
+DEFAULT_MAX_ACTIVE_JOBS = 3       # 同时进行的仓库数
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+class ConnectionLimiter:
+    """在多个下载任务之间分配连接名额
+
+    总连接数不超过max_connections, 每个任务不超过各自的上限。有名额空出时,
+    先分给优先级最高的等待任务, 同优先级时分给当前连接数最少的任务,
+    所以大仓库排满的文件不会挡住小仓库, 带宽在同优先级任务之间大致平分。
+    """
+    def __init__(self, max_connections=DEFAULT_MAX_CONNECTIONS):
+        self.max_connections = max(1, int(max_connections))
+        self.cond = threading.Condition()
+        self.jobs = {}  # 任务键 -> {"priority", "limit", "active", "waiting", "seq"}
+        self.total_active = 0
+        self._seq = 0
+
+    def register(self, key, priority=0, limit=DEFAULT_PER_JOB_CONNECTIONS):
+        """登记一个任务, 返回供DownloadEngine使用的JobConnections"""
+        with self.cond:
+            self._seq += 1
+            self.jobs[key] = {"priority": priority, "limit": max(1, int(limit)),
+                              "active": 0, "waiting": 0, "seq": self._seq}
+        return JobConnections(self, key)
+
+    def unregister(self, key):
+        with self.cond:
+            job = self.jobs.pop(key, None)
+            if job:
+                self.total_active -= job["active"]
+            self.cond.notify_all()
+
+    def set_priority(self, key, priority):
+        with self.cond:
+            if key in self.jobs:
+                self.jobs[key]["priority"] = priority
+                self.cond.notify_all()
+
+    def set_max_connections(self, max_connections):
+        with self.cond:
+            self.max_connections = max(1, int(max_connections))
+            self.cond.notify_all()
+
+    def _next_job(self):
+        """在还能获得名额的等待任务中选出下一个"""
+        candidates = [(-job["priority"], job["active"], job["seq"], key)
+                      for key, job in self.jobs.items()
+                      if job["waiting"] and job["active"] < job["limit"]]
+        return min(candidates)[3] if candidates else None
+
+    def acquire(self, key, timeout=None):
+        """申请一个连接名额, 超时返回False"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self.cond:
+            job = self.jobs[key]
+            job["waiting"] += 1
+            try:
+                while not (self.total_active < self.max_connections and self._next_job() == key):
+                    remaining = None if deadline is None else deadline - time.time()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self.cond.wait(remaining)
+                job["active"] += 1
+                self.total_active += 1
+                return True
+            finally:
+                job["waiting"] -= 1
+                # 自己不再等待后, 其他任务可能成为下一个
+                self.cond.notify_all()
+
+    def release(self, key):
+        with self.cond:
+            job = self.jobs.get(key)
+            if job and job["active"] > 0:
+                job["active"] -= 1
+                self.total_active -= 1
+            self.cond.notify_all()
+
+    def snapshot(self):
+        with self.cond:
+            return {key: job["active"] for key, job in self.jobs.items()}
+
+class JobConnections:
+    """绑定到单个任务的连接名额接口 (acquire/release)"""
+    def __init__(self, limiter, key):
+        self.limiter = limiter
+        self.key = key
+
+    def acquire(self, timeout=None):
+        return self.limiter.acquire(self.key, timeout)
+
+    def release(self):
+        self.limiter.release(self.key)
+
+class DownloadQueue:
+    """持久化的多仓库下载队列
+
+    队列保存在JSON文件中, 每个条目有自己的保存位置、忽略模式和优先级。
+    程序重启后未完成的条目 (包括上次运行到一半的) 会重新排队。
+    HF Token不会写入队列文件。
+    """
+    def __init__(self, path=DEFAULT_QUEUE_FILE, token=None, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 per_job_connections=DEFAULT_PER_JOB_CONNECTIONS, max_active_jobs=DEFAULT_MAX_ACTIVE_JOBS,
+                 segments=DEFAULT_SEGMENTS, resume_download=True, listener=None, job_options=None):
+        self.path = path
+        self.token = token
+        self.per_job_connections = per_job_connections
+        self.max_active_jobs = max(1, int(max_active_jobs))
+        self.segments = segments
+        self.resume_download = resume_download
+        self.listener = listener  # listener(条目ID, 事件名, 数据字典)
+        self.job_options = job_options or {}  # 传给每个DownloadJob的其他参数
+        self.limiter = ConnectionLimiter(max_connections)
+        self.lock = threading.RLock()
+        self.wakeup = threading.Event()
+        self.entries = []
+        self.jobs = {}      # 条目ID -> 正在运行的DownloadJob
+        self.threads = {}
+        self.running = False
+        self.scheduler_thread = None
+        self.load()
+
+    # --- 持久化 ---
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        entries = data.get("jobs", [])
+        for entry in entries:
+            # 上次退出时正在下载的条目重新排队, 依靠断点续传继续
+            if entry.get("status") == RUNNING:
+                entry["status"] = PENDING
+        with self.lock:
+            self.entries = entries
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            data = {"version": 1, "jobs": self.entries}
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+    # --- 队列操作 ---
+
+    def add(self, repo_id, local_dir=None, ignore_patterns=None, revision=DEFAULT_REVISION,
+            priority=0, max_connections=None, allow_patterns=None, repo_type=DEFAULT_REPO_TYPE):
+        """加入一个仓库, 返回队列条目; repo_type不正确时抛出ValueError"""
+        repo_path(repo_id, repo_type)
+        entry = {
+            "id": uuid.uuid4().hex[:8],
+            "repo_id": repo_id,
+            "repo_type": repo_type,
+            "local_dir": local_dir or os.path.join(".", repo_id.split('/')[-1]),
+            "ignore_patterns": ignore_patterns,
+            "allow_patterns": allow_patterns,
+            "revision": revision,
+            "priority": int(priority),
+            "max_connections": max_connections,
+            "status": PENDING,
+            "added_at": time.time(),
+            "finished_at": None,
+            "downloaded_files": 0,
+            "failed_files": 0,
+            "error": None,
+        }
+        with self.lock:
+            self.entries.append(entry)
+            self.save()
+        self.wakeup.set()
+        return entry
+
+    def get(self, entry_id):
+        with self.lock:
+            for entry in self.entries:
+                if entry["id"] == entry_id:
+                    return entry
+        raise KeyError(entry_id)
+
+    def remove(self, entry_id):
+        """移除条目, 正在下载的条目会先被取消"""
+        with self.lock:
+            job = self.jobs.get(entry_id)
+            if job is not None:
+                job.cancel()
+            self.entries = [e for e in self.entries if e["id"] != entry_id]
+            self.save()
+
+    def set_priority(self, entry_id, priority):
+        with self.lock:
+            entry = self.get(entry_id)
+            entry["priority"] = int(priority)
+            self.save()
+        self.limiter.set_priority(entry_id, int(priority))
+        self.wakeup.set()
+
+    def retry(self, entry_id):
+        """把失败或已取消的条目重新排队"""
+        with self.lock:
+            entry = self.get(entry_id)
+            if entry["status"] in (FAILED, CANCELLED, DONE):
+                entry["status"] = PENDING
+                entry["error"] = None
+                self.save()
+        self.wakeup.set()
+
+    def clear_finished(self):
+        with self.lock:
+            self.entries = [e for e in self.entries if e["status"] != DONE]
+            self.save()
+
+    def pending_entries(self):
+        """按优先级 (高优先) 和加入时间排序的待下载条目"""
+        with self.lock:
+            pending = [e for e in self.entries if e["status"] == PENDING]
+        return sorted(pending, key=lambda e: (-e["priority"], e["added_at"]))
+
+    def snapshot(self):
+        with self.lock:
+            return [dict(entry) for entry in self.entries]
+
+    # --- 调度 ---
+
+    def start(self):
+        """在后台线程中开始处理队列"""
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+        self.scheduler_thread = threading.Thread(target=self._schedule_loop, name="hf-queue", daemon=True)
+        self.scheduler_thread.start()
+
+    def stop(self, cancel_running=True):
+        """停止调度; 正在下载的条目取消后重新标记为待下载, 下次启动时续传"""
+        with self.lock:
+            self.running = False
+            jobs = list(self.jobs.values()) if cancel_running else []
+        for job in jobs:
+            job.cancel()
+        self.wakeup.set()
+
+    def wait(self, timeout=None):
+        """等待调度线程结束 (队列全部处理完或被停止)"""
+        if self.scheduler_thread is not None:
+            self.scheduler_thread.join(timeout)
+            return not self.scheduler_thread.is_alive()
+        return True
+
+    @property
+    def is_idle(self):
+        with self.lock:
+            return not self.jobs and not any(e["status"] == PENDING for e in self.entries)
+
+    def _schedule_loop(self):
+        while True:
+            with self.lock:
+                if not self.running:
+                    if not self.jobs:
+                        break
+                else:
+                    for entry in self.pending_entries()[:max(0, self.max_active_jobs - len(self.jobs))]:
+                        self._start_entry(entry)
+                    if not self.jobs and not self.pending_entries():
+                        self.running = False
+                        break
+            self.wakeup.wait(1.0)
+            self.wakeup.clear()
+
+    def _start_entry(self, entry):
+        entry_id = entry["id"]
+        connections = self.limiter.register(entry_id, priority=entry["priority"],
+                                            limit=entry.get("max_connections") or self.per_job_connections)
+        tracker = DownloadTracker(listener=lambda event, data: self._emit(entry_id, event, data))
+        job = DownloadJob(
+            entry["repo_id"], entry["local_dir"], tracker,
+            token=self.token,
+            ignore_patterns=entry.get("ignore_patterns"),
+            allow_patterns=entry.get("allow_patterns"),
+            revision=entry.get("revision") or DEFAULT_REVISION,
+            repo_type=entry.get("repo_type") or DEFAULT_REPO_TYPE,
+            max_workers=entry.get("max_connections") or self.per_job_connections,
+            segments=self.segments,
+            resume_download=self.resume_download,
+            connection_limiter=connections,
+            **self.job_options
+        )
+        entry["status"] = RUNNING
+        entry["error"] = None
+        self.jobs[entry_id] = job
+        self.save()
+        self._emit(entry_id, "job_start", {"repo_id": entry["repo_id"],
+                                           "message": f"[{entry['repo_id']}] 开始下载"})
+        thread = threading.Thread(target=self._run_entry, args=(entry, job), name=f"hf-queue-{entry_id}", daemon=True)
+        self.threads[entry_id] = thread
+        thread.start()
+
+    def _run_entry(self, entry, job):
+        entry_id = entry["id"]
+        error = None
+        try:
+            job.run()
+        except Exception as e:
+            error = str(e)
+        finally:
+            self.limiter.unregister(entry_id)
+        tracker = job.tracker
+        with self.lock:
+            self.jobs.pop(entry_id, None)
+            self.threads.pop(entry_id, None)
+            entry["downloaded_files"] = tracker.downloaded_files
+            entry["failed_files"] = len(tracker.failed_files)
+            if job.cancelled:
+                # 被停止的条目回到待下载状态; 被移除的条目已不在队列中
+                entry["status"] = PENDING if not self.running else CANCELLED
+            elif error or tracker.failed_files:
+                entry["status"] = FAILED
+                entry["error"] = error or f"{len(tracker.failed_files)} 个文件下载失败"
+            else:
+                entry["status"] = DONE
+            entry["finished_at"] = time.time()
+            self.save()
+        self._emit(entry_id, "job_end", {"repo_id": entry["repo_id"], "status": entry["status"],
+                                         "error": entry["error"], "summary": tracker.get_summary(),
+                                         "message": f"[{entry['repo_id']}] {entry['status']}"})
+        self.wakeup.set()
+
+    def poll_progress(self):
+        """刷新所有正在下载的条目的速度统计, 返回 条目ID -> 统计数据"""
+        with self.lock:
+            jobs = list(self.jobs.items())
+        stats = {}
+        for entry_id, job in jobs:
+            if job.tracker.running:
+                stats[entry_id] = job.tracker.update_speed()
+        return stats
+
+    def _emit(self, entry_id, event, data):
+        if self.listener is not None:
+            self.listener(entry_id, event, data)
@@ -0,0 +1,101 @@
+"""保存在local_dir中的下载清单, 用于增量同步"""
+import os
+import json
+
+from .verify import hash_file
+
+MANIFEST_NAME = ".hfdl-manifest.json"
+MANIFEST_VERSION = 1
+
+def manifest_path(local_dir):
+    return os.path.join(local_dir, MANIFEST_NAME)
+
+def load_manifest(local_dir, repo_id=None):
+    """读取local_dir中的清单, 不存在、损坏或属于其他仓库时返回None (repo_id为None时不检查仓库)"""
+    try:
+        with open(manifest_path(local_dir), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION or (repo_id is not None and manifest.get("repo_id") != repo_id) \
+            or not isinstance(manifest.get("files"), dict):
+        return None
+    return manifest
+
+def save_manifest(local_dir, manifest):
+    path = manifest_path(local_dir)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def new_manifest(repo_id, revision, commit):
+    return {"version": MANIFEST_VERSION, "repo_id": repo_id, "revision": revision,
+            "commit": commit, "files": {}}
+
+def local_path(local_dir, filename):
+    return os.path.join(local_dir, *filename.split("/"))
+
+def make_entry(local_dir, filename, remote):
+    """为已下载的文件生成清单条目: 大小、修改时间、sha256和远程blob_id
+
+    非LFS文件的元数据中没有sha256, 在本地计算 (这类文件都很小)。
+    """
+    path = local_path(local_dir, filename)
+    stat = os.stat(path)
+    sha256 = remote.get("sha256")
+    if not sha256:
+        sha256 = hash_file(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256, "blob_id": remote.get("blob_id")}
+
+def is_unchanged(local_dir, filename, entry, remote):
+    """清单条目与远程文件一致, 且本地文件的大小和修改时间都没有变化"""
+    if entry is None or entry.get("size") != remote["size"]:
+        return False
+    if remote.get("sha256"):
+        if entry.get("sha256") != remote["sha256"]:
+            return False
+    elif not remote.get("blob_id") or entry.get("blob_id") != remote["blob_id"]:
+        return False
+    try:
+        stat = os.stat(local_path(local_dir, filename))
+    except OSError:
+        return False
+    return stat.st_size == entry["size"] and stat.st_mtime == entry.get("mtime")
+
+def plan_sync(manifest, local_dir, remote_files, files):
+    """对比清单和远程文件列表
+
+    files是过滤后需要同步的文件, 返回 (需要下载的文件, 已是最新的文件, 远程已删除的文件)。
+    远程已删除的文件只统计清单中记录过、且仍存在于本地的文件。
+    """
+    entries = manifest["files"] if manifest else {}
+    to_download, unchanged = [], []
+    for filename in files:
+        if is_unchanged(local_dir, filename, entries.get(filename), remote_files[filename]):
+            unchanged.append(filename)
+        else:
+            to_download.append(filename)
+    deleted = sorted(f for f in entries
+                     if f not in remote_files and os.path.lexists(local_path(local_dir, f)))
+    return to_download, unchanged, deleted
+
+def prune_files(local_dir, filenames):
+    """删除本地文件并清理留下的空目录, 返回实际删除的文件"""
+    removed = []
+    root = os.path.abspath(local_dir)
+    for filename in filenames:
+        path = local_path(local_dir, filename)
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        removed.append(filename)
+        parent = os.path.dirname(os.path.abspath(path))
+        while parent != root and parent.startswith(root):
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+    return removed
@@ -0,0 +1,128 @@
+"""仓库元数据查询和本地缓存"""
+import os
+import re
+import json
+import time
+import hashlib
+from urllib.parse import quote
+
+import urllib3
+
+from .constants import DEFAULT_ENDPOINT, DEFAULT_CACHE_DIR, DEFAULT_REPO_TYPE, USER_AGENT
+from .errors import AuthError, NotFoundError, http_error
+from .session import HttpSession
+from .utils import repo_path
+
+DEFAULT_METADATA_CACHE_DIR = os.path.join(DEFAULT_CACHE_DIR, "metadata")
+DEFAULT_METADATA_TTL = 600  # 秒
+
+class MetadataCache:
+    """仓库元数据的磁盘缓存, 每个 (地址, 仓库, 修订版本) 一个JSON文件
+
+    仓库以repo_path表示 (模型为repo_id, 数据集为 datasets/repo_id), 同名的模型和数据集互不影响。
+
+    获取时间在ttl秒以内的条目直接使用; 过期后带上ETag重新请求, 服务器返回304
+    或提交sha没有变化时只刷新获取时间。revision是完整的提交sha时内容不会再变, 永不过期。
+    ttl为0表示每次都向服务器确认。
+    """
+    def __init__(self, root=DEFAULT_METADATA_CACHE_DIR, ttl=DEFAULT_METADATA_TTL):
+        self.root = root
+        self.ttl = ttl
+
+    def path(self, endpoint, repo_id, revision):
+        key = hashlib.sha256(f"{endpoint}|{repo_id}|{revision}".encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.root, f"{key}.json")
+
+    def load(self, endpoint, repo_id, revision):
+        """读取缓存条目 {"fetched_at", "etag", "metadata"}, 不存在或损坏时返回None"""
+        try:
+            with open(self.path(endpoint, repo_id, revision), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("repo_id") != repo_id or "metadata" not in entry:
+            return None
+        return entry
+
+    def save(self, endpoint, repo_id, revision, metadata, etag=None):
+        """先写临时文件再替换, 写入失败时只是不缓存"""
+        path = self.path(endpoint, repo_id, revision)
+        entry = {"repo_id": repo_id, "endpoint": endpoint, "revision": revision, "fetched_at": time.time(),
+                 "etag": etag, "metadata": metadata}
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except OSError:
+            pass
+
+    def is_fresh(self, entry, revision):
+        if revision and re.fullmatch(r"[0-9a-f]{40}", revision) and entry["metadata"].get("sha") == revision:
+            return True
+        return time.time() - entry["fetched_at"] < self.ttl
+
+def get_repo_metadata(repo_id, token=None, revision=None, endpoint=None, session=None, cache=None,
+                      repo_type=DEFAULT_REPO_TYPE):
+    """获取仓库的提交sha和每个文件的大小、LFS sha256
+
+    repo_type为"model"、"dataset"或"space"。
+
+    请求通过session (HttpSession) 发出, 使用其中的代理和连接池; 不给出时临时创建一个。
+    给出cache (MetadataCache) 时优先使用未过期的缓存, 过期后按ETag和提交sha重新确认。
+    返回 {"sha": 提交sha, "files": {文件名: {"size": 字节数, "sha256": LFS sha256或None, "blob_id": git blob id}},
+    "source": "cache" (未过期的缓存) / "revalidated" (服务器确认缓存仍有效) / "network"}
+    """
+    endpoint = (endpoint or DEFAULT_ENDPOINT).rstrip("/")
+    path = repo_path(repo_id, repo_type)
+    cached = cache.load(endpoint, path, revision) if cache is not None else None
+    if cached is not None and cache.is_fresh(cached, revision):
+        return dict(cached["metadata"], source="cache")
+    own_session = session is None
+    if own_session:
+        session = HttpSession()
+    url = f"{endpoint}/api/{repo_type}s/{repo_id}"
+    if revision:
+        url += f"/revision/{quote(revision, safe='')}"
+    headers = {"User-Agent": USER_AGENT}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    if cached is not None and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    try:
+        response = session.request("GET", url, fields={"blobs": "true"}, headers=headers,
+                                   timeout=urllib3.Timeout(connect=10, read=60))
+    finally:
+        # 响应体已经读入内存, 临时创建的会话可以直接关闭
+        if own_session:
+            session.close()
+    if response.status == 304 and cached is not None:
+        cache.save(endpoint, path, revision, cached["metadata"], cached.get("etag"))
+        return dict(cached["metadata"], source="revalidated")
+    if response.status in (401, 403):
+        raise AuthError(f"无权访问仓库 {repo_id} (HTTP {response.status}), 私有或需授权的仓库请填写HF Token",
+                        status=response.status)
+    if response.status == 404:
+        missing = f"仓库 {repo_id} 或修订版本 {revision}" if revision else f"仓库 {repo_id}"
+        raise NotFoundError(f"{missing} 不存在 (HTTP 404)", status=404)
+    if response.status >= 400:
+        raise http_error(response, "获取仓库信息失败: HTTP")
+    info = json.loads(response.data)
+    files = {}
+    for sibling in info.get("siblings") or []:
+        lfs = sibling.get("lfs")
+        files[sibling["rfilename"]] = {"size": sibling.get("size") or 0, "sha256": lfs["sha256"] if lfs else None,
+                                       "blob_id": sibling.get("blobId")}
+    metadata = {"sha": info.get("sha"), "files": files}
+    if cache is not None:
+        cache.save(endpoint, path, revision, metadata, response.headers.get("ETag"))
+    unchanged = cached is not None and cached["metadata"].get("sha") == metadata["sha"]
+    return dict(metadata, source="revalidated" if unchanged else "network")
+
+def get_repo_file_sizes(repo_id, token=None, revision=None, endpoint=None, session=None, cache=None,
+                        repo_type=DEFAULT_REPO_TYPE):
+    """从仓库元数据获取 文件名 -> 字节数 的映射"""
+    metadata = get_repo_metadata(repo_id, token=token, revision=revision, endpoint=endpoint, session=session,
+                                 cache=cache, repo_type=repo_type)
+    return {filename: info["size"] for filename, info in metadata["files"].items()}
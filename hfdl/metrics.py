@@ -0,0 +1,164 @@
+"""机器可读的下载指标: 逐文件的JSONL记录和Prometheus文本格式的/metrics接口
+
+数据来自DownloadTracker: 每个文件结束 (成功、失败、取消后保留部分、增量同步时未变化) 时,
+tracker把一条记录写入metrics_log, 并累计到直方图中; MetricsServer在请求/metrics时读取
+已注册的所有tracker, 按其labels (仓库ID和修订版本) 分别输出。
+"""
+import json
+import threading
+from datetime import datetime
+from socketserver import ThreadingMixIn
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+TIME_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)  # 秒
+RATE_BUCKETS = tuple(2 ** n * 1024 for n in range(6, 20, 2))  # 64KB/s 到 128MB/s
+
+class Histogram:
+    """累积直方图, 与Prometheus的histogram类型对应"""
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def copy(self):
+        histogram = Histogram(self.buckets)
+        histogram.counts = list(self.counts)
+        histogram.count = self.count
+        histogram.sum = self.sum
+        return histogram
+
+class MetricsLog:
+    """把逐文件的记录以JSON Lines格式追加到文件, 可被多个任务共用"""
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8")
+        self.lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(dict(record, time=datetime.now().isoformat(timespec="milliseconds")),
+                          ensure_ascii=False)
+        with self.lock:
+            if self.file is not None:
+                self.file.write(line + "\n")
+                self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+# (名称, 类型, 说明, tracker快照中的字段)
+_METRICS = [
+    ("hfdl_files_total", "counter", "已结束的文件数, status为ok/deduplicated/unchanged/failed/partial", "files"),
+    ("hfdl_transferred_bytes_total", "counter", "通过网络接收的字节数", "transferred_bytes"),
+    ("hfdl_peer_bytes_total", "counter", "从局域网节点获取的字节数 (包含在transferred_bytes中)", "peer_bytes"),
+    ("hfdl_retries_total", "counter", "重试次数, kind为错误类型", "retries"),
+    ("hfdl_expected_bytes", "gauge", "本次任务要下载的总字节数", "expected_bytes"),
+    ("hfdl_done_bytes", "gauge", "已完成的字节数 (含续传前已有的部分)", "done_bytes"),
+    ("hfdl_speed_bytes_per_second", "gauge", "平滑后的下载速度", "speed"),
+    ("hfdl_active_files", "gauge", "正在下载的文件数", "active_files"),
+    ("hfdl_running", "gauge", "任务是否正在运行", "running"),
+    ("hfdl_file_queue_wait_seconds", "histogram", "文件从排队到开始下载的等待时间", "queue_wait"),
+    ("hfdl_file_ttfb_seconds", "histogram", "从开始下载到收到第一个字节的时间", "ttfb"),
+    ("hfdl_file_duration_seconds", "histogram", "单个文件的下载用时", "duration"),
+    ("hfdl_file_throughput_bytes_per_second", "histogram", "单个文件的平均下载速度", "throughput"),
+]
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+def render_metrics(trackers):
+    """把多个tracker的指标转换为Prometheus文本格式"""
+    snapshots = [(tracker.labels, tracker.metrics_snapshot()) for tracker in trackers]
+    lines = []
+    for name, kind, help_text, key in _METRICS:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, snapshot in snapshots:
+            value = snapshot[key]
+            if kind == "histogram":
+                for bound, count in zip(value.buckets, value.counts):
+                    le = _format_labels(dict(labels, le=_format_value(float(bound))))
+                    lines.append(f"{name}_bucket{le} {count}")
+                lines.append(f"{name}_bucket{_format_labels(dict(labels, le='+Inf'))} {value.count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(float(value.sum))}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value.count}")
+            elif isinstance(value, dict):
+                label = "status" if key == "files" else "kind"
+                for item, count in sorted(value.items()):
+                    lines.append(f"{name}{_format_labels(dict(labels, **{label: item}))} {count}")
+            else:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class _Handler(BaseHTTPRequestHandler):
+    metrics = None  # 由MetricsServer在子类中设置
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = render_metrics(self.metrics.trackers()).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class MetricsServer:
+    """在后台线程中提供 http://<host>:<port>/metrics
+
+    默认只监听本机。已注册的tracker一直保留, 任务结束后计数器不会消失。
+    """
+    def __init__(self, port, host="127.0.0.1"):
+        self.host = host
+        self.port = port
+        self._trackers = []
+        self.lock = threading.Lock()
+        self.server = None
+
+    def add(self, tracker):
+        with self.lock:
+            if tracker not in self._trackers:
+                self._trackers.append(tracker)
+
+    def trackers(self):
+        with self.lock:
+            return list(self._trackers)
+
+    def start(self):
+        """启动服务, 返回/metrics的地址"""
+        handler = type("Handler", (_Handler,), {"metrics": self})
+        self.server = _Server((self.host, self.port), handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name="hf-metrics", daemon=True).start()
+        return f"http://{self.host}:{self.port}/metrics"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
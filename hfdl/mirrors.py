@@ -0,0 +1,96 @@
+"""多个Hub地址 (官方和镜像) 的测速、排序和按文件故障切换"""
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .utils import format_size
+
+class EndpointSelector:
+    """在任务开始时测量每个地址的延迟和速度, 按预计耗时排序
+
+    每个文件优先使用最快的可用地址, 下载失败时由DownloadEngine换到下一个地址。
+    连续失败max_failures次的地址降到最后, 成功一次后恢复。
+    """
+    probe_bytes = 1024 * 1024  # 测速时下载的字节数
+    probe_timeout = 10
+    max_failures = 3
+
+    def __init__(self, endpoints, tracker=None):
+        self.endpoints = [endpoint.rstrip("/") for endpoint in endpoints]
+        self.tracker = tracker
+        self.lock = threading.Lock()
+        self.ranking = list(self.endpoints)
+        self.results = {}   # 地址 -> {"latency", "speed", "error"}
+        self.failures = {endpoint: 0 for endpoint in self.endpoints}
+
+    def log(self, message):
+        if self.tracker is not None:
+            self.tracker.log(message)
+
+    def probe(self, engine, filename, typical_size):
+        """用filename的前probe_bytes字节并行测速所有地址, 按 延迟 + typical_size/速度 排序"""
+        with ThreadPoolExecutor(max_workers=len(self.endpoints), thread_name_prefix="hf-probe") as pool:
+            results = list(pool.map(lambda endpoint: self._probe_one(engine, endpoint, filename), self.endpoints))
+        self.results = dict(zip(self.endpoints, results))
+
+        def estimate(endpoint):
+            result = self.results[endpoint]
+            if result["error"]:
+                return float("inf")
+            return result["latency"] + typical_size / max(result["speed"], 1.0)
+
+        with self.lock:
+            # 排序是稳定的, 测速都失败时保持配置的顺序
+            self.ranking = sorted(self.endpoints, key=estimate)
+        for endpoint in self.ranking:
+            result = self.results[endpoint]
+            if result["error"]:
+                self.log(f"镜像测速 {endpoint}: 不可用 ({result['error']})")
+            else:
+                self.log(f"镜像测速 {endpoint}: 延迟 {result['latency'] * 1000:.0f} ms, "
+                         f"速度 {format_size(result['speed'])}/s")
+        self.log(f"优先使用: {self.ranking[0]}")
+        return self.ranking
+
+    def _probe_one(self, engine, endpoint, filename):
+        headers = engine.get_headers()
+        headers["Range"] = f"bytes=0-{self.probe_bytes - 1}"
+        start = time.time()
+        response = None
+        try:
+            response = engine.http.request("GET", engine.get_file_url(filename, endpoint), headers=headers,
+                                           preload_content=False, timeout=self.probe_timeout)
+            latency = time.time() - start
+            if response.status >= 400:
+                return {"latency": latency, "speed": 0.0, "error": f"HTTP {response.status}"}
+            received = 0
+            read_start = time.time()
+            for chunk in response.stream(64 * 1024):
+                received += len(chunk)
+                if received >= self.probe_bytes:
+                    break
+            elapsed = max(time.time() - read_start, 1e-3)
+            return {"latency": latency, "speed": received / elapsed, "error": None}
+        except Exception as e:
+            return {"latency": time.time() - start, "speed": 0.0, "error": str(e) or type(e).__name__}
+        finally:
+            if response is not None:
+                response.close()
+
+    def candidates(self):
+        """按优先顺序返回地址: 健康的地址在前, 连续失败过多的在后"""
+        with self.lock:
+            healthy = [e for e in self.ranking if self.failures[e] < self.max_failures]
+            failing = [e for e in self.ranking if self.failures[e] >= self.max_failures]
+        return healthy + failing
+
+    def record_success(self, endpoint):
+        with self.lock:
+            self.failures[endpoint] = 0
+
+    def record_failure(self, endpoint):
+        with self.lock:
+            self.failures[endpoint] += 1
+            demoted = self.failures[endpoint] == self.max_failures
+        if demoted:
+            self.log(f"镜像 {endpoint} 连续失败 {self.max_failures} 次, 降为最后选择")
@@ -0,0 +1,588 @@
+"""局域网节点共享: 同一子网中的多台机器下载同一个模型时, LFS文件只需从Hub下载一次
+
+每个节点可以运行PeerServer, 在HTTP端口上按LFS sha256提供本机已有的文件:
+
+    GET/HEAD /hfdl/peer/v1/blobs/<sha256>   文件内容, 支持Range
+    GET      /hfdl/peer/v1/have              本机登记的 {sha256: 大小}
+
+PeerServer每隔几秒向子网广播 (UDP) 自己的端口, 并应答新节点启动时广播的查询。
+PeerNetwork合并手动指定的节点地址和广播发现的节点: 下载引擎下载LFS文件前先询问各节点,
+从有该文件的多个节点并行地按Range分块下载, 完成后校验sha256; 没有节点有该文件、
+节点全部出错或校验不一致时删除临时文件, 改从Hub下载。内容由接收方校验, 不需要信任其他节点。
+"""
+import os
+import re
+import json
+import time
+import uuid
+import random
+import socket
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import urllib3
+
+from .constants import USER_AGENT
+from .diskio import BufferedWriter, preallocate, fsync
+from .errors import IntegrityError, TransientError
+from .manifest import load_manifest, local_path
+from .session import HttpSession
+from .utils import format_size
+from .verify import SegmentHasher
+
+DEFAULT_PEER_PORT = 48760  # PeerServer的HTTP端口
+DEFAULT_DISCOVERY_PORT = 48761  # 广播和查询使用的UDP端口
+DEFAULT_BROADCAST = "255.255.255.255"
+API_PREFIX = "/hfdl/peer/v1"
+SERVICE = "hfdl-peer"
+
+_BLOB_PATH = re.compile(r"^" + re.escape(API_PREFIX) + r"/blobs/([0-9a-f]{64})$")
+
+def blob_url(peer, sha256):
+    return f"{peer}{API_PREFIX}/blobs/{sha256}"
+
+def normalize_peer(address):
+    """把 "主机:端口" 或 "http://主机:端口/" 转换为 http://主机:端口, 没有端口时使用默认端口"""
+    address = address.strip().rstrip("/")
+    if "://" not in address:
+        address = "http://" + address
+    if not re.search(r":\d+$", address.split("://", 1)[1]):
+        address += f":{DEFAULT_PEER_PORT}"
+    return address
+
+def parse_range(header, size):
+    """解析单个Range (bytes=a-b、bytes=a-、bytes=-n), 返回 (起始, 结束), 无法满足时返回None
+
+    多个范围或无法识别的格式返回 (0, size - 1), 即忽略Range返回整个文件。
+    """
+    match = re.match(r"^bytes=(\d*)-(\d*)$", header.strip())
+    if match is None or not (match.group(1) or match.group(2)):
+        return 0, size - 1
+    first, last = match.groups()
+    if not first:
+        length = int(last)
+        if length == 0:
+            return None
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return None
+    return start, end
+
+def _bind_discovery(port):
+    """绑定广播端口; 同一台机器上的多个进程可以同时监听"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, "SO_REUSEPORT"):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    sock.bind(("", port))
+    return sock
+
+def _parse_message(data):
+    try:
+        message = json.loads(data.decode("utf-8"))
+    except (UnicodeDecodeError, ValueError):
+        return None
+    if not isinstance(message, dict) or message.get("service") != SERVICE:
+        return None
+    return message
+
+class PeerCatalog:
+    """本机可以提供给其他节点的文件: sha256 -> 候选路径
+
+    只登记路径, 被请求时才检查文件是否存在、大小 (和修改时间) 是否一致,
+    下载中的文件在完成并重命名之前不会被提供。给出blob_store时也提供内容存储中的文件。
+    """
+    def __init__(self, blob_store=None):
+        self.blob_store = blob_store
+        self.lock = threading.Lock()
+        self.entries = {}  # sha256 -> [(路径, 大小, 修改时间或None)]
+
+    def add(self, sha256, path, size, mtime=None):
+        with self.lock:
+            candidates = self.entries.setdefault(sha256, [])
+            candidates[:] = [c for c in candidates if c[0] != path]
+            candidates.append((path, size, mtime))
+
+    def add_directory(self, local_dir):
+        """登记local_dir的下载清单中的所有文件, 返回登记的文件数, 没有清单时返回0"""
+        manifest = load_manifest(local_dir)
+        if manifest is None:
+            return 0
+        count = 0
+        for filename, entry in manifest["files"].items():
+            if entry.get("sha256") and isinstance(entry.get("size"), int):
+                self.add(entry["sha256"], local_path(local_dir, filename), entry["size"], entry.get("mtime"))
+                count += 1
+        return count
+
+    def find(self, sha256):
+        """返回 (路径, 大小), 本机没有该文件时返回 (None, None)"""
+        with self.lock:
+            candidates = list(self.entries.get(sha256, ()))
+        for path, size, mtime in candidates:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if stat.st_size == size and (mtime is None or stat.st_mtime == mtime):
+                return path, size
+        if self.blob_store is not None and self.blob_store.has(sha256):
+            path = self.blob_store.blob_path(sha256)
+            try:
+                return path, os.path.getsize(path)
+            except OSError:
+                pass
+        return None, None
+
+    def have(self):
+        """当前可以提供的已登记文件 {sha256: 大小} (不列出内容存储)"""
+        with self.lock:
+            hashes = list(self.entries)
+        result = {}
+        for sha256 in hashes:
+            path, size = self.find(sha256)
+            if path is not None:
+                result[sha256] = size
+        return result
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    block_on_close = False  # 停止时不等待其他节点空闲的keep-alive连接
+
+    def handle_error(self, request, client_address):
+        pass  # 对方断开连接等错误不输出到终端
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, 同一节点的多个分块复用连接
+    server_version = "hfdl-peer/1"
+    peer_server = None  # 由PeerServer在子类中设置
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.handle_request(head=True)
+
+    def do_GET(self):
+        self.handle_request(head=False)
+
+    def send_empty(self, status, headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def handle_request(self, head):
+        path = self.path.split("?", 1)[0]
+        if path == API_PREFIX + "/have":
+            body = json.dumps(self.peer_server.catalog.have()).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if not head:
+                self.wfile.write(body)
+            return
+        match = _BLOB_PATH.match(path)
+        file_path, size = self.peer_server.catalog.find(match.group(1)) if match else (None, None)
+        if file_path is None:
+            self.send_empty(404)
+            return
+        start, end, status = 0, size - 1, 200
+        if self.headers.get("Range"):
+            parsed = parse_range(self.headers["Range"], size)
+            if parsed is None:
+                self.send_empty(416, [("Content-Range", f"bytes */{size}")])
+                return
+            (start, end), status = parsed, 206
+        try:
+            f = open(file_path, "rb")
+        except OSError:
+            self.send_empty(404)
+            return
+        with f:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("Accept-Ranges", "bytes")
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self.end_headers()
+            if head or end < start:
+                return
+            try:
+                sent = self.connection.sendfile(f, start, end - start + 1)
+            except OSError:
+                self.close_connection = True
+                return
+        self.peer_server.add_uploaded(sent)
+
+class PeerServer:
+    """在后台线程中向局域网提供catalog中的文件, announce为True时定期广播并应答查询
+
+    默认监听所有网卡, 其他机器才能连接; 只提供按sha256登记过的文件, 不能读取其他路径。
+    broadcast为广播地址, 受限广播 (255.255.255.255) 不能到达的网络可改为子网的定向广播地址。
+    """
+    announce_interval = 5.0  # 定期广播的间隔(秒)
+
+    def __init__(self, catalog=None, port=DEFAULT_PEER_PORT, host="0.0.0.0", announce=True,
+                 discovery_port=DEFAULT_DISCOVERY_PORT, broadcast=DEFAULT_BROADCAST):
+        self.catalog = catalog or PeerCatalog()
+        self.host = host
+        self.port = port
+        self.announce = announce
+        self.discovery_port = discovery_port
+        self.broadcast = broadcast
+        self.node_id = uuid.uuid4().hex[:12]
+        self.uploaded_bytes = 0  # 已发送给其他节点的字节数
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.server = None
+        self.sock = None
+
+    def share_files(self, local_dir, files):
+        """登记local_dir中的文件, files为 {文件名: (sha256, 大小)}; 文件下载完成后即可被其他节点获取"""
+        for filename, (sha256, size) in files.items():
+            self.catalog.add(sha256, local_path(local_dir, filename), size)
+
+    def add_uploaded(self, nbytes):
+        with self.lock:
+            self.uploaded_bytes += nbytes
+
+    def start(self):
+        """启动服务, 返回本节点的地址; 端口被占用时抛出OSError"""
+        handler = type("Handler", (_Handler,), {"peer_server": self})
+        self.server = _Server((self.host, self.port), handler)
+        self.port = self.server.server_address[1]
+        self.stop_event.clear()
+        threading.Thread(target=self.server.serve_forever, name="hf-peer-server", daemon=True).start()
+        if self.announce:
+            self.sock = _bind_discovery(self.discovery_port)
+            self.sock.settimeout(0.5)
+            threading.Thread(target=self._announce_loop, name="hf-peer-announce", daemon=True).start()
+        return self.url()
+
+    def url(self):
+        host = self.host
+        if host in ("", "0.0.0.0"):
+            try:
+                host = socket.gethostbyname(socket.gethostname())
+            except OSError:
+                host = "127.0.0.1"
+        return f"http://{host}:{self.port}"
+
+    def announcement(self):
+        # 监听所有网卡时不写主机, 接收方使用数据包的来源地址
+        host = None if self.host in ("", "0.0.0.0") else self.host
+        return json.dumps({"service": SERVICE, "type": "announce", "id": self.node_id, "port": self.port,
+                           "host": host}).encode("utf-8")
+
+    def _announce_loop(self):
+        sock = self.sock
+        next_announce = 0
+        while not self.stop_event.is_set():
+            if time.monotonic() >= next_announce:
+                try:
+                    sock.sendto(self.announcement(), (self.broadcast, self.discovery_port))
+                except OSError:
+                    pass  # 没有可用的网络, 下次再试
+                next_announce = time.monotonic() + self.announce_interval
+            try:
+                data, address = sock.recvfrom(2048)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            message = _parse_message(data)
+            if message is not None and message.get("type") == "query":
+                try:
+                    sock.sendto(self.announcement(), address)
+                except OSError:
+                    pass
+
+    def stop(self):
+        self.stop_event.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+class PeerNetwork:
+    """下载引擎使用的节点列表: 手动指定的地址, 加上discover为True时通过广播发现的节点
+
+    download()从有该文件的多个节点并行分块下载一个LFS文件。局域网内的传输不经过代理,
+    不受带宽上限和任务连接数的限制。发现新节点时调用listener(message)。
+    """
+    chunk_size = 16 * 1024 * 1024  # 每个Range请求的大小
+    connections_per_peer = 2  # 一个文件在每个节点上同时使用的连接数
+    max_peers = 8  # 一个文件最多同时从几个节点下载
+    peer_timeout = 20.0  # 超过该秒数没有收到广播的节点视为离线
+    failure_backoff = 30.0  # 出错的节点在该秒数内不再使用
+    query_wait = 0.5  # 启动时广播查询后等待应答的时间(秒)
+
+    def __init__(self, peers=(), discover=False, discovery_port=DEFAULT_DISCOVERY_PORT,
+                 broadcast=DEFAULT_BROADCAST):
+        self.static_peers = [normalize_peer(peer) for peer in peers if peer.strip()]
+        self.discover = discover
+        self.discovery_port = discovery_port
+        self.broadcast = broadcast
+        self.listener = None
+        self.ignored_ids = set()  # 本进程自己的PeerServer
+        self.discovered = {}  # 地址 -> 最后一次收到广播的时间
+        self.unavailable = {}  # 地址 -> 恢复使用的时间
+        self.timeout = urllib3.Timeout(connect=3, read=10)
+        self.session = HttpSession(maxsize=16, proxies={})
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.sock = None
+
+    def ignore(self, node_id):
+        """不使用node_id对应的节点 (同一进程中的PeerServer)"""
+        self.ignored_ids.add(node_id)
+
+    def describe(self):
+        parts = []
+        if self.static_peers:
+            parts.append(", ".join(self.static_peers))
+        if self.discover:
+            parts.append(f"监听UDP {self.discovery_port} 端口自动发现")
+        return "; ".join(parts) or "没有节点"
+
+    def start(self):
+        """开始监听广播并查询一次已在运行的节点; 端口无法使用时抛出OSError"""
+        if not self.discover:
+            return
+        self.stop_event.clear()
+        self.sock = _bind_discovery(self.discovery_port)
+        self.sock.settimeout(0.5)
+        threading.Thread(target=self._listen, args=(self.sock,), name="hf-peer-discovery", daemon=True).start()
+        self.query()
+
+    def query(self):
+        """广播查询, 在query_wait秒内收集各节点的应答, 不必等待下一次定期广播"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            message = json.dumps({"service": SERVICE, "type": "query"}).encode("utf-8")
+            sock.sendto(message, (self.broadcast, self.discovery_port))
+            deadline = time.monotonic() + self.query_wait
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                sock.settimeout(remaining)
+                try:
+                    data, address = sock.recvfrom(2048)
+                except socket.timeout:
+                    break
+                self._handle(data, address)
+        except OSError:
+            pass  # 没有可用的网络, 只使用手动指定的节点和之后收到的广播
+        finally:
+            sock.close()
+
+    def _listen(self, sock):
+        while not self.stop_event.is_set():
+            try:
+                data, address = sock.recvfrom(2048)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self._handle(data, address)
+
+    def _handle(self, data, address):
+        message = _parse_message(data)
+        if message is None or message.get("type") != "announce" or message.get("id") in self.ignored_ids:
+            return
+        port = message.get("port")
+        if not isinstance(port, int):
+            return
+        url = f"http://{message.get('host') or address[0]}:{port}"
+        with self.lock:
+            new = url not in self.discovered and url not in self.static_peers
+            self.discovered[url] = time.monotonic()
+        if new and self.listener is not None:
+            self.listener(f"发现局域网节点 {url}")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        self.session.close()
+
+    def peers(self):
+        """当前可用的节点地址"""
+        now = time.monotonic()
+        with self.lock:
+            discovered = [url for url, seen in self.discovered.items() if now - seen <= self.peer_timeout]
+            unavailable = {url for url, until in self.unavailable.items() if until > now}
+        return [url for url in dict.fromkeys(self.static_peers + discovered) if url not in unavailable]
+
+    def _mark_failed(self, url):
+        with self.lock:
+            self.unavailable[url] = time.monotonic() + self.failure_backoff
+
+    def locate(self, sha256):
+        """并行询问各节点, 返回 (有该文件的节点列表, 文件大小), 没有节点有该文件时返回 ([], None)"""
+        peers = self.peers()
+        if not peers:
+            return [], None
+        with ThreadPoolExecutor(max_workers=min(len(peers), 16), thread_name_prefix="hf-peer") as pool:
+            sizes = list(pool.map(lambda url: self._probe(url, sha256), peers))
+        found = [(url, size) for url, size in zip(peers, sizes) if size is not None]
+        if not found:
+            return [], None
+        # 文件大小由sha256决定, 以多数节点的结果为准; 打乱顺序, 让多个下载节点分摊到不同的节点上
+        size = max(set(s for _, s in found), key=lambda s: sum(1 for _, other in found if other == s))
+        peers = [url for url, other in found if other == size]
+        random.shuffle(peers)
+        return peers[:self.max_peers], size
+
+    def _probe(self, url, sha256):
+        """返回节点上该文件的大小, 节点没有该文件或无法连接时返回None"""
+        try:
+            response = self.session.request("HEAD", blob_url(url, sha256), headers={"User-Agent": USER_AGENT},
+                                            timeout=self.timeout, retries=False)
+        except Exception:
+            self._mark_failed(url)
+            return None
+        length = response.headers.get("Content-Length")
+        if response.status != 200 or length is None or not length.isdigit():
+            return None
+        return int(length)
+
+    def download(self, engine, filename, sha256, target):
+        """从局域网节点下载filename到target并校验sha256, 成功时返回True
+
+        数据写入<target>.peer.incomplete: 文件切成chunk_size的块, 每个节点最多connections_per_peer个连接,
+        出错的节点不再参与这个文件, 未完成的块由其他节点继续下载。失败、校验不一致或被取消时
+        删除临时文件并返回False, 由调用方改从Hub下载。
+        """
+        peers, size = self.locate(sha256)
+        if not peers:
+            return False
+        tracker = engine.tracker
+        temp_path = target + ".peer.incomplete"
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tracker.log(f"{filename} 从 {len(peers)} 个局域网节点下载 ({format_size(size)}): {', '.join(peers)}")
+
+        chunks = [{"start": start, "end": min(start + self.chunk_size, size) - 1, "done": 0}
+                  for start in range(0, size, self.chunk_size)]
+        hasher = SegmentHasher(temp_path, {"size": size, "segments": chunks})
+        pending = deque(chunks)
+        condition = threading.Condition()
+        in_flight = [0]
+        failed = {}  # 节点 -> 错误
+
+        def on_flush(chunk, position, data):
+            with condition:
+                chunk["done"] += len(data)
+            hasher.update(position, data)
+
+        def worker(url):
+            while True:
+                with condition:
+                    while not pending and in_flight[0] and url not in failed and not engine.is_cancelled():
+                        condition.wait(0.5)
+                    if not pending or url in failed or engine.is_cancelled():
+                        return
+                    chunk = pending.popleft()
+                    in_flight[0] += 1
+                error = None
+                try:
+                    self._fetch_chunk(engine, filename, url, sha256, temp_path, size, chunk, on_flush)
+                except Exception as e:
+                    error = e
+                with condition:
+                    in_flight[0] -= 1
+                    if chunk["start"] + chunk["done"] <= chunk["end"]:
+                        pending.appendleft(chunk)
+                    first_error = error is not None and url not in failed
+                    if error is not None:
+                        failed[url] = error
+                    condition.notify_all()
+                if first_error:
+                    self._mark_failed(url)
+                    tracker.log(f"局域网节点 {url} 传输 {os.path.basename(filename)} 出错, 其余部分由其他节点下载: {error}")
+                if error is not None:
+                    return
+
+        try:
+            with open(temp_path, "wb") as f:
+                preallocate(f, size)
+            workers = len(peers) * self.connections_per_peer
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hf-peer") as pool:
+                for url in peers:
+                    for _ in range(self.connections_per_peer):
+                        pool.submit(worker, url)
+            if engine.is_cancelled() or pending:
+                raise TransientError("所有节点都已出错" if not engine.is_cancelled() else "下载已取消")
+            engine._check_sha256(filename, hasher.hexdigest(), temp_path)
+            if engine.fsync:
+                with open(temp_path, "r+b") as f:
+                    fsync(f)
+        except Exception as e:
+            hasher.hexdigest()  # 关闭补读用的文件
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            tracker.reset_file(filename)
+            if not engine.is_cancelled():
+                reason = "sha256校验失败" if isinstance(e, IntegrityError) else str(e)
+                tracker.log(f"{filename} 无法从局域网节点获取 ({reason}), 改从Hub下载")
+            return False
+
+        os.replace(temp_path, target)
+        # 之前从Hub下载的部分已不再需要
+        for path in (target + ".incomplete", target + ".segments.json"):
+            if os.path.exists(path):
+                os.remove(path)
+        tracker.add_peer_file(filename, size, len(peers) - len(failed))
+        return True
+
+    def _fetch_chunk(self, engine, filename, url, sha256, temp_path, size, chunk, on_flush):
+        """从一个节点下载一个块的剩余部分, 写入临时文件的对应位置"""
+        start = chunk["start"] + chunk["done"]
+        end = chunk["end"]
+        headers = {"User-Agent": USER_AGENT, "Range": f"bytes={start}-{end}"}
+        response = self.session.request("GET", blob_url(url, sha256), headers=headers, preload_content=False,
+                                        timeout=self.timeout, retries=False)
+        completed = False
+        try:
+            if response.status != 206 or response.headers.get("Content-Range") != f"bytes {start}-{end}/{size}":
+                raise TransientError(f"节点返回了不符合的响应: HTTP {response.status}")
+            buffer = engine.buffers.get()
+            try:
+                with open(temp_path, "r+b", buffering=0) as f:
+                    f.seek(start)
+                    writer = BufferedWriter(f, buffer, start, on_flush=lambda position, data: on_flush(
+                        chunk, position, data))
+                    try:
+                        for data in response.stream(engine.chunk_size):
+                            if engine.is_cancelled():
+                                return
+                            writer.write(data)
+                            engine.tracker.add_bytes(filename, len(data))
+                    finally:
+                        writer.flush()
+            finally:
+                engine.buffers.put(buffer)
+            if chunk["start"] + chunk["done"] <= end:
+                raise TransientError(f"数据传输中断: 块 {chunk['start']}-{end} 未接收完整")
+            completed = True
+        finally:
+            if completed:
+                response.release_conn()
+            else:
+                response.close()
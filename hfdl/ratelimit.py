@@ -0,0 +1,147 @@
+"""全局带宽限制: 令牌桶和按时段的限速计划"""
+import time
+import threading
+from datetime import datetime
+
+from .utils import format_size, parse_size
+
+class BandwidthSchedule:
+    """按一天中的时段决定限速
+
+    规则写作 "开始-结束=速度", 用逗号或分号分隔, 速度为0表示不限速, 例如::
+
+        08:00-20:00=200M, 20:00-08:00=0
+
+    结束时间早于开始时间表示跨过午夜。没有规则匹配的时段使用手动设置的上限。
+    """
+    def __init__(self, rules=None):
+        self.rules = rules or []  # [(开始分钟, 结束分钟, 字节每秒或None)]
+
+    @classmethod
+    def parse(cls, text):
+        """解析时段规则, 格式错误时抛出ValueError"""
+        rules = []
+        for item in text.replace(";", ",").split(","):
+            item = item.strip()
+            if not item:
+                continue
+            try:
+                span, rate = item.split("=")
+                start, end = span.split("-")
+                rate = parse_size(rate)
+                rules.append((cls._minutes(start), cls._minutes(end), rate or None))
+            except ValueError:
+                raise ValueError(f"无法识别的时段规则: {item} (示例: 08:00-20:00=200M)")
+        return cls(rules)
+
+    @staticmethod
+    def _minutes(text):
+        hour, minute = text.strip().split(":")
+        hour, minute = int(hour), int(minute)
+        if not (0 <= hour <= 24 and 0 <= minute < 60):
+            raise ValueError(text)
+        return hour * 60 + minute
+
+    def lookup(self, now=None):
+        """返回 (是否有规则匹配, 限速); 限速为None表示不限速"""
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        for start, end, rate in self.rules:
+            if start <= end:
+                matched = start <= minute < end
+            else:
+                matched = minute >= start or minute < end
+            if matched:
+                return True, rate
+        return False, None
+
+    def __str__(self):
+        parts = []
+        for start, end, rate in self.rules:
+            limit = f"{format_size(rate)}/s" if rate else "不限速"
+            parts.append(f"{start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d} {limit}")
+        return ", ".join(parts)
+
+class BandwidthLimiter:
+    """所有传输共用的令牌桶限速器
+
+    每读到一块数据调用consume, 令牌不足时让当前线程等待, 因此无论有多少个
+    工作线程或分段, 总速度都不超过上限。rate为None表示不限速, 可在下载过程中
+    随时通过set_rate或set_schedule修改。
+    """
+    burst_seconds = 0.5       # 令牌桶容量, 以当前速度下的秒数表示
+    min_burst = 256 * 1024
+    sleep_step = 0.25         # 等待时每隔多久检查一次取消和限速变化
+    schedule_check_interval = 1.0
+
+    def __init__(self, rate=None, schedule=None):
+        self.lock = threading.Lock()
+        self.base_rate = rate or None
+        self.schedule = schedule
+        self.rate = self.base_rate
+        self.tokens = 0.0
+        self.last_refill = time.monotonic()
+        self.last_schedule_check = 0.0
+        self.listener = None  # listener(message), 限速变化时调用
+        self._refresh_rate(force=True)
+
+    def set_rate(self, rate):
+        """修改手动设置的上限 (字节每秒, None或0为不限速), 立即生效"""
+        with self.lock:
+            self.base_rate = rate or None
+        self._refresh_rate(force=True)
+
+    def set_schedule(self, schedule):
+        with self.lock:
+            self.schedule = schedule
+        self._refresh_rate(force=True)
+
+    def describe(self):
+        limit = f"{format_size(self.base_rate)}/s" if self.base_rate else "不限速"
+        if self.schedule and self.schedule.rules:
+            return f"{limit}, 时段: {self.schedule}"
+        return limit
+
+    def _refresh_rate(self, force=False):
+        now = time.monotonic()
+        with self.lock:
+            if not force and now - self.last_schedule_check < self.schedule_check_interval:
+                return
+            self.last_schedule_check = now
+            rate = self.base_rate
+            if self.schedule is not None:
+                matched, scheduled = self.schedule.lookup()
+                if matched:
+                    rate = scheduled
+            if rate == self.rate:
+                return
+            self.rate = rate
+            self.tokens = 0.0
+            self.last_refill = now
+        if self.listener is not None:
+            self.listener(f"带宽上限已调整为 {format_size(rate)}/s" if rate else "带宽上限已取消, 不再限速")
+
+    def _capacity(self):
+        return max(self.rate * self.burst_seconds, self.min_burst) if self.rate else 0.0
+
+    def reserve(self, nbytes):
+        """记录收到nbytes字节, 返回超过上限时应等待的秒数, 本身不阻塞 (供asyncio的传输使用)"""
+        self._refresh_rate()
+        with self.lock:
+            rate = self.rate
+            if rate is None:
+                return 0.0
+            now = time.monotonic()
+            self.tokens = min(self._capacity(), self.tokens + (now - self.last_refill) * rate)
+            self.last_refill = now
+            self.tokens -= nbytes
+            return -self.tokens / rate if self.tokens < 0 else 0.0
+
+    def consume(self, nbytes, is_cancelled=None):
+        """记录收到nbytes字节, 超过上限时阻塞到令牌足够为止"""
+        deadline = time.monotonic() + self.reserve(nbytes)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self.rate is None or (is_cancelled is not None and is_cancelled()):
+                return
+            time.sleep(min(remaining, self.sleep_step))
@@ -0,0 +1,38 @@
+"""下载顺序: 先下载加载模型所需的小文件, 其余文件从大到小下载
+
+配置、分词器和分片索引文件很小, 放在最前面下载, 全部就绪后DownloadTracker发出"metadata_ready"事件,
+调用方此时就可以开始构建模型和分词器 (例如读取config.json创建空模型)。
+其余文件按大小从大到小排队: 线程池按顺序取文件, 相当于最长处理时间优先 (LPT) 调度,
+最大的分片最先开始, 最后剩下的是小文件, 不会出现所有连接空闲、只剩一个大分片在单连接上下载的情况。
+"""
+import posixpath
+
+# 加载模型、分词器和处理器时读取的文件 (按文件名匹配, 也适用于diffusers等仓库的子目录)
+LOAD_METADATA_NAMES = {
+    "config.json", "generation_config.json", "model_index.json", "adapter_config.json",
+    "tokenizer.json", "tokenizer_config.json", "special_tokens_map.json", "added_tokens.json",
+    "tokenizer.model", "spiece.model", "sentencepiece.bpe.model", "vocab.json", "vocab.txt", "merges.txt",
+    "chat_template.json", "chat_template.jinja", "preprocessor_config.json", "processor_config.json",
+    "scheduler_config.json", "modules.json", "sentence_bert_config.json", "config_sentence_transformers.json",
+}
+LOAD_METADATA_SUFFIXES = (".safetensors.index.json", ".bin.index.json")
+LOAD_METADATA_MAX_SIZE = 100 * 1024 * 1024  # 超过该大小的同名文件不提前下载
+
+def is_load_metadata(filename, size=None):
+    """是否为加载模型前需要的配置、分词器或分片索引文件"""
+    if size is not None and size > LOAD_METADATA_MAX_SIZE:
+        return False
+    name = posixpath.basename(filename)
+    return name in LOAD_METADATA_NAMES or name.endswith(LOAD_METADATA_SUFFIXES)
+
+def schedule_files(files, file_sizes):
+    """返回 (排好序的文件列表, 其中加载模型所需的文件)
+
+    加载所需的文件从小到大排在最前, 其余文件从大到小排列; 大小相同时按文件名排序, 顺序稳定。
+    """
+    metadata, others = [], []
+    for filename in files:
+        (metadata if is_load_metadata(filename, file_sizes.get(filename)) else others).append(filename)
+    metadata.sort(key=lambda f: (file_sizes.get(f, 0), f))
+    others.sort(key=lambda f: (-file_sizes.get(f, 0), f))
+    return metadata + others, metadata
@@ -0,0 +1,153 @@
+"""每个任务独立的HTTP会话: 连接池、keep-alive、DNS缓存和代理设置"""
+import time
+import socket
+import threading
+import ipaddress
+import urllib.request
+
+import urllib3
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util import parse_url
+
+class DnsCache:
+    """缓存主机名解析结果, 同一会话中新建连接时不再重复查询DNS
+
+    连接失败时调用invalidate, 下次重新解析。
+    """
+    ttl = 300  # 秒
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}  # (主机, 端口) -> (地址, 过期时间)
+
+    def lookup(self, host, port):
+        """返回缓存或新解析的地址, 主机已是IP或解析失败时返回None (由urllib3自行处理)"""
+        try:
+            ipaddress.ip_address(host.strip("[]"))
+            return None
+        except ValueError:
+            pass
+        key = (host, port)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > now:
+                return entry[0]
+        try:
+            infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        except OSError:
+            return None
+        if not infos:
+            return None
+        address = infos[0][4][0]
+        with self.lock:
+            self.entries[key] = (address, now + self.ttl)
+        return address
+
+    def invalidate(self, host):
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == host]:
+                del self.entries[key]
+
+class _CachedDnsConnection:
+    """建立TCP连接时使用DnsCache中的地址; TLS校验和SNI仍使用原主机名"""
+    dns_cache = None
+
+    def _new_conn(self):
+        host = self._dns_host
+        address = self.dns_cache.lookup(host, self.port)
+        if address is None:
+            return super()._new_conn()
+        self._dns_host = address
+        try:
+            return super()._new_conn()
+        except Exception:
+            self.dns_cache.invalidate(host)
+            raise
+        finally:
+            self._dns_host = host
+
+def _pool_classes(dns_cache):
+    """生成绑定到dns_cache的连接池类, 供PoolManager.pool_classes_by_scheme使用"""
+    http_connection = type("CachedDnsHTTPConnection", (_CachedDnsConnection, HTTPConnection),
+                           {"dns_cache": dns_cache})
+    https_connection = type("CachedDnsHTTPSConnection", (_CachedDnsConnection, HTTPSConnection),
+                            {"dns_cache": dns_cache})
+    return {
+        "http": type("CachedDnsHTTPConnectionPool", (HTTPConnectionPool,), {"ConnectionCls": http_connection}),
+        "https": type("CachedDnsHTTPSConnectionPool", (HTTPSConnectionPool,), {"ConnectionCls": https_connection}),
+    }
+
+class HttpSession:
+    """一个下载任务内所有请求共用的HTTP会话
+
+    - 每个主机的连接池容量为maxsize, 应不少于同时进行的传输数, 连接用完后放回池中复用,
+      小文件很多的仓库不必为每个文件重新做TCP和TLS握手
+    - 开启TCP keep-alive, 空闲的长连接不会被中间设备悄悄断开
+    - 主机名解析结果缓存在DnsCache中
+    - proxies只作用于本会话, 格式为 {"http": 地址, "https": 地址};
+      None表示沿用环境变量中的代理 (NO_PROXY中的主机直连), {}表示不使用代理
+
+    request的参数与urllib3.PoolManager.request相同。
+    """
+    socket_options = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+
+    def __init__(self, maxsize=10, proxies=None):
+        self.maxsize = max(1, int(maxsize))
+        from_environment = proxies is None
+        if proxies is None:
+            proxies = urllib.request.getproxies()
+        self.proxies = {scheme: proxies[scheme] for scheme in ("http", "https") if proxies.get(scheme)}
+        self.dns_cache = DnsCache()
+        self.managers = {}
+        created = {}
+        for scheme in ("http", "https"):
+            proxy_url = self.proxies.get(scheme)
+            if proxy_url not in created:
+                created[proxy_url] = self._create_manager(proxy_url)
+            self.managers[scheme] = created[proxy_url]
+        # 只有沿用环境变量的代理时才按NO_PROXY绕过, 绕过的主机走direct直连
+        self.direct = None
+        if from_environment and self.proxies:
+            self.direct = created[None] if None in created else self._create_manager(None)
+        self.bypassed = {}  # 主机 -> 是否绕过代理
+
+    def _create_manager(self, proxy_url):
+        options = {"maxsize": self.maxsize, "socket_options": self.socket_options}
+        if proxy_url:
+            auth = parse_url(proxy_url).auth
+            proxy_headers = urllib3.make_headers(proxy_basic_auth=auth) if auth else None
+            manager = urllib3.ProxyManager(proxy_url, proxy_headers=proxy_headers, **options)
+        else:
+            manager = urllib3.PoolManager(**options)
+        manager.pool_classes_by_scheme = _pool_classes(self.dns_cache)
+        return manager
+
+    def describe_proxies(self):
+        if not self.proxies:
+            return "不使用代理"
+        return ", ".join(f"{scheme.upper()}={url}" for scheme, url in self.proxies.items())
+
+    def bypasses_proxy(self, host):
+        """host是否匹配NO_PROXY而应直连, 显式传入proxies时总是返回False"""
+        if self.direct is None or not host:
+            return False
+        bypass = self.bypassed.get(host)
+        if bypass is None:
+            bypass = self.bypassed[host] = bool(urllib.request.proxy_bypass(host))
+        return bypass
+
+    def request(self, method, url, **kwargs):
+        parts = parse_url(url)
+        if self.bypasses_proxy(parts.host):
+            return self.direct.request(method, url, **kwargs)
+        return self.managers[parts.scheme or "http"].request(method, url, **kwargs)
+
+    def close(self):
+        """关闭所有空闲连接"""
+        managers = set(self.managers.values())
+        if self.direct is not None:
+            managers.add(self.direct)
+        for manager in managers:
+            manager.clear()
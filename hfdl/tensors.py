@@ -0,0 +1,431 @@
+"""按张量下载safetensors检查点的一部分
+
+safetensors文件以8字节 (小端) 的头部长度开头, 随后是JSON头部, 记录每个张量的dtype、shape和
+在数据区中的起止位置 (data_offsets)。这里只用Range请求读取每个分片的头部, 建立
+张量名 -> (分片, 字节范围) 的索引, 然后只下载选中张量所在的字节范围, 写出只包含这些张量的
+safetensors文件 (文件名与原分片相同), 并生成对应的 model.safetensors.index.json。
+
+仓库中有 *.safetensors.index.json 时先按其中的weight_map确定需要的分片, 只读取这些分片的头部。
+索引缓存在保存位置的 .hfdl-tensor-index.json 中, 提交未变化时不再重新读取。
+"""
+import os
+import json
+import struct
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .diskio import preallocate, fsync
+from .errors import DownloadError, TransientError, RemoteChangedError, http_error, classify_error
+from .utils import format_size
+
+INDEX_CACHE_FILE = ".hfdl-tensor-index.json"
+HEADER_PROBE_SIZE = 64 * 1024  # 第一次请求读取的字节数, 大多数分片的头部都在其中
+MAX_HEADER_SIZE = 100 * 1024 * 1024  # 与safetensors库的限制相同
+RANGE_GAP = 1024 * 1024  # 相邻选中张量的间隔小于该值时合并为一个请求
+
+def is_safetensors(filename):
+    return filename.endswith(".safetensors")
+
+def is_safetensors_index(filename):
+    return filename.endswith(".safetensors.index.json")
+
+def split_tensor_files(files):
+    """返回 (其他文件, safetensors分片, 分片索引文件)"""
+    others, shards, indexes = [], [], []
+    for filename in files:
+        if is_safetensors(filename):
+            shards.append(filename)
+        elif is_safetensors_index(filename):
+            indexes.append(filename)
+        else:
+            others.append(filename)
+    return others, shards, indexes
+
+def parse_header(data):
+    """解析文件开头的数据, 返回 (头部长度, 头部JSON); 数据不足时返回 (头部长度, None)"""
+    if len(data) < 8:
+        raise DownloadError("不是有效的safetensors文件: 文件过短")
+    header_size = struct.unpack("<Q", bytes(data[:8]))[0]
+    if header_size > MAX_HEADER_SIZE:
+        raise DownloadError(f"不是有效的safetensors文件: 头部长度 {header_size} 超过上限")
+    if len(data) < 8 + header_size:
+        return header_size, None
+    try:
+        header = json.loads(bytes(data[8:8 + header_size]).decode("utf-8"))
+    except ValueError as e:
+        raise DownloadError(f"不是有效的safetensors文件: 头部无法解析 ({e})")
+    if not isinstance(header, dict):
+        raise DownloadError("不是有效的safetensors文件: 头部不是JSON对象")
+    return header_size, header
+
+def build_header(tensors, metadata=None):
+    """生成safetensors头部 (含8字节长度), tensors为 [(名称, dtype, shape, 长度)], 按顺序连续存放
+
+    头部用空格补齐到8字节的倍数, 与safetensors库写出的文件一致。
+    """
+    header = {}
+    if metadata:
+        header["__metadata__"] = metadata
+    offset = 0
+    for name, dtype, shape, length in tensors:
+        header[name] = {"dtype": dtype, "shape": shape, "data_offsets": [offset, offset + length]}
+        offset += length
+    data = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    data += b" " * (-len(data) % 8)
+    return struct.pack("<Q", len(data)) + data
+
+class TensorIndex:
+    """张量名 -> 分片和字节范围的索引
+
+    shards: {分片: {"size": 文件大小, "data_start": 数据区在文件中的位置, "metadata": __metadata__,
+    "tensors": {名称: [dtype, shape, 起始, 结束]}}}, 起止位置相对于数据区。
+    weight_map: 仓库索引文件中的 {名称: 分片}, 只用于决定需要读取哪些分片的头部。
+    """
+    def __init__(self, commit=None, shards=None, weight_map=None):
+        self.commit = commit
+        self.shards = shards or {}
+        self.weight_map = weight_map or {}
+
+    @classmethod
+    def load(cls, local_dir, commit):
+        """读取缓存的索引, 不存在、损坏或提交不同时返回空索引"""
+        try:
+            with open(os.path.join(local_dir, INDEX_CACHE_FILE), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("commit") == commit:
+                return cls(commit, data.get("shards"), data.get("weight_map"))
+        except (OSError, ValueError, AttributeError):
+            pass
+        return cls(commit)
+
+    def save(self, local_dir):
+        path = os.path.join(local_dir, INDEX_CACHE_FILE)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"commit": self.commit, "weight_map": self.weight_map, "shards": self.shards}, f)
+        os.replace(temp_path, path)
+
+    def add_shard(self, shard, size, header_size, header):
+        tensors = {}
+        for name, info in header.items():
+            if name == "__metadata__":
+                continue
+            start, end = info["data_offsets"]
+            tensors[name] = [info["dtype"], info["shape"], start, end]
+        self.shards[shard] = {"size": size, "data_start": 8 + header_size,
+                              "metadata": header.get("__metadata__"), "tensors": tensors}
+
+    def tensor_names(self, shards=None):
+        """已知的所有张量名 -> 分片 (包括只在weight_map中出现、头部尚未读取的张量)"""
+        names = dict(self.weight_map)
+        for shard, info in self.shards.items():
+            if shards is None or shard in shards:
+                for name in info["tensors"]:
+                    names[name] = shard
+        return names
+
+    def select(self, patterns, shards=None):
+        """按张量名或通配符选择张量, 返回 {分片: [名称]}; 某个模式没有匹配任何张量时抛出ValueError"""
+        names = self.tensor_names(shards)
+        selected = {}
+        for pattern in patterns:
+            matched = [name for name in names if name == pattern or fnmatch.fnmatchcase(name, pattern)]
+            if not matched:
+                raise ValueError(f"没有与 {pattern} 匹配的张量")
+            for name in matched:
+                selected.setdefault(names[name], set()).add(name)
+        return {shard: sorted(names) for shard, names in selected.items()}
+
+class ShardPlan:
+    """一个输出分片: 选中张量在远程文件中的位置和在输出文件中的位置"""
+    def __init__(self, shard, info, names):
+        self.shard = shard
+        self.remote_size = info["size"]
+        tensors = sorted(((name,) + tuple(info["tensors"][name]) for name in names), key=lambda t: t[3])
+        self.header = build_header([(name, dtype, shape, end - start) for name, dtype, shape, start, end in tensors],
+                                   info.get("metadata"))
+        self.names = [t[0] for t in tensors]
+        # (远程起始, 远程结束, 输出起始), 远程位置为文件中的绝对位置
+        self.ranges = []
+        position = len(self.header)
+        for name, dtype, shape, start, end in tensors:
+            self.ranges.append((info["data_start"] + start, info["data_start"] + end, position))
+            position += end - start
+        self.size = position
+        self.data_size = position - len(self.header)
+
+    def groups(self, gap=RANGE_GAP):
+        """把相邻的张量合并为若干个Range请求, 返回 [(远程起始, 远程结束, [范围])]"""
+        groups = []
+        for item in self.ranges:
+            if groups and item[0] - groups[-1][1] <= gap:
+                groups[-1][1] = max(groups[-1][1], item[1])
+                groups[-1][2].append(item)
+            else:
+                groups.append([item[0], item[1], [item]])
+        return [tuple(group) for group in groups]
+
+    def matches(self, path):
+        """本地文件已是按本计划写出的完整文件时返回True"""
+        try:
+            if os.path.getsize(path) != self.size:
+                return False
+            with open(path, "rb") as f:
+                return f.read(len(self.header)) == self.header
+        except OSError:
+            return False
+
+def read_remote_header(engine, shard, endpoint=None):
+    """用Range请求读取分片的头部, 返回 (文件大小, 头部长度, 头部JSON)"""
+    data = bytearray()
+    size = None
+    header_size = header = None
+    while header is None:
+        start = len(data)
+        end = start + HEADER_PROBE_SIZE - 1 if header_size is None else 8 + header_size - 1
+        headers = engine.get_headers()
+        headers["Range"] = f"bytes={start}-{end}"
+        response = engine._request(shard, headers, endpoint)
+        completed = False
+        try:
+            if response.status >= 400:
+                raise http_error(response)
+            if response.status == 206:
+                content_range = response.headers.get("Content-Range", "")
+                if "/" in content_range and content_range.rsplit("/", 1)[1].isdigit():
+                    size = int(content_range.rsplit("/", 1)[1])
+            elif start == 0:
+                # 服务器不支持Range, 只读取需要的部分后关闭连接
+                length = response.headers.get("Content-Length")
+                size = int(length) if length is not None else None
+            else:
+                raise DownloadError("服务器不支持Range请求, 无法只下载部分张量")
+            completed = response.status == 206
+            for chunk in response.stream(engine.chunk_size):
+                data += chunk
+                if not completed and len(data) > end:
+                    break  # 完整的响应只读取需要的部分, 连接不能复用
+        finally:
+            engine._release(response, completed)
+        if len(data) <= start:
+            raise TransientError(f"读取 {shard} 的头部时连接中断")
+        header_size, header = parse_header(data)
+    if size is None:
+        raise DownloadError(f"无法获取 {shard} 的大小")
+    return size, header_size, header
+
+class TensorDownloader:
+    """用DownloadEngine的连接、重试、限速和取消机制下载选中的张量
+
+    repo_files为仓库元数据中的文件信息 ({文件名: {"size", ...}}), 用于判断缓存的索引是否仍然有效。
+    """
+    def __init__(self, engine, local_dir, repo_files, commit=None):
+        self.engine = engine
+        self.tracker = engine.tracker
+        self.local_dir = local_dir
+        self.repo_files = repo_files
+        self.index = TensorIndex.load(local_dir, commit)
+        self.index.commit = commit
+
+    def load_weight_maps(self, index_files):
+        """下载仓库的分片索引文件, 合并其中的weight_map"""
+        for filename in index_files:
+            if self.engine.is_cancelled():
+                return
+            headers = self.engine.get_headers()
+            response = self.engine._request(filename, headers)
+            completed = False
+            try:
+                if response.status >= 400:
+                    raise http_error(response)
+                data = response.read()
+                completed = True
+            finally:
+                self.engine._release(response, completed)
+            try:
+                weight_map = json.loads(data.decode("utf-8"))["weight_map"]
+            except (ValueError, KeyError, TypeError) as e:
+                raise DownloadError(f"无法解析 {filename}: {e}")
+            directory = filename.rsplit("/", 1)[0] + "/" if "/" in filename else ""
+            for name, shard in weight_map.items():
+                self.index.weight_map[name] = directory + shard
+
+    def index_shards(self, shards):
+        """读取尚未索引 (或大小已变化) 的分片头部, 并行进行"""
+        pending = [shard for shard in shards
+                   if self.index.shards.get(shard, {}).get("size") != self.repo_files[shard]["size"]]
+        if not pending:
+            return
+        self.tracker.log(f"正在读取 {len(pending)} 个safetensors分片的头部...")
+        with ThreadPoolExecutor(max_workers=self.engine.max_workers, thread_name_prefix="hf-header") as pool:
+            futures = {pool.submit(self._read_header, shard): shard for shard in pending}
+            for future in as_completed(futures):
+                size, header_size, header = future.result()
+                self.index.add_shard(futures[future], size, header_size, header)
+        try:
+            self.index.save(self.local_dir)
+        except OSError as e:
+            self.tracker.log(f"无法保存张量索引: {e}")
+
+    def _read_header(self, shard):
+        attempt = 0
+        while True:
+            try:
+                return read_remote_header(self.engine, shard)
+            except Exception as e:
+                error = classify_error(e)
+                attempt += 1
+                if self.engine.is_cancelled() or not self.engine.retry_policy.should_retry(error, attempt):
+                    raise DownloadError(f"读取 {shard} 的头部失败: {error}") from e
+            if not self.engine._wait_before_retry(shard, error, attempt):
+                raise DownloadError("下载已取消")
+
+    def plan(self, patterns, shards, index_files=()):
+        """建立索引并选择张量, 返回 [ShardPlan]"""
+        shards = [shard for shard in shards if shard in self.repo_files]
+        if index_files and not self.index.weight_map:
+            self.load_weight_maps(index_files)
+        needed = shards
+        if self.index.weight_map:
+            # 按weight_map只读取包含选中张量的分片; 不在weight_map中的分片仍需读取头部
+            mapped = set(self.index.weight_map.values())
+            try:
+                selected = self.index.select(patterns, set(shards))
+                needed = [shard for shard in shards if shard in selected or shard not in mapped]
+            except ValueError:
+                pass  # 可能在weight_map之外的分片中, 读取全部头部后再判断
+        self.index_shards(needed)
+        known = {shard: info for shard, info in self.index.shards.items() if shard in shards}
+        selection = TensorIndex(shards=known).select(patterns) if known else {}
+        return [ShardPlan(shard, known[shard], names) for shard, names in sorted(selection.items())]
+
+    def write_index(self, plans, index_files):
+        """为输出的分片生成精简的分片索引文件 (与仓库中的索引文件同名)"""
+        weight_map = {name: plan.shard for plan in plans for name in plan.names}
+        for filename in index_files:
+            directory = filename.rsplit("/", 1)[0] + "/" if "/" in filename else ""
+            entries = {name: shard[len(directory):] for name, shard in weight_map.items()
+                       if shard.startswith(directory)}
+            if not entries:
+                continue
+            total = sum(plan.data_size for plan in plans if plan.shard.startswith(directory))
+            path = os.path.join(self.local_dir, *filename.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"metadata": {"total_size": total}, "weight_map": dict(sorted(entries.items()))}, f,
+                          indent=2)
+            os.replace(path + ".tmp", path)
+
+    def download(self, plans):
+        """下载所有输出分片, 返回成功的分片"""
+        succeeded = []
+        self.tracker.files_queued([plan.shard for plan in plans])
+        with ThreadPoolExecutor(max_workers=self.engine.max_workers, thread_name_prefix="hf-tensor") as pool:
+            futures = {pool.submit(self.download_shard, plan): plan.shard for plan in plans}
+            for future in as_completed(futures):
+                shard = futures[future]
+                try:
+                    if future.result():
+                        succeeded.append(shard)
+                        self.tracker.add_downloaded_file(shard)
+                except Exception as e:
+                    self.engine._report_failure(shard, e)
+        return succeeded
+
+    def download_shard(self, plan):
+        """写出只包含选中张量的分片, 已存在相同的文件时跳过"""
+        if self.engine.is_cancelled():
+            return False
+        self.tracker.file_started(plan.shard)
+        target = os.path.join(self.local_dir, *plan.shard.split("/"))
+        if plan.matches(target):
+            self.tracker.add_bytes(plan.shard, plan.size, resumed=True)
+            return True
+        # 与完整下载的.incomplete文件区分开, 避免之后被当作完整文件续传
+        temp_path = target + ".tensors.incomplete"
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(temp_path, "wb") as f:
+            preallocate(f, plan.size)
+            f.write(plan.header)
+        self.tracker.add_bytes(plan.shard, len(plan.header), resumed=True)
+        try:
+            with open(temp_path, "r+b", buffering=self.engine.write_buffer_size) as f:
+                for group in plan.groups():
+                    self._fetch_group(plan, group, f)
+                    if self.engine.is_cancelled():
+                        break
+                else:
+                    if self.engine.fsync:
+                        fsync(f)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        if self.engine.is_cancelled():
+            # 只下载部分张量的文件不续传, 下次重新下载
+            os.remove(temp_path)
+            return False
+        os.replace(temp_path, target)
+        return True
+
+    def _fetch_group(self, plan, group, f):
+        """下载一组相邻张量所在的字节范围, 中断时从已接收的位置重试"""
+        position = [group[0]]
+        attempt = 0
+        while True:
+            try:
+                return self._fetch_range(plan, group, position, f)
+            except Exception as e:
+                error = classify_error(e)
+                attempt += 1
+                if self.engine.is_cancelled() or not self.engine.retry_policy.should_retry(error, attempt):
+                    if error is e:
+                        raise
+                    raise error from e
+            if not self.engine._wait_before_retry(plan.shard, error, attempt,
+                                                  segment=f"{position[0]}-{group[1] - 1}"):
+                return
+
+    def _fetch_range(self, plan, group, position, f):
+        start, end, ranges = group
+        headers = self.engine.get_headers()
+        headers["Range"] = f"bytes={position[0]}-{end - 1}"
+        response = self.engine._request(plan.shard, headers)
+        completed = False
+        try:
+            if response.status != 206:
+                raise http_error(response, "分段请求失败: HTTP")
+            content_range = response.headers.get("Content-Range", "")
+            if not content_range.endswith(f"/{plan.remote_size}"):
+                raise RemoteChangedError(f"远程文件大小已变化 ({content_range}), 请删除张量索引后重试")
+            for chunk in response.stream(self.engine.chunk_size):
+                if self.engine.is_cancelled():
+                    return
+                chunk_start = position[0]
+                chunk_end = chunk_start + len(chunk)
+                # 只写出落在选中张量中的部分, 张量之间的间隔直接丢弃
+                for remote_start, remote_end, output_start in ranges:
+                    lo, hi = max(chunk_start, remote_start), min(chunk_end, remote_end)
+                    if lo >= hi:
+                        continue
+                    offset = output_start + lo - remote_start
+                    if f.tell() != offset:
+                        f.seek(offset)
+                    f.write(chunk[lo - chunk_start:hi - chunk_start])
+                    self.tracker.add_bytes(plan.shard, hi - lo)
+                position[0] = chunk_end
+                self.engine._throttle(len(chunk))
+            if position[0] < end:
+                raise TransientError(f"数据传输中断 (IncompleteRead): 范围 {start}-{end - 1} 未接收完整")
+            completed = True
+        finally:
+            self.engine._release(response, completed)
+
+def format_tensor_index(index, shards=None):
+    """把索引格式化为每行一个张量: 名称、dtype、shape、大小、分片"""
+    lines = []
+    for shard in sorted(index.shards):
+        if shards is not None and shard not in shards:
+            continue
+        for name, (dtype, shape, start, end) in sorted(index.shards[shard]["tensors"].items()):
+            lines.append(f"{name}  {dtype}  {list(shape)}  {format_size(end - start)}  {shard}")
+    return "\n".join(lines)
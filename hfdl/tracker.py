@@ -0,0 +1,546 @@
+"""下载进度和统计信息跟踪"""
+import os
+import time
+import threading
+from collections import Counter
+from datetime import datetime
+
+from .metrics import Histogram, TIME_BUCKETS, RATE_BUCKETS
+from .utils import format_size, format_duration
+
+class DownloadTracker:
+    """跟踪下载进度和统计信息的类
+
+    传输层在每次写入数据块后调用add_bytes累计字节数, 前端定时调用update_speed
+    计算平滑速度和剩余时间。所有状态变化都以 (事件名, 数据字典) 的形式交给listener,
+    需要显示给用户的事件带有"message"字段。listener可能在任意线程中被调用。
+
+    同时记录每个文件的排队等待、首字节时间、字节数和重试次数: 文件结束时累计到直方图,
+    给出metrics_log (metrics.MetricsLog) 时再写入一条JSONL记录, labels (仓库ID等) 附加在每条记录中。
+    """
+    speed_update_interval = 1.0  # 速度刷新间隔(秒)
+    speed_smoothing = 0.3        # EWMA平滑系数, 越大越灵敏
+    stall_threshold = 15         # 超过该秒数没有收到数据视为停滞
+
+    def __init__(self, listener=None, metrics_log=None):
+        self.listener = listener
+        self.metrics_log = metrics_log
+        self.labels = {}             # 附加在指标中的标签, 由DownloadJob设置repo_id和revision
+        self.total_files = 0
+        self.downloaded_files = 0
+        self.failed_files = []
+        self.failed_files_info = {}  # 文件 -> 错误信息
+        self.failed_files_kind = {}  # 文件 -> 错误类型 (DownloadError.kind)
+        self.retries = 0             # 重试次数 (文件和分段)
+        self.retry_kinds = Counter()  # 错误类型 -> 重试次数
+        self.file_timings = {}       # 文件 -> 排队/开始/首字节时间、字节数、重试次数
+        self.file_statuses = Counter()  # 结果 -> 已结束的文件数
+        self.histograms = self._new_histograms()
+        self.download_start_time = None
+        self.download_end_time = None
+        self.expected_bytes = 0      # 元数据中的总字节数
+        self.total_bytes = 0         # 已落盘字节数 (含续传前已有的部分)
+        self.transferred_bytes = 0   # 本次通过网络接收的字节数
+        self.file_sizes = {}         # 文件 -> 预期字节数
+        self.file_progress = {}      # 文件 -> 已完成字节数
+        self.active_files = set()
+        self.resumable_files = {}    # 取消时保留的部分文件 -> 已保存字节数
+        self.deduplicated_files = {} # 从本地内容存储复用的文件 -> 字节数
+        self.extracted_archives = {} # 边下载边解压的归档 -> (解压出的文件数, 字节数)
+        self.peer_files = {}         # 从局域网节点获取的文件 -> 字节数
+        self.unchanged_files = 0     # 增量同步时已是最新、无需下载的文件数
+        self.verified_files = 0      # 通过sha256校验的文件数
+        self.ready_files = set()     # 加载模型所需、尚未完成的文件
+        self.ready_count = 0
+        self.ready_time = None       # 加载所需的文件全部就绪的时间
+        self.speed = 0.0
+        self.last_update_time = time.time()
+        self.last_transferred = 0
+        self.last_data_time = time.time()
+        self.running = False
+        self.lock = threading.Lock()
+        
+    def start(self):
+        """开始下载跟踪"""
+        self.total_files = 0
+        self.downloaded_files = 0
+        self.failed_files = []
+        self.failed_files_info = {}
+        self.failed_files_kind = {}
+        self.retries = 0
+        self.retry_kinds = Counter()
+        self.file_timings = {}
+        self.file_statuses = Counter()
+        self.histograms = self._new_histograms()
+        self.download_start_time = datetime.now()
+        self.expected_bytes = 0
+        self.total_bytes = 0
+        self.transferred_bytes = 0
+        self.file_sizes = {}
+        self.file_progress = {}
+        self.active_files = set()
+        self.resumable_files = {}
+        self.deduplicated_files = {}
+        self.extracted_archives = {}
+        self.peer_files = {}
+        self.unchanged_files = 0
+        self.verified_files = 0
+        self.ready_files = set()
+        self.ready_count = 0
+        self.ready_time = None
+        self.speed = 0.0
+        self.last_update_time = time.time()
+        self.last_transferred = 0
+        self.last_data_time = time.time()
+        self.running = True
+        self.emit("start")
+    
+    def end(self):
+        """结束下载跟踪"""
+        if self.running:
+            self.download_end_time = datetime.now()
+            self.running = False
+            self.emit("end")
+    
+    def emit(self, event, **data):
+        if self.listener is not None:
+            self.listener(event, data)
+    
+    def log(self, message):
+        self.emit("log", message=message)
+    
+    def set_total_files(self, count):
+        """设置预期的总文件数"""
+        self.total_files = count
+        self.emit("total_files", count=count, message=f"仓库中共有 {count} 个文件")
+    
+    def set_file_sizes(self, file_sizes):
+        """设置每个文件的预期大小, 用于计算总进度"""
+        with self.lock:
+            self.file_sizes = dict(file_sizes)
+            self.expected_bytes = sum(self.file_sizes.values())
+        self.emit("total_bytes", bytes=self.expected_bytes,
+                  message=f"待下载总大小: {format_size(self.expected_bytes)}")
+    
+    def set_ready_files(self, filenames):
+        """设置加载模型所需的文件 (配置、分词器、分片索引), 全部完成时发出"metadata_ready"事件"""
+        with self.lock:
+            self.ready_files = set(filenames)
+            self.ready_count = len(self.ready_files)
+            self.ready_time = None
+    
+    def _mark_ready(self, filenames):
+        with self.lock:
+            if not self.ready_files:
+                return
+            self.ready_files.difference_update(filenames)
+            if self.ready_files:
+                return
+            self.ready_time = datetime.now()
+            start = self.download_start_time
+            elapsed = (self.ready_time - start).total_seconds() if start else None
+        self.emit("metadata_ready", files=self.ready_count, elapsed=elapsed,
+                  message=f"加载所需的 {self.ready_count} 个配置和分词器文件已就绪"
+                          + (f" (用时 {elapsed:.1f} 秒)" if elapsed is not None else "")
+                          + ", 可以开始加载模型, 其余文件继续下载")
+    
+    def add_bytes(self, filename, nbytes, resumed=False):
+        """累计文件的已完成字节数, resumed表示本地已有的数据 (不计入速度)"""
+        with self.lock:
+            self.file_progress[filename] = self.file_progress.get(filename, 0) + nbytes
+            self.total_bytes += nbytes
+            self.active_files.add(filename)
+            timing = self._timing(filename)
+            if resumed:
+                timing["resumed_bytes"] += nbytes
+            else:
+                self.transferred_bytes += nbytes
+                self.last_data_time = time.time()
+                timing["bytes"] += nbytes
+                if timing["first_byte"] is None:
+                    timing["first_byte"] = self.last_data_time
+    
+    # --- 逐文件指标 ---
+    
+    @staticmethod
+    def _new_histograms():
+        return {"queue_wait": Histogram(TIME_BUCKETS), "ttfb": Histogram(TIME_BUCKETS),
+                "duration": Histogram(TIME_BUCKETS), "throughput": Histogram(RATE_BUCKETS)}
+    
+    def _timing(self, filename):
+        """调用时需持有self.lock"""
+        timing = self.file_timings.get(filename)
+        if timing is None:
+            timing = {"queued": None, "started": None, "first_byte": None, "bytes": 0, "resumed_bytes": 0,
+                      "retries": 0}
+            self.file_timings[filename] = timing
+        return timing
+    
+    def files_queued(self, filenames):
+        """记录文件进入下载队列的时间"""
+        now = time.time()
+        with self.lock:
+            for filename in filenames:
+                self._timing(filename)["queued"] = now
+    
+    def file_started(self, filename):
+        """记录文件开始下载 (离开队列) 的时间"""
+        with self.lock:
+            timing = self._timing(filename)
+            if timing["started"] is None:
+                timing["started"] = time.time()
+    
+    def _finish_file(self, filename, status, error=None, kind=None):
+        """文件结束时累计直方图并写入一条指标记录, 调用时需持有self.lock, 返回记录"""
+        now = time.time()
+        timing = self.file_timings.pop(filename, None) or {}
+        started, queued, first_byte = timing.get("started"), timing.get("queued"), timing.get("first_byte")
+        nbytes = timing.get("bytes", 0)
+        record = dict(self.labels, file=filename, status=status, size=self.file_sizes.get(filename),
+                      bytes=nbytes, resumed_bytes=timing.get("resumed_bytes", 0), retries=timing.get("retries", 0),
+                      queue_wait=None, ttfb=None, duration=None, throughput=None)
+        if started is not None:
+            if queued is not None:
+                record["queue_wait"] = max(0.0, started - queued)
+                self.histograms["queue_wait"].observe(record["queue_wait"])
+            if first_byte is not None:
+                record["ttfb"] = max(0.0, first_byte - started)
+                self.histograms["ttfb"].observe(record["ttfb"])
+            record["duration"] = max(0.0, now - started)
+            self.histograms["duration"].observe(record["duration"])
+            if nbytes and record["duration"] > 0:
+                record["throughput"] = nbytes / record["duration"]
+                self.histograms["throughput"].observe(record["throughput"])
+        if "extracted_files" in timing:
+            record["extracted_files"] = timing["extracted_files"]
+            record["extracted_bytes"] = timing["extracted_bytes"]
+            if timing.get("extract_error"):
+                record["extract_error"] = timing["extract_error"]
+        if "peer_bytes" in timing:
+            record["peer_bytes"] = timing["peer_bytes"]
+        if error is not None:
+            record["error"] = error
+            record["error_kind"] = kind
+        self.file_statuses[status] += 1
+        return record
+    
+    def _write_metrics(self, records):
+        if self.metrics_log is not None:
+            for record in records:
+                self.metrics_log.write(record)
+    
+    def metrics_snapshot(self):
+        """返回当前的计数器和直方图副本, 供metrics.render_metrics使用"""
+        with self.lock:
+            return {
+                "files": dict(self.file_statuses),
+                "transferred_bytes": self.transferred_bytes,
+                "peer_bytes": sum(self.peer_files.values()),
+                "retries": dict(self.retry_kinds),
+                "expected_bytes": self.expected_bytes,
+                "done_bytes": self.total_bytes,
+                "speed": float(self.speed),
+                "active_files": len(self.active_files),
+                "running": int(self.running),
+                "queue_wait": self.histograms["queue_wait"].copy(),
+                "ttfb": self.histograms["ttfb"].copy(),
+                "duration": self.histograms["duration"].copy(),
+                "throughput": self.histograms["throughput"].copy(),
+            }
+    
+    def reset_file(self, filename):
+        """文件需要从头下载时, 撤销已累计的字节数"""
+        with self.lock:
+            self.total_bytes -= self.file_progress.pop(filename, 0)
+    
+    def add_downloaded_file(self, filename):
+        """记录下载成功的文件"""
+        with self.lock:
+            self.downloaded_files += 1
+            self.active_files.discard(filename)
+            size = self.file_sizes.get(filename)
+            record = self._finish_file(filename, "deduplicated" if filename in self.deduplicated_files else "ok")
+        self._write_metrics([record])
+        self.emit("file_done", file=filename, size=size,
+                  message=f"已完成: {filename}" + (f" ({format_size(size)})" if size else ""))
+        self._mark_ready([filename])
+    
+    def add_retry(self, filename, error_message, attempt, max_retries, delay, kind=None, segment=None):
+        """记录一次重试, attempt为第几次重试"""
+        with self.lock:
+            self.retries += 1
+            self.retry_kinds[kind or "error"] += 1
+            self._timing(filename)["retries"] += 1
+        where = f"{os.path.basename(filename)}" + (f" 分段 {segment}" if segment else "")
+        self.emit("file_retry", file=filename, error=error_message, kind=kind, attempt=attempt, delay=delay,
+                  segment=segment,
+                  message=f"{where} 出错: {error_message}, {delay:.1f} 秒后重试 ({attempt}/{max_retries})")
+    
+    def add_failed_file(self, filename, error_message, kind=None):
+        """记录失败的文件, kind为错误类型 (见errors.py), 用于给出故障排除建议"""
+        with self.lock:
+            self.failed_files.append(filename)
+            self.failed_files_info[filename] = error_message
+            if kind:
+                self.failed_files_kind[filename] = kind
+            self.active_files.discard(filename)
+            record = self._finish_file(filename, "failed", error=error_message, kind=kind)
+        self._write_metrics([record])
+        self.emit("file_failed", file=filename, error=error_message, kind=kind,
+                  message=f"文件下载失败: {os.path.basename(filename)}\n  错误: {error_message}")
+    
+    def add_resumable_file(self, filename, saved_bytes):
+        """记录取消时保留在本地、下次可续传的部分文件"""
+        with self.lock:
+            self.resumable_files[filename] = saved_bytes
+            self.active_files.discard(filename)
+            record = self._finish_file(filename, "partial")
+        self._write_metrics([record])
+        self.emit("file_partial", file=filename, saved_bytes=saved_bytes)
+    
+    def add_verified_file(self, filename):
+        """记录通过哈希校验的文件 (不发出事件, 只计入摘要)"""
+        with self.lock:
+            self.verified_files += 1
+    
+    def add_unchanged_files(self, filenames):
+        """记录增量同步时与清单一致、无需下载的文件, 只发出一个事件"""
+        with self.lock:
+            nbytes = sum(self.file_sizes.get(f, 0) for f in filenames)
+            for filename in filenames:
+                self.file_progress[filename] = self.file_sizes.get(filename, 0)
+            self.total_bytes += nbytes
+            self.downloaded_files += len(filenames)
+            self.unchanged_files += len(filenames)
+            records = [self._finish_file(filename, "unchanged") for filename in filenames]
+        self._write_metrics(records)
+        self.emit("files_unchanged", count=len(filenames), bytes=nbytes,
+                  message=f"{len(filenames)} 个文件已是最新 ({format_size(nbytes)}), 无需下载")
+        self._mark_ready(filenames)
+    
+    def add_deduplicated_file(self, filename, size, mode):
+        """记录从本地内容存储复用、无需下载的文件, mode为hardlink/reflink/symlink/copy"""
+        with self.lock:
+            self.deduplicated_files[filename] = size
+        self.emit("file_deduplicated", file=filename, size=size, mode=mode,
+                  message=f"已从本地存储复用 ({mode}): {filename} ({format_size(size)})")
+    
+    def add_extracted_archive(self, filename, files, nbytes, dest, error=None):
+        """记录边下载边解压的归档, 在add_downloaded_file之前调用, 解压结果计入该文件的指标记录
+
+        error不为None时归档已下载但无法解压。
+        """
+        with self.lock:
+            if error is None:
+                self.extracted_archives[filename] = (files, nbytes)
+            timing = self._timing(filename)
+            timing.update(extracted_files=files, extracted_bytes=nbytes, extract_error=error)
+        if error is not None:
+            message = f"无法解压 {os.path.basename(filename)}, 只保留了归档: {error}"
+        else:
+            message = f"已解压: {filename} -> {dest} ({files} 个文件, {format_size(nbytes)})"
+        self.emit("file_extracted", file=filename, dest=dest, files=files, bytes=nbytes, error=error,
+                  message=message)
+    
+    def add_peer_file(self, filename, size, peers):
+        """记录从局域网节点获取的文件, 在add_downloaded_file之前调用, peers为参与传输的节点数"""
+        with self.lock:
+            self.peer_files[filename] = size
+            self._timing(filename)["peer_bytes"] = size
+        self.emit("file_from_peers", file=filename, size=size, peers=peers,
+                  message=f"已从 {peers} 个局域网节点获取: {filename} ({format_size(size)})")
+    
+    @property
+    def peer_bytes(self):
+        return sum(self.peer_files.values())
+    
+    @property
+    def deduplicated_bytes(self):
+        return sum(self.deduplicated_files.values())
+    
+    def get_summary(self):
+        """生成下载任务的摘要信息"""
+        # 计算下载时间
+        duration = None
+        if self.download_start_time and self.download_end_time:
+            duration = (self.download_end_time - self.download_start_time).total_seconds()
+            duration_str = f"{duration:.1f} 秒" if duration < 60 else format_duration(duration)
+        else:
+            duration_str = "未知"
+        
+        # 优先使用逐文件统计的成功数, 否则从total_files中减去失败文件数来估算
+        if self.downloaded_files > 0:
+            estimated_success = self.downloaded_files
+        elif self.total_files > 0:
+            estimated_success = max(0, self.total_files - len(self.failed_files))
+        else:
+            estimated_success = "未知"
+        
+        # 构建摘要信息
+        summary = [
+            "======= 下载任务摘要 =======",
+            f"总文件数: {self.total_files if self.total_files > 0 else '未知'}",
+            f"成功下载: {estimated_success}",
+            f"失败文件: {len(self.failed_files)}",
+            f"下载用时: {duration_str}"
+        ]
+        if self.retries:
+            summary.append(f"重试次数: {self.retries}")
+        if self.expected_bytes > 0:
+            summary.append(f"完成大小: {format_size(self.total_bytes)} / {format_size(self.expected_bytes)}")
+        if duration:
+            summary.append(f"本次传输: {format_size(self.transferred_bytes)}, "
+                           f"平均速度: {format_size(self.transferred_bytes / duration)}/s")
+        if self.ready_time and self.download_start_time:
+            ready = (self.ready_time - self.download_start_time).total_seconds()
+            summary.append(f"配置和分词器就绪用时: {ready:.1f} 秒")
+        if self.verified_files:
+            summary.append(f"哈希校验通过: {self.verified_files} 个文件")
+        if self.unchanged_files:
+            summary.append(f"已是最新 (未重新下载): {self.unchanged_files} 个文件")
+        if self.deduplicated_files:
+            summary.append(f"从本地存储复用: {len(self.deduplicated_files)} 个文件, "
+                           f"节省下载 {format_size(self.deduplicated_bytes)}")
+        if self.peer_files:
+            summary.append(f"从局域网节点获取: {len(self.peer_files)} 个文件 ({format_size(self.peer_bytes)}), "
+                           f"从Hub传输 {format_size(max(0, self.transferred_bytes - self.peer_bytes))}")
+        if self.extracted_archives:
+            files = sum(count for count, _ in self.extracted_archives.values())
+            nbytes = sum(size for _, size in self.extracted_archives.values())
+            summary.append(f"边下载边解压: {len(self.extracted_archives)} 个归档, "
+                           f"共 {files} 个文件 ({format_size(nbytes)})")
+        if self.resumable_files:
+            saved = sum(self.resumable_files.values())
+            summary.append(f"可续传的部分文件: {len(self.resumable_files)} 个, 已保存 {format_size(saved)}")
+        
+        # 如果有失败的文件，添加失败详情
+        if self.failed_files:
+            summary.append("\n==== 下载失败的文件 ====")
+            for i, filename in enumerate(self.failed_files, 1):
+                error_msg = self.failed_files_info.get(filename, "未知错误")
+                summary.append(f"{i}. {os.path.basename(filename)}")
+                summary.append(f"   错误: {error_msg}")
+        
+        # 根据失败类型提供建议
+        if self.failed_files:
+            summary.append("\n==== 故障排除建议 ====")
+            
+            # 分析错误类型: 优先使用记录的错误类型, 没有类型的错误按错误信息判断
+            kinds = set(self.failed_files_kind.values())
+            untyped = [str(err) for f, err in self.failed_files_info.items() if f not in self.failed_files_kind]
+            
+            network_errors = "network" in kinds or any("timeout" in err.lower() or
+                                                       "connection" in err.lower() or
+                                                       "incompleteread" in err.lower()
+                                                       for err in untyped)
+            
+            not_found_errors = "not_found" in kinds or any("not found" in err.lower() or
+                                                           "404" in err.lower()
+                                                           for err in untyped)
+            
+            hash_errors = "hash" in kinds or any("校验失败" in err or "大小不一致" in err for err in untyped)
+            
+            auth_errors = "auth" in kinds or any("unauthorized" in err.lower() or
+                                                 "authentication" in err.lower()
+                                                 for err in untyped)
+            
+            if network_errors:
+                summary.append("• 网络连接问题:")
+                summary.append("  - 检查您的网络连接是否稳定。")
+                summary.append("  - 尝试更换代理服务器或检查代理设置。")
+                summary.append("  - 确保已开启 断点续传 选项后重试。")
+            
+            if "server" in kinds or "rate_limit" in kinds:
+                summary.append("• 服务器繁忙或请求过于频繁:")
+                summary.append("  - 自动重试次数已用完, 请稍后再试。")
+                summary.append("  - 减少并发数, 或配置镜像地址分担请求。")
+            
+            if not_found_errors:
+                summary.append("• 文件不存在问题:")
+                summary.append("  - 确认仓库ID是否正确无误。")
+                summary.append("  - 文件可能已被移除、重命名，或在特定分支/版本中不存在。")
+                summary.append("  - 访问仓库页面检查最新文件列表。")
+            
+            if hash_errors:
+                summary.append("• 文件校验失败:")
+                summary.append("  - 文件内容与仓库记录的哈希值不一致, 可能是传输中被截断或损坏。")
+                summary.append("  - 重新下载这些文件即可 (下载时校验失败的临时文件已自动删除)。")
+            
+            if auth_errors:
+                summary.append("• 认证问题:")
+                summary.append("  - 如果是私有仓库，请确保您已在HuggingFace Hub登录或提供了有效的Token。")
+                summary.append("  - 检查Token是否具有读取此仓库的权限。")
+            
+            if "disk" in kinds:
+                summary.append("• 写入本地文件失败:")
+                summary.append("  - 检查保存目录所在磁盘的剩余空间和写入权限。")
+            
+            if "archive" in kinds:
+                summary.append("• 归档无法解压:")
+                summary.append("  - 归档格式错误、加密或使用了不支持的压缩方法。")
+                summary.append("  - 保留归档文件后重新下载, 再用其他工具手动解压。")
+            
+            if "changed" in kinds:
+                summary.append("• 远程文件已变化:")
+                summary.append("  - 仓库在下载过程中被更新, 关闭断点续传后重新下载这些文件。")
+            
+            # 通用建议
+            summary.append("\n• 通用建议:")
+            summary.append("  - 访问仓库主页手动下载失败的文件。")
+            summary.append("  - 尝试使用 `ignore_patterns` 忽略特定问题文件或大文件。")
+            summary.append("  - 查阅相关模型的HuggingFace社区或文档获取帮助。")
+        
+        return "\n".join(summary)
+
+    def update_speed(self):
+        """根据累计字节数计算平滑速度和剩余时间, 以"progress"事件发出并返回统计数据"""
+        current_time = time.time()
+        with self.lock:
+            elapsed = current_time - self.last_update_time
+            if elapsed <= 0:
+                return None
+            rate = (self.transferred_bytes - self.last_transferred) / elapsed
+            self.last_transferred = self.transferred_bytes
+            self.last_update_time = current_time
+            # 指数加权移动平均, 避免速度数字剧烈跳动
+            if self.speed == 0:
+                self.speed = rate
+            else:
+                self.speed = self.speed_smoothing * rate + (1 - self.speed_smoothing) * self.speed
+            done, expected = self.total_bytes, self.expected_bytes
+            idle = current_time - self.last_data_time
+            active = sorted(self.active_files, key=lambda f: -self.file_sizes.get(f, 0))
+            stats = {
+                "done_bytes": done,
+                "total_bytes": expected,
+                "transferred_bytes": self.transferred_bytes,
+                "percent": min(100.0, done * 100.0 / expected) if expected > 0 else None,
+                "speed": self.speed,
+                "eta": max(0, expected - done) / self.speed if expected > 0 and self.speed > 0 else None,
+                "stalled_for": idle if self.transferred_bytes and idle >= self.stall_threshold else 0,
+                "downloaded_files": self.downloaded_files,
+                "failed_files": len(self.failed_files),
+                "total_files": self.total_files,
+                "active_files": [{"file": f, "done": self.file_progress.get(f, 0),
+                                  "size": self.file_sizes.get(f, 0)} for f in active],
+            }
+        self.emit("progress", **stats)
+        return stats
+    
+    # 添加格式化文件大小的方法
+    def _format_size(self, bytes):
+        return format_size(bytes)
+
+def format_progress(stats, max_files=3):
+    """把update_speed返回的统计数据格式化为状态栏文本"""
+    status = f"下载速度：{format_size(stats['speed'])}/s"
+    if stats["total_bytes"] > 0:
+        status += f"  已完成：{format_size(stats['done_bytes'])} / {format_size(stats['total_bytes'])}"
+        if stats["eta"] is not None:
+            status += f"  剩余时间：{format_duration(stats['eta'])}"
+    if stats["stalled_for"]:
+        status += f"  (已 {int(stats['stalled_for'])} 秒未收到数据)"
+    for item in stats["active_files"][:max_files]:
+        percent = f"{item['done'] * 100.0 / item['size']:.1f}%" if item["size"] else format_size(item["done"])
+        status += f"\n  {os.path.basename(item['file'])}: {percent}"
+    return status
@@ -0,0 +1,108 @@
+"""通用辅助函数"""
+import os
+import re
+from fnmatch import translate
+
+from .constants import DEFAULT_REPO_TYPE, REPO_TYPES
+
+# 增加格式化文件大小的辅助方法
+def format_size(bytes, suffix="B"):
+    """将字节数转换为人类可读的格式"""
+    for unit in ["", "K", "M", "G", "T", "P", "E", "Z"]:
+        if abs(bytes) < 1024.0:
+            return f"{bytes:.2f} {unit}{suffix}"
+        bytes /= 1024.0
+    return f"{bytes:.2f} Y{suffix}"
+
+def parse_size(text):
+    """把 "200M"、"1.5GB"、"512k" 这样的大小解析为字节数 (按1024换算), 格式错误时抛出ValueError"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*(?:/s)?\s*", text, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"无法识别的大小: {text}")
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** " KMGT".index(unit.upper() or " "))
+
+def format_duration(seconds):
+    """将秒数转换为 "X 时 Y 分 Z 秒" 形式"""
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds} 秒"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes} 分 {seconds} 秒"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} 时 {minutes} 分"
+
+def parse_patterns(patterns_str):
+    """解析逗号分隔的文件模式, 为空时返回None"""
+    if not patterns_str:
+        return None
+    patterns = [pat.strip() for pat in patterns_str.split(',') if pat.strip()]
+    return patterns or None
+
+def _literal(pattern):
+    """不含通配符的模式返回对应的文件名 (glob.escape转义的字符还原), 否则返回None"""
+    sentinels = {"[[]": "\0", "[*]": "\1", "[?]": "\2"}
+    for escaped, sentinel in sentinels.items():
+        pattern = pattern.replace(escaped, sentinel)
+    if any(char in pattern for char in "*?["):
+        return None
+    for escaped, sentinel in sentinels.items():
+        pattern = pattern.replace(sentinel, escaped[1])
+    return pattern
+
+class _PatternMatcher:
+    """一组fnmatch模式的匹配器, 文件选择器可能生成上千个模式
+
+    不含通配符的文件和目录模式用集合查找, 其余模式合并为一个正则表达式。
+    与fnmatch一样先按平台规则normcase。
+    """
+    def __init__(self, patterns):
+        self.names, self.dirs, wildcards = set(), set(), []
+        for pattern in patterns:
+            pattern = os.path.normcase(pattern)
+            literal = _literal(pattern)
+            if literal is None:
+                # 以"/"结尾的模式表示整个目录
+                wildcards.append(pattern + "*" if pattern.endswith("/") else pattern)
+            elif literal.endswith("/"):
+                self.dirs.add(literal.rstrip("/"))
+            else:
+                self.names.add(literal)
+        self.regex = re.compile("|".join(translate(pat) for pat in wildcards)) if wildcards else None
+
+    def match(self, filename):
+        filename = os.path.normcase(filename)
+        if filename in self.names:
+            return True
+        if self.dirs:
+            directory = filename
+            while "/" in directory:
+                directory = directory.rsplit("/", 1)[0]
+                if directory in self.dirs:
+                    return True
+        return self.regex is not None and self.regex.match(filename) is not None
+
+def filter_repo_files(files, ignore_patterns=None, allow_patterns=None):
+    """按允许模式和忽略模式过滤仓库文件列表 (规则与snapshot_download一致)
+
+    给出allow_patterns时只保留匹配其中任一模式的文件, 再去掉匹配ignore_patterns的文件。
+    """
+    files = list(files)
+    if allow_patterns:
+        allow = _PatternMatcher(allow_patterns)
+        files = [f for f in files if allow.match(f)]
+    if ignore_patterns:
+        ignore = _PatternMatcher(ignore_patterns)
+        files = [f for f in files if not ignore.match(f)]
+    return files
+
+def repo_path(repo_id, repo_type=DEFAULT_REPO_TYPE):
+    """仓库在Hub网址中的路径: 模型为repo_id, 数据集和Space为 datasets/repo_id、spaces/repo_id"""
+    if repo_type not in REPO_TYPES:
+        raise ValueError(f"未知的仓库类型: {repo_type}, 应为 {'、'.join(REPO_TYPES)} 之一")
+    return repo_id if repo_type == "model" else f"{repo_type}s/{repo_id}"
+
+def make_proxies(http_proxy=None, https_proxy=None):
+    """生成HttpSession使用的代理设置 {"http": 地址, "https": 地址}, 省略为空的项"""
+    return {scheme: value for scheme, value in (("http", http_proxy), ("https", https_proxy)) if value}
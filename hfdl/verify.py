@@ -0,0 +1,173 @@
+"""文件完整性校验: 下载时的流式sha256和独立的目录校验"""
+import os
+import mmap
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+HASH_WINDOW = 64 * 1024 * 1024  # mmap每次交给哈希函数的窗口大小
+READ_BLOCK = 4 * 1024 * 1024
+
+def hash_file(path, git_blob=False):
+    """用mmap按大窗口读取文件并返回sha256; git_blob为True时返回git blob的sha1"""
+    size = os.path.getsize(path)
+    if git_blob:
+        digest = hashlib.sha1(f"blob {size}\0".encode())
+    else:
+        digest = hashlib.sha256()
+    if size == 0:
+        return digest.hexdigest()
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        view = memoryview(mm)
+        try:
+            for start in range(0, size, HASH_WINDOW):
+                digest.update(view[start:start + HASH_WINDOW])
+        finally:
+            view.release()
+    return digest.hexdigest()
+
+def hash_prefix(path, length):
+    """计算文件前length字节的sha256, 返回可继续update的哈希对象 (续传时使用)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(READ_BLOCK, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest
+
+class SegmentHasher:
+    """按文件顺序计算分段下载文件的sha256
+
+    sha256只能顺序计算: 恰好接在已计算位置之后的数据块直接在内存中计算,
+    其余分段的数据等前面的分段完成后, 从刚写入的临时文件 (通常仍在页缓存中) 补读。
+    """
+    def __init__(self, path, state):
+        self.path = path
+        self.size = state["size"]
+        self.segments = sorted(state["segments"], key=lambda seg: seg["start"])
+        self.digest = hashlib.sha256()
+        self.offset = 0
+        self.lock = threading.Lock()
+        self.reader = None
+
+    def update(self, position, chunk):
+        """position处的数据块已写入文件; 其他线程正在计算时直接返回, 之后从文件补读"""
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            if position == self.offset:
+                self.digest.update(chunk)
+                self.offset += len(chunk)
+            self._catch_up()
+        finally:
+            self.lock.release()
+
+    def _written_end(self):
+        # 包含当前位置的分段已写入到哪里
+        for seg in self.segments:
+            if seg["start"] <= self.offset <= seg["end"]:
+                return seg["start"] + seg["done"]
+        return self.offset
+
+    def _catch_up(self):
+        while True:
+            end = self._written_end()
+            if end <= self.offset:
+                return
+            if self.reader is None:
+                self.reader = open(self.path, "rb")
+            self.reader.seek(self.offset)
+            while self.offset < end:
+                chunk = self.reader.read(min(READ_BLOCK, end - self.offset))
+                if not chunk:
+                    return
+                self.digest.update(chunk)
+                self.offset += len(chunk)
+
+    def hexdigest(self):
+        """所有分段完成后调用, 补读剩余数据并返回sha256"""
+        with self.lock:
+            self._catch_up()
+            if self.reader is not None:
+                self.reader.close()
+                self.reader = None
+            if self.offset != self.size:
+                return None
+            return self.digest.hexdigest()
+
+def expected_hash(info):
+    """从清单条目或仓库元数据中取出 (算法, 哈希值), 没有可用的哈希时返回None"""
+    if info.get("sha256"):
+        return "sha256", info["sha256"]
+    if info.get("blob_id"):
+        return "git-sha1", info["blob_id"]
+    return None
+
+def _verify_file(path, algorithm, expected, size):
+    # 在子进程中执行
+    try:
+        actual_size = os.path.getsize(path)
+        if size is not None and actual_size != size:
+            return False, f"大小不一致: 本地 {actual_size} 字节, 预计 {size} 字节"
+        actual = hash_file(path, git_blob=algorithm == "git-sha1")
+    except OSError as e:
+        return False, f"无法读取: {e}"
+    if actual != expected:
+        return False, f"{algorithm}校验失败: 本地 {actual[:16]}..., 预计 {expected[:16]}..."
+    return True, None
+
+def verify_directory(local_dir, files, tracker, processes=None, should_continue=None):
+    """用进程池校验local_dir中的文件, 返回校验失败的文件列表
+
+    files为 {文件名: {"size", "sha256", "blob_id"}}, 可以是清单中的条目或仓库元数据。
+    结果通过tracker逐个报告, 没有哈希可用的文件跳过。
+    """
+    should_continue = should_continue or (lambda: True)
+    checks = {}
+    for filename, info in files.items():
+        algo = expected_hash(info)
+        if algo is not None:
+            checks[filename] = (algo[0], algo[1], info.get("size"))
+    skipped = len(files) - len(checks)
+    tracker.set_total_files(len(checks))
+    tracker.set_file_sizes({f: check[2] or 0 for f, check in checks.items()})
+    if skipped:
+        tracker.log(f"{skipped} 个文件没有可用的哈希值, 跳过校验")
+
+    failed = []
+    processes = processes or os.cpu_count() or 1
+    # 大文件先提交, 避免最后只剩一个大文件在单核上计算
+    order = sorted(checks, key=lambda f: -(checks[f][2] or 0))
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = {}
+        for filename in order:
+            path = os.path.join(local_dir, *filename.split("/"))
+            futures[pool.submit(_verify_file, path, *checks[filename])] = filename
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            for future in done:
+                filename = futures[future]
+                try:
+                    ok, error = future.result()
+                except Exception as e:
+                    ok, error = False, str(e)
+                if ok:
+                    tracker.add_bytes(filename, checks[filename][2] or 0)
+                    tracker.add_verified_file(filename)
+                    tracker.add_downloaded_file(filename)
+                else:
+                    failed.append(filename)
+                    tracker.add_failed_file(filename, error)
+            if pending and not should_continue():
+                for future in pending:
+                    future.cancel()
+                tracker.log("校验已取消")
+                break
+    return failed
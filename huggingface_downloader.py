@@ -2,165 +2,153 @@ import tkinter as tk
 from tkinter import filedialog, ttk, messagebox, font
 import os
 import threading
-import time
-import re
+import queue
 from datetime import datetime
-import urllib3
 import webbrowser
-from huggingface_hub import snapshot_download, list_repo_files
-from huggingface_hub.utils import HfHubHTTPError
+from hfdl import (DownloadJob, VerifyJob, DownloadTracker, BlobStore, BandwidthLimiter, BandwidthSchedule,
+                  DownloadError, MetadataCache, format_preview, format_progress, format_size, parse_size, parse_patterns,
+                  make_proxies, DEFAULT_MAX_WORKERS, DEFAULT_SEGMENTS, DEFAULT_SEGMENT_THRESHOLD,
+                  DEFAULT_BLOB_STORE, DEFAULT_ENDPOINT, DEFAULT_REPO_TYPE, REPO_TYPES)
+from hfdl.jobqueue import DownloadQueue, DEFAULT_QUEUE_FILE, DEFAULT_MAX_CONNECTIONS
+from hfdl.filetree import FileTree
+from hfdl.manifest import MANIFEST_NAME
 
-# 增加格式化文件大小的辅助方法
-def format_size(bytes, suffix="B"):
-    """将字节数转换为人类可读的格式"""
-    for unit in ["", "K", "M", "G", "T", "P", "E", "Z"]:
-        if abs(bytes) < 1024.0:
-            return f"{bytes:.2f} {unit}{suffix}"
-        bytes /= 1024.0
-    return f"{bytes:.2f} Y{suffix}"
+class FilePickerDialog:
+    """仓库文件选择窗口
 
-class DownloadTracker:
-    """跟踪下载进度和统计信息的类"""
-    def __init__(self, gui):
-        self.gui = gui
-        self.total_files = 0
-        self.downloaded_files = 0
-        self.failed_files = []
-        self.failed_files_info = {}  # 文件 -> 错误信息
-        self.download_start_time = None
-        self.download_end_time = None
-        self.pulse_progress_interval = 200  # 进度条脉冲间隔(ms)，调整为更平滑
-        self.total_bytes = 0
-        self.last_update_time = time.time()
-        
-    def start(self):
-        """开始下载跟踪"""
-        self.total_files = 0
-        self.downloaded_files = 0
-        self.failed_files = []
-        self.failed_files_info = {}
-        self.download_start_time = datetime.now()
-        self.total_bytes = 0
-        self.last_update_time = time.time()
-        
-        # 启动进度条脉冲动画
-        self.gui.progress_bar.config(mode='indeterminate')
-        self.gui.progress_bar.start(self.pulse_progress_interval)
-        self.gui.status_var.set("正在准备下载...")
-    
-    def end(self):
-        """结束下载跟踪"""
-        self.download_end_time = datetime.now()
-        # 停止进度条动画
-        self.gui.progress_bar.stop()
-        self.gui.progress_bar.config(mode='determinate')
-    
-    def set_total_files(self, count):
-        """设置预期的总文件数"""
-        self.total_files = count
-        self.gui.log(f"仓库中共有 {count} 个文件")
-    
-    def add_failed_file(self, filename, error_message):
-        """记录失败的文件"""
-        self.failed_files.append(filename)
-        self.failed_files_info[filename] = error_message
-        self.gui.log(f"文件下载失败: {os.path.basename(filename)}")
-        self.gui.log(f"  错误: {error_message}")
-    
-    def get_summary(self):
-        """生成下载任务的摘要信息"""
-        # 计算下载时间
-        if self.download_start_time and self.download_end_time:
-            duration = (self.download_end_time - self.download_start_time).total_seconds()
-            duration_str = f"{duration:.1f} 秒"
-            if duration > 60:
-                minutes = int(duration // 60)
-                seconds = int(duration % 60)
-                duration_str = f"{minutes} 分 {seconds} 秒"
-        else:
-            duration_str = "未知"
-        
-        # 从total_files中减去失败文件数来估算成功下载的文件数
-        if self.total_files > 0:
-            estimated_success = max(0, self.total_files - len(self.failed_files))
-        else:
-            estimated_success = "未知"
-        
-        # 构建摘要信息
-        summary = [
-            "======= 下载任务摘要 =======",
-            f"总文件数: {self.total_files if self.total_files > 0 else '未知'}",
-            f"成功下载: {estimated_success}",
-            f"失败文件: {len(self.failed_files)}",
-            f"下载用时: {duration_str}"
-        ]
-        
-        # 如果有失败的文件，添加失败详情
-        if self.failed_files:
-            summary.append("\n==== 下载失败的文件 ====")
-            for i, filename in enumerate(self.failed_files, 1):
-                error_msg = self.failed_files_info.get(filename, "未知错误")
-                summary.append(f"{i}. {os.path.basename(filename)}")
-                summary.append(f"   错误: {error_msg}")
-        
-        # 根据失败类型提供建议
-        if self.failed_files:
-            summary.append("\n==== 故障排除建议 ====")
-            
-            # 分析错误类型
-            network_errors = any("timeout" in str(err).lower() or 
-                               "connection" in str(err).lower() or 
-                               "incompleteread" in str(err).lower()
-                               for err in self.failed_files_info.values())
-            
-            not_found_errors = any("not found" in str(err).lower() or 
-                                 "404" in str(err).lower() 
-                                 for err in self.failed_files_info.values())
-            
-            auth_errors = any("unauthorized" in str(err).lower() or 
-                            "authentication" in str(err).lower() 
-                            for err in self.failed_files_info.values())
-            
-            if network_errors:
-                summary.append("• 网络连接问题:")
-                summary.append("  - 检查您的网络连接是否稳定。")
-                summary.append("  - 尝试更换代理服务器或检查代理设置。")
-                summary.append("  - 确保已开启 断点续传 选项后重试。")
-            
-            if not_found_errors:
-                summary.append("• 文件不存在问题:")
-                summary.append("  - 确认仓库ID是否正确无误。")
-                summary.append("  - 文件可能已被移除、重命名，或在特定分支/版本中不存在。")
-                summary.append("  - 访问仓库页面检查最新文件列表。")
-            
-            if auth_errors:
-                summary.append("• 认证问题:")
-                summary.append("  - 如果是私有仓库，请确保您已在HuggingFace Hub登录或提供了有效的Token。")
-                summary.append("  - 检查Token是否具有读取此仓库的权限。")
-            
-            # 通用建议
-            summary.append("\n• 通用建议:")
-            summary.append("  - 访问仓库主页手动下载失败的文件。")
-            summary.append("  - 尝试使用 `ignore_patterns` 忽略特定问题文件或大文件。")
-            summary.append("  - 查阅相关模型的HuggingFace社区或文档获取帮助。")
-        
-        return "\n".join(summary)
+    目录在展开时才插入子节点, 每次最多插入page_size个, 其余通过"显示更多"加载,
+    因此几万个文件的数据集仓库也能立即打开。选择状态保存在FileTree中,
+    确定后通过on_apply(kind, patterns)返回允许模式或忽略模式。
+    """
+    page_size = 1000
+    state_marks = {"selected": "☑", "unselected": "☐", "partial": "◪"}
+    loading_prefix = "/loading/"  # 仓库路径不以"/"开头, 用作占位节点的iid
+    more_prefix = "/more/"
 
-    def update_speed(self, bytes_added):
-        # 计算并显示下载速度
-        current_time = time.time()
-        elapsed = current_time - self.last_update_time
-        if elapsed > 1.0:  # 每秒更新一次
-            speed = bytes_added / elapsed
-            self.gui.status_var.set(f"下载速度：{format_size(speed)}/s")
-            self.last_update_time = current_time
-            self.total_bytes += bytes_added
-    
-    # 添加格式化文件大小的方法
-    def _format_size(self, bytes):
-        return format_size(bytes)
+    def __init__(self, parent, repo_id, tree, on_apply):
+        self.tree = tree
+        self.on_apply = on_apply
+        self.window = tk.Toplevel(parent)
+        self.window.title(f"选择文件 - {repo_id}")
+        self.window.geometry("720x520")
+        self.window.transient(parent)
+        self.window.columnconfigure(0, weight=1)
+        self.window.rowconfigure(0, weight=1)
+        
+        frame = ttk.Frame(self.window, padding=8)
+        frame.grid(row=0, column=0, sticky=tk.NSEW)
+        frame.columnconfigure(0, weight=1)
+        frame.rowconfigure(0, weight=1)
+        self.view = ttk.Treeview(frame, columns=("size", "files"), selectmode="extended")
+        self.view.heading("#0", text="名称")
+        self.view.heading("size", text="大小")
+        self.view.heading("files", text="文件数")
+        self.view.column("#0", width=440, stretch=True)
+        self.view.column("size", width=110, anchor=tk.E, stretch=False)
+        self.view.column("files", width=80, anchor=tk.E, stretch=False)
+        self.view.grid(row=0, column=0, sticky=tk.NSEW)
+        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.view.yview)
+        scrollbar.grid(row=0, column=1, sticky=tk.NS)
+        self.view.configure(yscrollcommand=scrollbar.set)
+        self.view.bind("<<TreeviewOpen>>", self.on_open)
+        self.view.bind("<space>", lambda e: self.toggle_selected())
+        self.view.bind("<Double-1>", self.on_double_click)
+        
+        self.summary_var = tk.StringVar()
+        ttk.Label(frame, textvariable=self.summary_var).grid(row=1, column=0, columnspan=2, sticky=tk.W, pady=(6, 0))
+        ttk.Label(frame, text="(空格键切换选中的行; 勾选目录作用于其中的所有文件)", foreground="#666666").grid(row=2, column=0, columnspan=2, sticky=tk.W)
+        
+        buttons = ttk.Frame(frame)
+        buttons.grid(row=3, column=0, columnspan=2, sticky=tk.EW, pady=(8, 0))
+        ttk.Button(buttons, text="下载所选", command=lambda: self.mark_selected(True), width=10).pack(side=tk.LEFT, padx=4)
+        ttk.Button(buttons, text="不下载所选", command=lambda: self.mark_selected(False), width=10).pack(side=tk.LEFT, padx=4)
+        ttk.Button(buttons, text="全选", command=lambda: self.select_all(True), width=6).pack(side=tk.LEFT, padx=4)
+        ttk.Button(buttons, text="全不选", command=lambda: self.select_all(False), width=6).pack(side=tk.LEFT, padx=4)
+        ttk.Button(buttons, text="取消", command=self.window.destroy, width=8).pack(side=tk.RIGHT, padx=4)
+        ttk.Button(buttons, text="确定", command=self.apply, style="Accent.TButton", width=8).pack(side=tk.RIGHT, padx=4)
+        
+        self.insert_children("")
+        self.update_summary()
+    
+    def item_text(self, path):
+        return f"{self.state_marks[self.tree.state(path)]} {self.tree.name(path)}"
+    
+    def insert_children(self, directory, start=0):
+        """插入directory的第start个起的一页子节点"""
+        children = self.tree.children(directory)
+        for path, is_dir in children[start:start + self.page_size]:
+            count = self.tree.file_count(path) if is_dir else ""
+            self.view.insert(directory, "end", iid=path, text=self.item_text(path),
+                             values=(format_size(self.tree.size(path)), count))
+            if is_dir:
+                self.view.insert(path, "end", iid=self.loading_prefix + path, text="加载中...")
+        remaining = len(children) - start - self.page_size
+        if remaining > 0:
+            self.view.insert(directory, "end", iid=f"{self.more_prefix}{start + self.page_size}/{directory}",
+                             text=f"显示更多 (还有 {remaining} 项, 双击加载)")
+    
+    def on_open(self, event):
+        path = self.view.focus()
+        placeholder = self.loading_prefix + path
+        if self.view.exists(placeholder):
+            self.view.delete(placeholder)
+            self.insert_children(path)
+    
+    def on_double_click(self, event):
+        item = self.view.identify_row(event.y)
+        if item.startswith(self.more_prefix):
+            start, directory = item[len(self.more_prefix):].split("/", 1)
+            self.view.delete(item)
+            self.insert_children(directory, int(start))
+            return "break"
+    
+    def selected_paths(self):
+        return [item for item in self.view.selection() if not item.startswith("/")]
+    
+    def mark_selected(self, selected):
+        for path in self.selected_paths():
+            self.tree.set_selected(path, selected)
+        self.refresh()
+    
+    def toggle_selected(self):
+        for path in self.selected_paths():
+            self.tree.set_selected(path, self.tree.state(path) != "selected")
+        self.refresh()
+        return "break"
+    
+    def select_all(self, selected):
+        self.tree.select_all(selected)
+        self.refresh()
+    
+    def refresh(self):
+        """更新已插入节点的勾选标记, 未展开的目录不需要处理"""
+        pending = list(self.view.get_children(""))
+        while pending:
+            item = pending.pop()
+            if item.startswith("/"):
+                continue
+            self.view.item(item, text=self.item_text(item))
+            if self.tree.is_dir(item):
+                pending.extend(self.view.get_children(item))
+        self.update_summary()
+    
+    def update_summary(self):
+        count, size = self.tree.selection_totals()
+        self.summary_var.set(f"已选择 {count}/{self.tree.file_count('')} 个文件, "
+                             f"{format_size(size)} / {format_size(self.tree.size(''))}")
+    
+    def apply(self):
+        kind, patterns = self.tree.to_patterns()
+        self.window.destroy()
+        self.on_apply(kind, patterns)
 
 class HuggingFaceDownloaderGUI:
+    pulse_progress_interval = 200    # 进度条脉冲间隔(ms)，调整为更平滑
+    progress_update_interval = 1000  # 速度和进度的刷新间隔(ms)
+    ui_frame_interval = 50           # 界面刷新间隔(ms), 约20帧/秒
+    ui_max_events_per_frame = 5000   # 每帧最多处理的事件数, 其余留到下一帧
+    max_log_lines = 5000             # 日志框最多保留的行数, 超出后丢弃最早的行
+
     def __init__(self, root):
         self.root = root
         self.root.title("HuggingFace 模型下载器")
@@ -192,7 +180,14 @@ class HuggingFaceDownloaderGUI:
         self.setup_custom_styles()
         
         # 创建下载跟踪器
-        self.download_tracker = DownloadTracker(self)
+        self.download_tracker = DownloadTracker(listener=self.on_tracker_event)
+        
+        # 所有下载任务 (包括队列) 共用的带宽限制, 可在下载过程中修改
+        self.bandwidth_limiter = BandwidthLimiter()
+        self.bandwidth_limiter.listener = self.log
+        
+        # 仓库信息的磁盘缓存, 预览和下载共用, 避免重复请求API
+        self.metadata_cache = MetadataCache()
         
         # 创建主滚动区域
         # 创建一个Canvas作为滚动区域
@@ -233,6 +228,10 @@ class HuggingFaceDownloaderGUI:
         self.repo_id.trace_add("write", self.update_default_save_path)
         repo_entry.bind("<Control-z>", lambda e: repo_entry.event_generate("<<Undo>>"))
         
+        # 仓库类型: 模型、数据集或Space
+        self.repo_type = tk.StringVar(value=DEFAULT_REPO_TYPE)
+        ttk.Combobox(input_frame, textvariable=self.repo_type, values=REPO_TYPES, state="readonly", width=8).grid(row=0, column=2, padx=8, pady=8)
+        
         # 保存位置输入行
         ttk.Label(input_frame, text="保存位置:", width=10).grid(row=1, column=0, sticky=tk.W, pady=8, padx=8)
         self.local_dir = tk.StringVar()
@@ -287,18 +286,72 @@ class HuggingFaceDownloaderGUI:
         ignore_entry = ttk.Entry(advanced_frame, textvariable=self.ignore_patterns)
         ignore_entry.grid(row=2, column=1, sticky=tk.EW, pady=8, padx=5)
         ignore_entry.bind("<Control-z>", lambda e: ignore_entry.event_generate("<<Undo>>"))
+        self.pick_files_btn = ttk.Button(advanced_frame, text="选择文件...", command=self.start_file_picker, width=10)
+        self.pick_files_btn.grid(row=2, column=2, padx=8, pady=8)
         
         # 忽略文件模式提示
         hint_label = ttk.Label(advanced_frame, text="(逗号分隔, 例如: *.safetensors,*.pt,*.bin)", foreground="#666666")
         hint_label.grid(row=3, column=0, columnspan=2, sticky=tk.W, padx=18, pady=2)
         
+        # 允许文件模式: 只下载匹配的文件
+        ttk.Label(advanced_frame, text="允许文件模式:", width=10).grid(row=4, column=0, sticky=tk.W, pady=8, padx=8)
+        self.allow_patterns = tk.StringVar()
+        allow_entry = ttk.Entry(advanced_frame, textvariable=self.allow_patterns)
+        allow_entry.grid(row=4, column=1, sticky=tk.EW, pady=8, padx=5)
+        allow_entry.bind("<Control-z>", lambda e: allow_entry.event_generate("<<Undo>>"))
+        allow_hint = ttk.Label(advanced_frame, text="(留空下载全部, 例如: *.json,onnx/; 也可以点击\"选择文件...\"在目录树中勾选)", foreground="#666666")
+        allow_hint.grid(row=5, column=0, columnspan=2, sticky=tk.W, padx=18, pady=2)
+        
         # HF Token
-        ttk.Label(advanced_frame, text="HF Token:", width=10).grid(row=4, column=0, sticky=tk.W, pady=8, padx=8)
+        ttk.Label(advanced_frame, text="HF Token:", width=10).grid(row=6, column=0, sticky=tk.W, pady=8, padx=8)
         self.hf_token = tk.StringVar()
         hf_token_entry = ttk.Entry(advanced_frame, textvariable=self.hf_token, show="*")
-        hf_token_entry.grid(row=4, column=1, sticky=tk.EW, pady=8, padx=5)
+        hf_token_entry.grid(row=6, column=1, sticky=tk.EW, pady=8, padx=5)
         hf_token_entry.bind("<Control-z>", lambda e: hf_token_entry.event_generate("<<Undo>>"))
 
+        # 并发下载数
+        ttk.Label(advanced_frame, text="并发下载数:", width=10).grid(row=7, column=0, sticky=tk.W, pady=8, padx=8)
+        self.max_workers = tk.IntVar(value=DEFAULT_MAX_WORKERS)
+        ttk.Spinbox(advanced_frame, from_=1, to=32, textvariable=self.max_workers, width=6).grid(row=7, column=1, sticky=tk.W, pady=8, padx=5)
+
+        # 单文件分段连接数
+        ttk.Label(advanced_frame, text="分段连接数:", width=10).grid(row=8, column=0, sticky=tk.W, pady=8, padx=8)
+        self.segments = tk.IntVar(value=DEFAULT_SEGMENTS)
+        ttk.Spinbox(advanced_frame, from_=1, to=16, textvariable=self.segments, width=6).grid(row=8, column=1, sticky=tk.W, pady=8, padx=5)
+        segments_hint = ttk.Label(advanced_frame, text=f"(大于 {format_size(DEFAULT_SEGMENT_THRESHOLD)} 的文件拆分为多个Range请求并行下载, 1 表示不分段)", foreground="#666666")
+        segments_hint.grid(row=9, column=0, columnspan=2, sticky=tk.W, padx=18, pady=2)
+
+        # 跨仓库去重的本地内容存储
+        self.use_blob_store = tk.BooleanVar(value=False)
+        ttk.Checkbutton(advanced_frame, text="跨仓库复用相同文件 (本地内容存储)", variable=self.use_blob_store, style="TCheckbutton").grid(row=10, column=0, columnspan=2, sticky=tk.W, pady=5, padx=8)
+        blob_store_hint = ttk.Label(advanced_frame, text=f"(存储位置: {DEFAULT_BLOB_STORE}, 已有的文件通过硬链接或符号链接放到保存位置)", foreground="#666666")
+        blob_store_hint.grid(row=11, column=0, columnspan=2, sticky=tk.W, padx=18, pady=2)
+
+        # 自适应并发
+        self.adaptive = tk.BooleanVar(value=False)
+        ttk.Checkbutton(advanced_frame, text="自适应并发 (根据实测速度和错误率自动调整连接数和分段数)", variable=self.adaptive, style="TCheckbutton").grid(row=12, column=0, columnspan=2, sticky=tk.W, pady=5, padx=8)
+
+        # 带宽上限, 下载过程中点击"应用"立即生效
+        ttk.Label(advanced_frame, text="带宽上限:", width=10).grid(row=13, column=0, sticky=tk.W, pady=8, padx=8)
+        bandwidth_frame = ttk.Frame(advanced_frame)
+        bandwidth_frame.grid(row=13, column=1, sticky=tk.EW, pady=8, padx=5)
+        bandwidth_frame.columnconfigure(2, weight=1)
+        self.rate_limit = tk.StringVar()
+        ttk.Entry(bandwidth_frame, textvariable=self.rate_limit, width=10).grid(row=2, column=0, sticky=tk.W)
+        ttk.Label(bandwidth_frame, text="时段:").grid(row=2, column=1, sticky=tk.W, padx=(10, 4))
+        self.rate_schedule = tk.StringVar()
+        ttk.Entry(bandwidth_frame, textvariable=self.rate_schedule).grid(row=2, column=2, sticky=tk.EW)
+        ttk.Button(bandwidth_frame, text="应用", command=self.apply_bandwidth_settings, width=6).grid(row=2, column=3, padx=(6, 0))
+        bandwidth_hint = ttk.Label(advanced_frame, text="(每秒字节数, 例如 200M, 留空不限速; 时段例如 08:00-20:00=200M,20:00-08:00=0)", foreground="#666666")
+        bandwidth_hint.grid(row=14, column=0, columnspan=2, sticky=tk.W, padx=18, pady=2)
+
+        # 下载地址 (官方和镜像), 多个地址时开始下载前测速
+        ttk.Label(advanced_frame, text="下载地址:", width=10).grid(row=15, column=0, sticky=tk.W, pady=8, padx=8)
+        self.endpoints = tk.StringVar(value=os.environ.get("HF_ENDPOINT", DEFAULT_ENDPOINT))
+        ttk.Entry(advanced_frame, textvariable=self.endpoints).grid(row=15, column=1, sticky=tk.EW, pady=8, padx=5)
+        endpoints_hint = ttk.Label(advanced_frame, text="(多个地址用逗号分隔, 例如官方地址和镜像; 开始时测速, 每个文件从最快的地址下载, 失败时自动切换)", foreground="#666666")
+        endpoints_hint.grid(row=16, column=0, columnspan=2, sticky=tk.W, padx=18, pady=2)
+
         # --- 操作按钮 ---
         button_frame = ttk.Frame(main_frame, padding=(0, 8, 0, 8))
         button_frame.grid(row=3, column=0, sticky=tk.EW, pady=8)
@@ -321,9 +374,17 @@ class HuggingFaceDownloaderGUI:
                                     state=tk.DISABLED, width=12)
         self.cancel_btn.grid(row=0, column=1, padx=12, pady=5)
         
+        # 校验文件按钮
+        self.verify_btn = ttk.Button(btn_container, text="校验文件", command=self.start_verify, width=12)
+        self.verify_btn.grid(row=0, column=2, padx=12, pady=5)
+        
+        # 预览按钮: 下载前查看文件数和总大小
+        self.preview_btn = ttk.Button(btn_container, text="预览", command=self.start_preview, width=8)
+        self.preview_btn.grid(row=0, column=3, padx=12, pady=5)
+        
         # --- 关于按钮 ----
         about_btn = ttk.Button(btn_container, text="关于", command=self.show_about, width=8)
-        about_btn.grid(row=0, column=2, padx=12, pady=5)
+        about_btn.grid(row=0, column=4, padx=12, pady=5)
         
         # --- 进度显示 ---
         progress_status_frame = ttk.LabelFrame(main_frame, text="下载状态", padding=12)
@@ -350,10 +411,13 @@ class HuggingFaceDownloaderGUI:
                                wraplength=700, anchor=tk.W, style="Status.TLabel")
         status_label.grid(row=1, column=0, sticky=tk.EW, pady=5, padx=5)
         
+        # --- 下载队列 ---
+        self.build_queue_frame(main_frame, row=5)
+        
         # --- 日志框 ---
         log_frame = ttk.LabelFrame(main_frame, text="下载日志", padding=12)
-        log_frame.grid(row=5, column=0, sticky=tk.NSEW, pady=(12,0))
-        main_frame.rowconfigure(5, weight=1)
+        log_frame.grid(row=6, column=0, sticky=tk.NSEW, pady=(12,0))
+        main_frame.rowconfigure(6, weight=1)
 
         # 日志内框架
         log_inner_frame = ttk.Frame(log_frame)
@@ -380,8 +444,22 @@ class HuggingFaceDownloaderGUI:
         
         # 下载线程
         self.download_thread = None
+        self.download_job = None
         self.is_downloading = False
         
+        # 下载线程通过队列提交界面更新, 由GUI线程按固定帧率批量处理
+        self.ui_queue = queue.Queue()
+        self.root.after(self.ui_frame_interval, self._process_ui_queue)
+        
+        # 多仓库下载队列 (保存在用户目录, 重启后继续)
+        try:
+            self.download_queue = DownloadQueue(DEFAULT_QUEUE_FILE, listener=self.on_queue_event)
+        except (OSError, ValueError) as e:
+            self.download_queue = DownloadQueue(None, listener=self.on_queue_event)
+            self.log(f"读取下载队列失败, 本次不保存队列: {e}")
+        self.queue_progress = {}  # 条目ID -> 最近的进度统计
+        self.refresh_queue_view()
+        
         # 自定义标签绑定，用于鼠标悬停效果
         self.customize_widget_bindings()
         
@@ -392,6 +470,37 @@ class HuggingFaceDownloaderGUI:
         self.log("欢迎使用 HuggingFace 模型下载器")
         self.log("请输入仓库ID并设置下载选项后开始下载")
     
+    def build_queue_frame(self, main_frame, row):
+        """创建多仓库下载队列区域"""
+        queue_frame = ttk.LabelFrame(main_frame, text="下载队列", padding=12)
+        queue_frame.grid(row=row, column=0, sticky=tk.EW, pady=12)
+        queue_frame.columnconfigure(0, weight=1)
+        
+        columns = ("repo", "priority", "status", "progress")
+        self.queue_tree = ttk.Treeview(queue_frame, columns=columns, show="headings", height=5, selectmode="browse")
+        for column, text, width in (("repo", "仓库 / 保存位置", 360), ("priority", "优先级", 60),
+                                    ("status", "状态", 80), ("progress", "进度", 160)):
+            self.queue_tree.heading(column, text=text)
+            self.queue_tree.column(column, width=width, stretch=(column == "repo"))
+        self.queue_tree.grid(row=0, column=0, sticky=tk.EW, padx=5, pady=5)
+        queue_scrollbar = ttk.Scrollbar(queue_frame, orient="vertical", command=self.queue_tree.yview)
+        queue_scrollbar.grid(row=0, column=1, sticky=tk.NS)
+        self.queue_tree.configure(yscrollcommand=queue_scrollbar.set)
+        
+        queue_buttons = ttk.Frame(queue_frame)
+        queue_buttons.grid(row=1, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
+        ttk.Button(queue_buttons, text="加入队列", command=self.add_to_queue, width=10).pack(side=tk.LEFT, padx=5)
+        self.queue_start_btn = ttk.Button(queue_buttons, text="开始队列", command=self.toggle_queue, width=10)
+        self.queue_start_btn.pack(side=tk.LEFT, padx=5)
+        ttk.Button(queue_buttons, text="移除", command=self.remove_queue_entry, width=6).pack(side=tk.LEFT, padx=5)
+        ttk.Button(queue_buttons, text="优先级 +", command=lambda: self.change_queue_priority(1), width=8).pack(side=tk.LEFT, padx=5)
+        ttk.Button(queue_buttons, text="优先级 -", command=lambda: self.change_queue_priority(-1), width=8).pack(side=tk.LEFT, padx=5)
+        ttk.Button(queue_buttons, text="重试", command=self.retry_queue_entry, width=6).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(queue_buttons, text="全局连接数:").pack(side=tk.LEFT, padx=(15, 5))
+        self.queue_max_connections = tk.IntVar(value=DEFAULT_MAX_CONNECTIONS)
+        ttk.Spinbox(queue_buttons, from_=1, to=128, textvariable=self.queue_max_connections, width=5).pack(side=tk.LEFT)
+    
     def _on_mousewheel(self, event):
         """处理鼠标滚轮事件"""
         # Windows鼠标滚轮
@@ -555,18 +664,236 @@ class HuggingFaceDownloaderGUI:
             self.local_dir.set(full_path)
     
     def log(self, message):
+        """追加一行日志, 可在任意线程中调用"""
         timestamp = datetime.now().strftime("%H:%M:%S")
-        formatted_message = f"[{timestamp}] {message}"
+        self.ui_queue.put(("log", (f"[{timestamp}] {message}",)))
+    
+    def set_status(self, text):
+        self.ui_queue.put(("status", (text,)))
+    
+    def set_progress(self, value):
+        self.ui_queue.put(("progress", (value,)))
+    
+    def run_on_ui(self, func, *args):
+        """在GUI线程中执行func"""
+        self.ui_queue.put(("call", (func,) + args))
+    
+    def _process_ui_queue(self):
+        """批量处理队列中的界面更新: 日志合并为一次插入, 状态和进度只保留最新值"""
+        lines = []
+        status = None
+        progress = None
+        calls = []
+        try:
+            for _ in range(self.ui_max_events_per_frame):
+                kind, args = self.ui_queue.get_nowait()
+                if kind == "log":
+                    lines.append(args[0])
+                elif kind == "status":
+                    status = args[0]
+                elif kind == "progress":
+                    progress = args[0]
+                elif kind == "call":
+                    calls.append(args)
+        except queue.Empty:
+            pass
         
+        try:
+            if lines:
+                self._append_log_lines(lines)
+            if status is not None:
+                self.status_var.set(status)
+            if progress is not None:
+                self.progress_var.set(progress)
+            for func, *args in calls:
+                func(*args)
+        finally:
+            self.root.after(self.ui_frame_interval, self._process_ui_queue)
+    
+    def _append_log_lines(self, lines):
         self.log_text.configure(state='normal')
-        self.log_text.insert(tk.END, formatted_message + "\n")
+        self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+        # 超出上限时删除最早的行
+        line_count = int(self.log_text.index('end-1c').split('.')[0]) - 1
+        if line_count > self.max_log_lines:
+            self.log_text.delete("1.0", f"{line_count - self.max_log_lines + 1}.0")
         self.log_text.see(tk.END)
         self.log_text.configure(state='disabled')
-        self.root.update_idletasks()
+    
+    def on_tracker_event(self, event, data):
+        """DownloadTracker的事件回调, 可能在下载线程中调用"""
+        if "message" in data:
+            self.log(data["message"])
+        if event == "progress":
+            self.run_on_ui(self.show_progress, data)
+    
+    def show_progress(self, stats):
+        """在进度条和状态栏上显示update_speed的统计数据"""
+        if not self.is_downloading:
+            return
+        if stats["percent"] is not None:
+            if self.progress_bar.cget('mode') == 'indeterminate':
+                self.progress_bar.stop()
+                self.progress_bar.config(mode='determinate')
+            self.progress_var.set(stats["percent"])
+        self.status_var.set(format_progress(stats))
+    
+    def _progress_tick(self):
+        """下载期间定时刷新速度和进度"""
+        if not self.is_downloading:
+            return
+        if self.download_tracker.running:
+            self.download_tracker.update_speed()
+        self.root.after(self.progress_update_interval, self._progress_tick)
+    
+    def on_queue_event(self, entry_id, event, data):
+        """下载队列的事件回调, 在队列的下载线程中调用"""
+        if event == "progress":
+            return
+        if "message" in data:
+            try:
+                repo_id = self.download_queue.get(entry_id)["repo_id"]
+            except KeyError:
+                repo_id = entry_id
+            message = data["message"]
+            self.log(message if message.startswith("[") else f"[{repo_id}] {message}")
+        if event in ("job_start", "job_end"):
+            self.run_on_ui(self.refresh_queue_view)
+    
+    def refresh_queue_view(self):
+        """按队列当前内容重建队列列表"""
+        status_names = {"pending": "等待中", "running": "下载中", "done": "已完成",
+                        "failed": "失败", "cancelled": "已取消"}
+        selection = self.queue_tree.selection()
+        self.queue_tree.delete(*self.queue_tree.get_children())
+        for entry in self.download_queue.snapshot():
+            stats = self.queue_progress.get(entry["id"])
+            progress = ""
+            if entry["status"] == "running" and stats:
+                percent = f"{stats['percent']:.1f}%  " if stats["percent"] is not None else ""
+                progress = f"{percent}{format_size(stats['speed'])}/s"
+            elif entry["status"] in ("done", "failed"):
+                progress = f"{entry['downloaded_files']} 成功 / {entry['failed_files']} 失败"
+            self.queue_tree.insert("", tk.END, iid=entry["id"], values=(
+                f"{entry['repo_id']}  →  {entry['local_dir']}", entry["priority"],
+                status_names.get(entry["status"], entry["status"]), progress))
+        for iid in selection:
+            if self.queue_tree.exists(iid):
+                self.queue_tree.selection_set(iid)
+    
+    def _queue_tick(self):
+        """队列运行期间定时刷新每个仓库的进度"""
+        self.queue_progress.update(self.download_queue.poll_progress())
+        self.refresh_queue_view()
+        if self.download_queue.running or self.download_queue.jobs:
+            self.root.after(self.progress_update_interval, self._queue_tick)
+        else:
+            self.queue_start_btn.config(text="开始队列")
+    
+    def selected_queue_entry(self):
+        selection = self.queue_tree.selection()
+        return selection[0] if selection else None
+    
+    def add_to_queue(self):
+        """把当前填写的仓库ID、保存位置和忽略模式加入队列"""
+        repo_id = self.repo_id.get().strip()
+        local_dir = self.local_dir.get().strip()
+        if not repo_id or not local_dir:
+            messagebox.showerror("错误", "请输入有效的仓库ID和保存位置。")
+            return
+        self.download_queue.add(repo_id, local_dir, parse_patterns(self.ignore_patterns.get().strip()),
+                                allow_patterns=parse_patterns(self.allow_patterns.get().strip()),
+                                repo_type=self.repo_type.get())
+        self.log(f"已加入队列: {repo_id}")
+        self.refresh_queue_view()
+    
+    def toggle_queue(self):
+        """开始或停止处理下载队列"""
+        if self.download_queue.running:
+            self.download_queue.stop()
+            self.log("已停止队列, 正在下载的仓库下次开始时续传")
+            self.queue_start_btn.config(text="开始队列")
+            return
+        try:
+            per_job_connections = max(1, int(self.max_workers.get()))
+            segments = max(1, int(self.segments.get()))
+            max_connections = max(1, int(self.queue_max_connections.get()))
+        except (tk.TclError, ValueError):
+            messagebox.showerror("错误", "连接数必须是正整数。")
+            return
+        if not self.apply_bandwidth_settings(quiet=True):
+            return
+        self.download_queue.token = self.hf_token.get().strip() or os.environ.get("HF_TOKEN")
+        self.download_queue.per_job_connections = per_job_connections
+        self.download_queue.segments = segments
+        self.download_queue.resume_download = self.resume_download.get()
+        self.download_queue.job_options = {
+            "use_symlinks": self.use_symlinks.get(),
+            "blob_store": BlobStore() if self.use_blob_store.get() else None,
+            "adaptive": self.adaptive.get(),
+            "bandwidth_limiter": self.bandwidth_limiter,
+            "endpoint": self.get_endpoints()[0],
+            "mirrors": self.get_endpoints()[1:],
+            "proxies": self.get_proxies(),
+            "metadata_cache": self.metadata_cache,
+        }
+        self.download_queue.limiter.set_max_connections(max_connections)
+        self.download_queue.start()
+        self.queue_start_btn.config(text="停止队列")
+        self.log(f"开始处理下载队列 (全局最多 {max_connections} 个连接, 每个仓库最多 {per_job_connections} 个)")
+        self.root.after(self.progress_update_interval, self._queue_tick)
+    
+    def remove_queue_entry(self):
+        entry_id = self.selected_queue_entry()
+        if entry_id:
+            self.download_queue.remove(entry_id)
+            self.refresh_queue_view()
+    
+    def change_queue_priority(self, delta):
+        entry_id = self.selected_queue_entry()
+        if entry_id:
+            entry = self.download_queue.get(entry_id)
+            self.download_queue.set_priority(entry_id, entry["priority"] + delta)
+            self.refresh_queue_view()
+    
+    def retry_queue_entry(self):
+        entry_id = self.selected_queue_entry()
+        if entry_id:
+            self.download_queue.retry(entry_id)
+            self.refresh_queue_view()
+    
+    def get_endpoints(self):
+        """解析下载地址, 第一个为主地址, 其余为镜像"""
+        endpoints = [e.rstrip("/") for e in parse_patterns(self.endpoints.get().strip()) or []]
+        return endpoints or [DEFAULT_ENDPOINT]
+
+    def get_proxies(self):
+        """当前的代理设置, 只作用于本程序发起的下载任务; 未勾选代理时直接连接"""
+        if not self.use_proxy.get():
+            return {}
+        return make_proxies(self.http_proxy.get().strip(), self.https_proxy.get().strip())
+
+    def apply_bandwidth_settings(self, quiet=False):
+        """把带宽上限和时段设置应用到共用的限速器, 正在进行的下载立即生效"""
+        try:
+            rate_text = self.rate_limit.get().strip()
+            rate = parse_size(rate_text) if rate_text else None
+            schedule_text = self.rate_schedule.get().strip()
+            schedule = BandwidthSchedule.parse(schedule_text) if schedule_text else None
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
+            return False
+        self.bandwidth_limiter.set_rate(rate)
+        self.bandwidth_limiter.set_schedule(schedule)
+        if not quiet:
+            self.log(f"带宽设置已应用: {self.bandwidth_limiter.describe()}")
+        return True
     
     def cancel_download(self):
         if self.is_downloading:
             self.is_downloading = False
+            if self.download_job is not None:
+                self.download_job.cancel()
             self.log("用户请求取消下载...")
             self.status_var.set("正在取消下载...")
             self.cancel_btn.config(state=tk.DISABLED)
@@ -587,155 +914,290 @@ class HuggingFaceDownloaderGUI:
             messagebox.showerror("错误", "请选择保存位置。")
             return
         
-        # Proxy setup
-        if self.use_proxy.get():
-            http_p = self.http_proxy.get().strip()
-            https_p = self.https_proxy.get().strip()
-            os.environ['HTTP_PROXY'] = http_p
-            os.environ['HTTPS_PROXY'] = https_p
-            self.log(f"已设置代理: HTTP='{http_p}', HTTPS='{https_p}'")
-        else:
-            if 'HTTP_PROXY' in os.environ: del os.environ['HTTP_PROXY']
-            if 'HTTPS_PROXY' in os.environ: del os.environ['HTTPS_PROXY']
-            self.log("未使用代理。")
+        ignore_patterns = parse_patterns(self.ignore_patterns.get().strip())
         
-        ignore_patterns_str = self.ignore_patterns.get().strip()
-        ignore_patterns = [pat.strip() for pat in ignore_patterns_str.split(',') if pat.strip()] if ignore_patterns_str else None
-        if ignore_patterns: self.log(f"忽略文件模式: {', '.join(ignore_patterns)}")
+        try:
+            max_workers = max(1, int(self.max_workers.get()))
+            segments = max(1, int(self.segments.get()))
+        except (tk.TclError, ValueError):
+            messagebox.showerror("错误", "并发下载数和分段连接数必须是正整数。")
+            return
+        if not self.apply_bandwidth_settings(quiet=True):
+            return
+        endpoints = self.get_endpoints()
         
         self.is_downloading = True
         self.download_btn.config(state=tk.DISABLED)
+        self.verify_btn.config(state=tk.DISABLED)
         self.cancel_btn.config(state=tk.NORMAL)
         
         self.progress_var.set(0)
         
-        self.download_tracker.start()
-        
+        # 启动进度条脉冲动画, 获得总大小后切换为确定进度
+        self.progress_bar.config(mode='indeterminate')
+        self.progress_bar.start(self.pulse_progress_interval)
+        self.status_var.set("正在准备下载...")
+        self.root.after(self.progress_update_interval, self._progress_tick)
+        
+        self.download_job = DownloadJob(
+            repo_id, local_dir, self.download_tracker,
+            repo_type=self.repo_type.get(),
+            token=self.hf_token.get().strip(),
+            ignore_patterns=ignore_patterns,
+            allow_patterns=parse_patterns(self.allow_patterns.get().strip()),
+            max_workers=max_workers,
+            segments=segments,
+            resume_download=self.resume_download.get(),
+            use_symlinks=self.use_symlinks.get(),
+            blob_store=BlobStore() if self.use_blob_store.get() else None,
+            adaptive=self.adaptive.get(),
+            bandwidth_limiter=self.bandwidth_limiter,
+            endpoint=endpoints[0],
+            mirrors=endpoints[1:],
+            proxies=self.get_proxies(),
+            metadata_cache=self.metadata_cache,
+        )
         self.download_thread = threading.Thread(
             target=self.download_task,
-            args=(repo_id, local_dir, ignore_patterns)
+            args=(self.download_job,)
         )
         self.download_thread.daemon = True
         self.download_thread.start()
     
-    def extract_file_from_url(self, url):
-        match = re.search(r'huggingface\.co/[^/]+/[^/]+/resolve/[^/]+/(.+)', url)
-        return match.group(1) if match else url
+    def create_lookup_job(self):
+        """按当前设置创建只用于查询仓库信息的任务 (预览和选择文件), 输入不完整时返回None"""
+        repo_id = self.repo_id.get().strip()
+        local_dir = self.local_dir.get().strip()
+        if not repo_id or not local_dir:
+            messagebox.showerror("错误", "请输入仓库ID并选择保存位置。")
+            return None
+        endpoints = self.get_endpoints()
+        return DownloadJob(
+            repo_id, local_dir, DownloadTracker(listener=self.on_tracker_event),
+            repo_type=self.repo_type.get(),
+            token=self.hf_token.get().strip(),
+            ignore_patterns=parse_patterns(self.ignore_patterns.get().strip()),
+            allow_patterns=parse_patterns(self.allow_patterns.get().strip()),
+            endpoint=endpoints[0],
+            mirrors=endpoints[1:],
+            proxies=self.get_proxies(),
+            metadata_cache=self.metadata_cache,
+        )
+    
+    def start_preview(self):
+        """获取仓库信息 (优先使用缓存), 显示按文件模式过滤后的文件数、总大小和可用空间"""
+        job = self.create_lookup_job()
+        if job is None:
+            return
+        self.preview_btn.config(state=tk.DISABLED)
+        self.log(f"正在获取 {job.repo_id} 的文件列表...")
+        thread = threading.Thread(target=self.preview_task, args=(job,), daemon=True)
+        thread.start()
     
-    def get_direct_download_url(self, repo_id, filename):
-        filename = filename[1:] if filename.startswith('/') else filename
-        return f"https://huggingface.co/{repo_id}/resolve/main/{filename}"
+    def preview_task(self, job):
+        """执行预览 (在后台线程中运行)"""
+        try:
+            text = format_preview(job.preview())
+            error = None
+        except Exception as e:
+            text, error = None, e
+        self.run_on_ui(self.finish_preview, job.repo_id, text, error)
+    
+    def finish_preview(self, repo_id, text, error):
+        self.preview_btn.config(state=tk.NORMAL)
+        if error is not None:
+            self.log(f"获取仓库信息失败: {error}")
+            messagebox.showerror("预览失败", f"获取仓库信息失败: {error}")
+            return
+        self.log(f"{repo_id} 预览:\n{text}")
+        messagebox.showinfo("下载预览", f"{repo_id}\n\n{text}")
+    
+    def start_file_picker(self):
+        """获取仓库文件列表 (优先使用缓存) 后打开目录树, 勾选结果写回允许/忽略文件模式"""
+        job = self.create_lookup_job()
+        if job is None:
+            return
+        self.pick_files_btn.config(state=tk.DISABLED)
+        self.log(f"正在获取 {job.repo_id} 的文件列表...")
+        thread = threading.Thread(target=self.file_picker_task, args=(job,), daemon=True)
+        thread.start()
     
-    def download_task(self, repo_id, local_dir, ignore_patterns):
-        """执行下载任务的主函数"""
-        repo_url = f"https://huggingface.co/{repo_id}"
-        token_to_use = self.hf_token.get().strip() or os.environ.get("HF_TOKEN")
+    def file_picker_task(self, job):
+        """获取元数据并建立目录树 (在后台线程中运行, 几万个文件时也不阻塞界面)
 
+        job按界面中的仓库类型查询, 数据集和Space的窗口标题显示带前缀的仓库路径。
+        """
         try:
-            self.log(f"仓库主页: {repo_url}")
-            self.log(f"开始下载 {repo_id} 到 {local_dir}...")
-            
-            # 获取仓库文件数量以便估计进度
-            try:
-                files = list_repo_files(repo_id, token=token_to_use, repo_type="model")
-                self.download_tracker.set_total_files(len(files))
-            except Exception as e:
-                self.log(f"获取仓库文件列表失败: {str(e)}")
-                # 继续尝试下载，但无法准确显示进度
-            
-            os.makedirs(local_dir, exist_ok=True)
-            
-            if not self.is_downloading: # 用户可能在此期间取消下载
-                self.log("下载在开始前被取消。")
-                self.status_var.set("下载已取消")
-                self.download_tracker.end()
-                self.progress_var.set(0)
-                return
+            tree, error = FileTree(job.load_metadata()["files"]), None
+        except Exception as e:
+            tree, error = None, e
+        self.run_on_ui(self.open_file_picker, job.repo_path, tree, error)
+    
+    def open_file_picker(self, repo_id, tree, error):
+        self.pick_files_btn.config(state=tk.NORMAL)
+        if error is not None:
+            self.log(f"获取仓库信息失败: {error}")
+            messagebox.showerror("选择文件", f"获取仓库信息失败: {error}")
+            return
+        FilePickerDialog(self.root, repo_id, tree, self.apply_file_selection)
+    
+    def apply_file_selection(self, kind, patterns):
+        """把文件选择器的结果写入允许或忽略文件模式, 另一项清空"""
+        text = ",".join(patterns)
+        self.allow_patterns.set(text if kind == "allow" else "")
+        self.ignore_patterns.set(text if kind == "ignore" else "")
+        if not patterns:
+            self.log("已选择全部文件")
+        else:
+            self.log(f"已根据选择设置{'允许' if kind == 'allow' else '忽略'}文件模式 ({len(patterns)} 项)")
+    
+    def start_verify(self):
+        """校验保存位置中已下载的文件: 有下载清单时使用清单, 否则对比仓库元数据"""
+        local_dir = self.local_dir.get().strip()
+        if not local_dir or not os.path.isdir(local_dir):
+            messagebox.showerror("错误", "请选择已下载文件所在的保存位置。")
+            return
+        repo_id = self.repo_id.get().strip()
+        has_manifest = os.path.exists(os.path.join(local_dir, MANIFEST_NAME))
+        if not has_manifest and not repo_id:
+            messagebox.showerror("错误", "保存位置中没有下载清单, 请输入仓库ID以对比仓库元数据。")
+            return
+        
+        self.log_text.configure(state='normal')
+        self.log_text.delete(1.0, tk.END)
+        self.log_text.configure(state='disabled')
+        self.is_downloading = True
+        self.download_btn.config(state=tk.DISABLED)
+        self.verify_btn.config(state=tk.DISABLED)
+        self.cancel_btn.config(state=tk.NORMAL)
+        self.progress_var.set(0)
+        self.status_var.set("正在校验文件...")
+        self.root.after(self.progress_update_interval, self._progress_tick)
+        
+        self.download_job = VerifyJob(
+            local_dir, self.download_tracker,
+            repo_id=None if has_manifest else repo_id,
+            repo_type=self.repo_type.get(),
+            token=self.hf_token.get().strip(),
+            endpoint=self.get_endpoints()[0],
+            proxies=self.get_proxies(),
+        )
+        thread = threading.Thread(target=self.verify_task, args=(self.download_job,), daemon=True)
+        thread.start()
+    
+    def verify_task(self, job):
+        """执行校验任务 (在后台线程中运行)"""
+        try:
+            failed = job.run()
+            if job.cancelled:
+                status = "校验已取消"
+            elif failed:
+                status = f"校验完成, {len(failed)} 个文件不一致"
+            else:
+                status = "校验完成"
+        except Exception as e:
+            self.log(f"校验失败: {e}")
+            status = "校验失败"
+        self.log("\n" + self.download_tracker.get_summary())
+        self.is_downloading = False
+        self.download_job = None
+        self.run_on_ui(self.finish_verify, status)
+    
+    def finish_verify(self, status):
+        self.status_var.set(status)
+        self.download_btn.config(state=tk.NORMAL)
+        self.verify_btn.config(state=tk.NORMAL)
+        self.cancel_btn.config(state=tk.DISABLED)
+        failed_files = self.download_tracker.failed_files
+        if status == "校验完成":
+            messagebox.showinfo("校验完成", f"{self.download_tracker.verified_files} 个文件全部通过校验。")
+        elif failed_files:
+            messagebox.showwarning("校验完成", f"{len(failed_files)} 个文件与仓库记录不一致, 请重新下载这些文件。\n请查看日志获取详情。")
+    
+    def download_task(self, job):
+        """执行下载任务的主函数 (在下载线程中运行, 界面更新均通过队列提交)"""
+        local_dir = job.local_dir
+        status = "下载因未知错误失败"
 
-            # 注意：snapshot_download不支持download_callback参数
-            snapshot_download(
-                repo_id=repo_id,
-                local_dir=local_dir,
-                local_dir_use_symlinks=self.use_symlinks.get(),
-                resume_download=self.resume_download.get(),
-                ignore_patterns=ignore_patterns,
-                token=token_to_use,
-                # 移除了不兼容的download_callback参数
-            )
+        try:
+            succeeded = job.run()
             
             if self.is_downloading:
                 self.log(f"下载流程执行完毕。文件已保存在: {local_dir}")
-                self.status_var.set("下载完成")
-                self.progress_var.set(100) # 设为100%表示完成
+                status = "下载完成"
+                self.set_progress(100) # 设为100%表示完成
 
-            # 在函数适当位置添加计数器变量
-            successful_files_count = 0
-            
-            # 在成功下载后更新
-            self.log(f"成功下载：{successful_files_count}/{self.download_tracker.total_files}个文件")
+            self.log(f"成功下载：{len(succeeded)}/{self.download_tracker.total_files}个文件")
 
-        except HfHubHTTPError as e:
+        except DownloadError as e:
+            # 获取仓库信息失败 (仓库不存在、无权访问、服务器错误等) 或磁盘空间不足, 单个文件的失败已由下载引擎记录
             if not self.is_downloading: return
             error_message = str(e)
-            self.log(f"下载HTTP错误: {error_message}")
-            
-            # 尝试从错误消息中找出失败的文件URL
-            urls = re.findall(r'https://huggingface.co/[^\s\'\"]+', error_message)
-            if urls:
-                for url in urls:
-                    filename = self.extract_file_from_url(url)
-                    self.download_tracker.add_failed_file(filename, f"HTTP错误: {e.response.status_code if hasattr(e, 'response') and e.response else 'N/A'}")
+            if e.kind == "disk":
+                self.log(f"下载无法开始: {error_message}")
+                self.download_tracker.add_failed_file("保存位置", error_message, kind=e.kind)
+                status = "下载因磁盘空间不足失败"
             else:
-                self.download_tracker.add_failed_file("未知文件 (HTTP错误)", error_message)
-                
-            self.status_var.set("下载因HTTP错误失败")
+                self.log(f"下载HTTP错误: {error_message}")
+                self.download_tracker.add_failed_file("仓库信息", error_message, kind=e.kind)
+                status = "下载因HTTP错误失败"
         
-        except urllib3.exceptions.IncompleteRead as e:
-            if not self.is_downloading: return
-            self.log(f"连接中断 (IncompleteRead): 数据接收不完整。")
-            self.log(f"  已接收: {len(e.partial) if hasattr(e, 'partial') else '未知'} 字节")
-            self.log(f"  预计大小: {e.expected if hasattr(e, 'expected') else '未知'} 字节")
-            
-            self.download_tracker.add_failed_file("未知文件 (网络中断)", 
-                                          f"数据传输中断: 接收了{len(e.partial) if hasattr(e, 'partial') else '未知'}字节")
-            self.status_var.set("下载因连接中断失败")
-            
         except Exception as e:
             if not self.is_downloading: return
             error_message = str(e)
             self.log(f"发生未知错误: {error_message}")
             
             self.download_tracker.add_failed_file("未知文件 (发生错误)", error_message)
-            self.status_var.set("下载因未知错误失败")
+            status = "下载因未知错误失败"
         
         finally:
             # 结束进度跟踪
             self.download_tracker.end()
             
             # 如果用户取消但状态未更新，则更新状态
-            if not self.is_downloading and self.status_var.get() != "下载已取消":
+            if not self.is_downloading and status != "下载已取消":
                  self.log("下载任务在处理过程中被取消。")
-                 self.status_var.set("下载已取消")
+                 status = "下载已取消"
+            self.set_status(status)
 
             # 生成并显示下载摘要
             summary = self.download_tracker.get_summary()
             self.log("\n" + summary)
             
-            # 恢复按钮状态
             self.is_downloading = False
-            self.download_btn.config(state=tk.NORMAL)
-            self.cancel_btn.config(state=tk.DISABLED)
-            
-            # 根据下载状态显示不同的消息框
-            current_status = self.status_var.get()
-            if current_status == "下载完成" and not self.download_tracker.failed_files:
-                 messagebox.showinfo("下载完成", f"所有文件已成功下载!\n保存在: {local_dir}")
-            elif "完成" in current_status and self.download_tracker.failed_files:
-                 messagebox.showwarning("部分完成", f"下载完成，但有{len(self.download_tracker.failed_files)}个文件失败。\n请查看日志获取详情。\n保存在: {local_dir}")
-            elif current_status == "下载已取消":
-                 messagebox.showinfo("下载取消", "下载任务已被用户取消。")
-            else: # 错误情况
-                 messagebox.showerror("下载失败", "下载过程中遇到错误，请查看日志获取详情。")
+            self.download_job = None
+            self.run_on_ui(self.finish_download, status, local_dir, job)
+
+    def finish_download(self, status, local_dir, job):
+        """恢复按钮状态并根据下载结果显示消息框 (在GUI线程中执行)"""
+        self.status_var.set(status)
+        self.progress_bar.stop()
+        self.progress_bar.config(mode='determinate')
+        self.download_btn.config(state=tk.NORMAL)
+        self.verify_btn.config(state=tk.NORMAL)
+        self.cancel_btn.config(state=tk.DISABLED)
+        
+        failed_files = self.download_tracker.failed_files
+        if status == "下载完成" and not failed_files:
+             messagebox.showinfo("下载完成", f"所有文件已成功下载!\n保存在: {local_dir}")
+        elif "完成" in status and failed_files:
+             messagebox.showwarning("部分完成", f"下载完成，但有{len(failed_files)}个文件失败。\n请查看日志获取详情。\n保存在: {local_dir}")
+        elif status == "下载已取消":
+             messagebox.showinfo("下载取消", "下载任务已被用户取消。")
+        else: # 错误情况
+             messagebox.showerror("下载失败", "下载过程中遇到错误，请查看日志获取详情。")
+        
+        self.offer_prune(job)
+    
+    def offer_prune(self, job):
+        """远程仓库删除了本地仍保留的文件时, 询问是否清理"""
+        if job is None or not job.deleted_files:
+            return
+        preview = "\n".join(job.deleted_files[:10]) + ("\n..." if len(job.deleted_files) > 10 else "")
+        if messagebox.askyesno("清理已删除的文件",
+                               f"远程仓库已删除以下 {len(job.deleted_files)} 个文件, 是否从本地删除?\n\n{preview}"):
+            removed = job.prune_deleted()
+            self.log(f"已删除 {len(removed)} 个远程已不存在的文件")
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,60 @@
+"""测试共用的fixture: 在本机启动benchmarks.fakehub模拟的Hub"""
+import hashlib
+import os
+
+import pytest
+
+from benchmarks.fakehub import FakeHub, Faults, SyntheticFile, SyntheticRepo
+from hfdl import DownloadJob, RetryPolicy
+
+def make_test_repo(repo_id="test/repo", lfs_files=2, lfs_size=3 * 1024 * 1024, small_files=3, repo_type="model"):
+    """几个LFS文件加几个小文件的仓库"""
+    files = [SyntheticFile(f"model-{i:05d}.safetensors", lfs_size + i, f"{repo_id}:lfs:{i}")
+             for i in range(lfs_files)]
+    files += [SyntheticFile(f"small-{i}.json", 500 + i, f"{repo_id}:small:{i}") for i in range(small_files)]
+    return SyntheticRepo(repo_id, files, repo_type)
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def assert_repo_files(repo, local_dir):
+    """local_dir中的每个文件都与仓库内容一致"""
+    for f in repo.files.values():
+        path = os.path.join(local_dir, *f.path.split("/"))
+        assert os.path.getsize(path) == f.size, f.path
+        assert file_sha256(path) == f.sha256, f.path
+
+def assert_downloaded(repo, local_dir, succeeded, tracker):
+    """仓库的全部文件都下载成功, 没有失败的文件, 内容与仓库一致"""
+    assert sorted(succeeded) == sorted(repo.files)
+    assert not tracker.failed_files
+    assert_repo_files(repo, str(local_dir))
+
+def download_repo(repo, endpoint, local_dir, **options):
+    """用DownloadJob下载整个仓库并检查结果, 返回job
+
+    默认不使用代理、出错不重试 (故障由测试注入), options覆盖DownloadJob的其他参数。
+    """
+    options = dict({"proxies": {}, "retry_policy": RetryPolicy(attempts=1), "repo_type": repo.repo_type}, **options)
+    job = DownloadJob(repo.repo_id, str(local_dir), endpoint=endpoint, **options)
+    assert_downloaded(repo, local_dir, job.run(), job.tracker)
+    return job
+
+@pytest.fixture
+def start_hub():
+    """start_hub(repos, **faults) 启动一个FakeHub, 返回 (hub, 下载地址); 测试结束时全部停止"""
+    hubs = []
+
+    def start(repos, **faults):
+        hub = FakeHub(repos, Faults(**faults))
+        endpoint = hub.start()
+        hubs.append(hub)
+        return hub, endpoint
+
+    yield start
+    for hub in hubs:
+        hub.stop()
@@ -0,0 +1,54 @@
+"""小文件模式 (hfdl/asyncengine.py) 的续传和校验"""
+import os
+import time
+
+from hfdl import AsyncDownloadEngine, DownloadTracker
+
+from .conftest import make_test_repo, download_repo
+
+def test_async_resumes_incomplete_files(start_hub, tmp_path):
+    repo = make_test_repo(lfs_files=2, lfs_size=2 * 1024 * 1024, small_files=2)
+    hub, endpoint = start_hub([repo])
+
+    # 每个LFS文件先写好前一半, 续传时要先对已有数据计算sha256
+    kept = 0
+    for f in repo.files.values():
+        if not f.lfs:
+            continue
+        half = f.size // 2
+        with open(os.path.join(str(tmp_path), f.path + ".incomplete"), "wb") as out:
+            for chunk in f.chunks(0, half - 1):
+                out.write(chunk)
+        kept += half
+
+    job = download_repo(repo, endpoint, tmp_path, transfer_mode="async")
+
+    assert hub.stats()["bytes_sent"] == repo.total_bytes - kept
+    assert job.engine.verified_files == {f.path for f in repo.files.values() if f.lfs}
+
+class TimingTracker(DownloadTracker):
+    """记录每个文件开始和完成的时间"""
+    def __init__(self):
+        super().__init__()
+        self.started, self.finished = {}, {}
+
+    def file_started(self, filename):
+        self.started.setdefault(filename, time.monotonic())
+        super().file_started(filename)
+
+    def add_downloaded_file(self, filename):
+        self.finished[filename] = time.monotonic()
+        super().add_downloaded_file(filename)
+
+def test_large_files_start_during_small_file_phase(start_hub, tmp_path):
+    """大于file_limit的文件与事件循环同时下载, 不等所有小文件完成"""
+    repo = make_test_repo(lfs_files=1, lfs_size=16 * 1024 * 1024, small_files=300)
+    hub, endpoint = start_hub([repo], latency=0.01)
+    large = next(f.path for f in repo.files.values() if f.lfs)
+
+    tracker = TimingTracker()
+    job = download_repo(repo, endpoint, tmp_path, tracker=tracker, transfer_mode="async", max_workers=2)
+
+    assert isinstance(job.engine, AsyncDownloadEngine)
+    small_done = max(t for filename, t in tracker.finished.items() if filename != large)
+    assert tracker.started[large] < small_done
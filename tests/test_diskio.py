@@ -0,0 +1,34 @@
+"""下载前的剩余空间检查 (hfdl/diskio.py)"""
+import os
+
+import pytest
+
+from hfdl import DownloadError, DownloadJob, RetryPolicy
+from hfdl import diskio
+from hfdl.diskio import check_free_space
+
+from .conftest import make_test_repo
+
+def test_check_free_space(tmp_path, monkeypatch):
+    monkeypatch.setattr(diskio, "free_space", lambda path: 1000)
+
+    assert check_free_space(str(tmp_path / "missing" / "dir"), 400, reserve=600) == 1000
+    with pytest.raises(DownloadError) as e:
+        check_free_space(str(tmp_path), 401, reserve=600)
+    assert e.value.kind == "disk"
+    assert not e.value.retryable
+
+def test_job_fails_before_download_when_disk_is_full(start_hub, tmp_path, monkeypatch):
+    repo = make_test_repo()
+    hub, endpoint = start_hub([repo])
+    # 仓库本身放得下, 但下载完成后剩余空间少于free_space_reserve
+    monkeypatch.setattr(diskio, "free_space", lambda path: repo.total_bytes + DownloadJob.free_space_reserve - 1)
+
+    job = DownloadJob(repo.repo_id, str(tmp_path), endpoint=endpoint, proxies={}, retry_policy=RetryPolicy(attempts=1))
+    with pytest.raises(DownloadError) as e:
+        job.run()
+
+    assert e.value.kind == "disk"
+    assert "磁盘空间不足" in str(e.value)
+    assert hub.stats()["bytes_sent"] == 0
+    assert not [f for f in repo.files if os.path.exists(os.path.join(str(tmp_path), f))]
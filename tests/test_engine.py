@@ -0,0 +1,75 @@
+"""下载引擎 (hfdl/engine.py) 的续传和分段重试"""
+import os
+
+import pytest
+
+from hfdl import DownloadEngine, DownloadTracker, HttpSession, RetryPolicy
+
+from .conftest import make_test_repo, assert_downloaded, download_repo
+
+def write_incomplete(local_dir, f, size, corrupt=False):
+    """写出f的前size字节作为.incomplete文件, corrupt为True时改写其中几个字节"""
+    path = os.path.join(str(local_dir), f.path + ".incomplete")
+    with open(path, "wb") as out:
+        for chunk in f.chunks(0, size - 1):
+            out.write(chunk)
+        if corrupt:
+            out.seek(size // 2)
+            out.write(b"corrupted")
+
+@pytest.mark.parametrize("transfer_mode", ["threads", "async"])
+def test_complete_incomplete_file_is_finished_without_download(start_hub, tmp_path, transfer_mode):
+    repo = make_test_repo(lfs_files=1, lfs_size=2 * 1024 * 1024, small_files=1)
+    hub, endpoint = start_hub([repo])
+    lfs = next(f for f in repo.files.values() if f.lfs)
+    # 上次下载在重命名前中断: 临时文件已包含全部数据, 续传请求会收到416
+    write_incomplete(tmp_path, lfs, lfs.size)
+
+    job = download_repo(repo, endpoint, tmp_path, transfer_mode=transfer_mode)
+
+    assert hub.stats()["bytes_sent"] == repo.total_bytes - lfs.size
+    assert lfs.path in job.engine.verified_files
+    assert not os.path.exists(os.path.join(str(tmp_path), lfs.path + ".incomplete"))
+
+@pytest.mark.parametrize("transfer_mode", ["threads", "async"])
+def test_corrupted_complete_incomplete_file_is_downloaded_again(start_hub, tmp_path, transfer_mode):
+    repo = make_test_repo(lfs_files=1, lfs_size=2 * 1024 * 1024, small_files=1)
+    hub, endpoint = start_hub([repo])
+    lfs = next(f for f in repo.files.values() if f.lfs)
+    write_incomplete(tmp_path, lfs, lfs.size, corrupt=True)
+
+    # sha256不一致时删除临时文件, 重试时从头下载
+    download_repo(repo, endpoint, tmp_path, transfer_mode=transfer_mode, retry_policy=RetryPolicy(attempts=2))
+
+    assert hub.stats()["bytes_sent"] == repo.total_bytes
+
+def test_dropped_segment_resumes_from_written_position(start_hub, tmp_path, monkeypatch):
+    repo = make_test_repo(lfs_files=1, lfs_size=8 * 1024 * 1024, small_files=0)
+    hub, endpoint = start_hub([repo], drop_rate=0.3, seed=1)
+    lfs = next(iter(repo.files.values()))
+    monkeypatch.setattr(DownloadEngine, "write_buffer_size", 64 * 1024)
+
+    retries = []
+
+    def listener(event, data):
+        if event == "file_retry":
+            retries.append(data["segment"])
+
+    tracker = DownloadTracker(listener=listener)
+    tracker.start()
+    engine = DownloadEngine(repo.repo_id, str(tmp_path), tracker, endpoint=endpoint, max_workers=1, segments=4,
+                            segment_threshold=1024 * 1024, retry_policy=RetryPolicy(attempts=20, base_delay=0.01),
+                            session=HttpSession(proxies={}))
+    ranges = []
+    request = engine._request
+    monkeypatch.setattr(engine, "_request", lambda filename, headers, endpoint=None: (
+        ranges.append(headers.get("Range")), request(filename, headers, endpoint))[1])
+
+    assert_downloaded(repo, tmp_path, engine.run(list(repo.files)), tracker)
+
+    assert hub.stats()["dropped"] > 0
+    # 断开的分段单独重试, 不重新下载整个文件
+    assert retries and all(retries)
+    starts = {segment["start"] for segment in engine._new_segment_state(lfs.size, 4)["segments"]}
+    resumed = [r for r in ranges if r is not None and int(r[len("bytes="):].split("-")[0]) not in starts]
+    assert resumed
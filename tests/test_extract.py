@@ -0,0 +1,90 @@
+"""边下载边解压tar和zip归档 (hfdl/extract.py)"""
+import io
+import os
+import random
+import tarfile
+import zipfile
+
+import pytest
+
+from benchmarks.fakehub import ContentFile, SyntheticRepo
+from hfdl import DownloadJob, RetryPolicy
+from hfdl.extract import EXTRACTED_RECORD
+
+MEMBERS = {
+    "data/random.bin": random.Random(1).getrandbits(8 * 300 * 1024).to_bytes(300 * 1024, "little"),
+    "data/text.txt": b"hello archive\n" * 20000,
+    "README.md": b"# archive\n",
+}
+
+def make_tar(members, mode="w:gz"):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as tar:
+        for name, content in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+def make_zip(members):
+    """第一个成员不压缩, 其余用deflate压缩"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for i, (name, content) in enumerate(members.items()):
+            archive.writestr(name, content, zipfile.ZIP_STORED if i == 0 else zipfile.ZIP_DEFLATED)
+    return buffer.getvalue()
+
+def download_archives(repo, endpoint, local_dir, **options):
+    """解压归档的方式下载仓库, 返回 (job, 成功的文件)"""
+    options = dict({"proxies": {}, "retry_policy": RetryPolicy(attempts=1), "extract_archives": True}, **options)
+    job = DownloadJob(repo.repo_id, str(local_dir), endpoint=endpoint, **options)
+    return job, job.run()
+
+def assert_extracted(dest, members):
+    for name, content in members.items():
+        with open(os.path.join(dest, *name.split("/")), "rb") as f:
+            assert f.read() == content, name
+    assert os.path.isfile(os.path.join(dest, EXTRACTED_RECORD))
+
+@pytest.mark.parametrize("keep_archives", [True, False])
+@pytest.mark.parametrize("filename,content", [("archive.tar.gz", make_tar(MEMBERS)),
+                                              ("archive.tar", make_tar(MEMBERS, "w")),
+                                              ("archive.zip", make_zip(MEMBERS))])
+def test_extract_with_dropped_connections(start_hub, tmp_path, filename, content, keep_archives):
+    repo = SyntheticRepo("test/archives", [ContentFile(filename, content), ContentFile("config.json", b"{}")])
+    hub, endpoint = start_hub([repo], drop_rate=0.5, seed=3)
+
+    # 中断后从已保存 (保留归档) 或已解压 (不保留归档) 的位置续传
+    job, succeeded = download_archives(repo, endpoint, tmp_path, keep_archives=keep_archives,
+                                       retry_policy=RetryPolicy(attempts=20, base_delay=0.01))
+
+    assert sorted(succeeded) == sorted(repo.files)
+    assert not job.tracker.failed_files
+    assert hub.stats()["dropped"] > 0
+    assert_extracted(os.path.join(str(tmp_path), "archive"), MEMBERS)
+    assert job.tracker.extracted_archives[filename] == (len(MEMBERS), sum(map(len, MEMBERS.values())))
+    archive_path = os.path.join(str(tmp_path), filename)
+    if keep_archives:
+        with open(archive_path, "rb") as f:
+            assert f.read() == content
+    else:
+        assert not os.path.exists(archive_path)
+    assert not os.path.exists(archive_path + ".incomplete")
+    assert not os.path.exists(os.path.join(str(tmp_path), "archive.incomplete"))
+
+def test_corrupted_zip_member_fails_crc_check(start_hub, tmp_path):
+    content = bytearray(make_zip(MEMBERS))
+    # 改写不压缩的第一个成员中的数据, 中央目录中的CRC不变
+    position = content.index(MEMBERS["data/random.bin"][:64]) + 1000
+    content[position] ^= 0xff
+    repo = SyntheticRepo("test/archives", [ContentFile("archive.zip", content)])
+    hub, endpoint = start_hub([repo])
+
+    job, succeeded = download_archives(repo, endpoint, tmp_path, keep_archives=False)
+
+    assert succeeded == []
+    assert "archive.zip" in job.tracker.failed_files
+    assert "CRC" in job.tracker.failed_files_info["archive.zip"]
+    assert job.tracker.failed_files_kind["archive.zip"] == "hash"
+    assert not os.path.exists(os.path.join(str(tmp_path), "archive"))
+    assert not os.path.exists(os.path.join(str(tmp_path), "archive.incomplete"))
@@ -0,0 +1,56 @@
+"""文件选择器的目录树 (hfdl/filetree.py) 在大型数据集仓库上的结果"""
+from hfdl import DownloadJob
+from hfdl.filetree import FileTree
+
+from .conftest import make_test_repo
+
+def dataset_files(splits=("train", "validation", "test"), shards=500, configs=33):
+    """约5万个文件的数据集仓库: data/<配置>/<划分>/<分片>.parquet, 外加README和.gitattributes"""
+    files = {"README.md": 1000, ".gitattributes": 2000}
+    for c in range(configs):
+        for split in splits:
+            for s in range(shards):
+                files[f"data/config-{c:02d}/{split}/{split}-{s:05d}-of-{shards:05d}.parquet"] = 1000 + s
+    return files
+
+def test_large_dataset_tree():
+    files = dataset_files()
+    assert len(files) > 49000
+    tree = FileTree(files)
+
+    assert tree.children("") == [("data", True), (".gitattributes", False), ("README.md", False)]
+    children = tree.children("data/config-00/train")
+    assert len(children) == 500 and children[0] == ("data/config-00/train/train-00000-of-00500.parquet", False)
+    assert tree.file_count("data/config-00") == 1500
+    assert tree.selection_totals() == (len(files), sum(files.values()))
+
+def test_large_dataset_selection_totals():
+    files = dataset_files()
+    tree = FileTree(files)
+    # 只下载一个配置的训练集, 并去掉其中100个分片
+    tree.select_all(False)
+    tree.set_selected("data/config-07/train", True)
+    removed = [f"data/config-07/train/train-{s:05d}-of-00500.parquet" for s in range(0, 500, 5)]
+    for path in removed:
+        tree.set_selected(path, False)
+
+    assert tree.selection_totals() == (400, sum(1000 + s for s in range(500) if s % 5))
+    assert tree.selection_totals("data/config-07/validation") == (0, 0)
+    assert tree.state("data") == "partial"
+    assert tree.state("data/config-06") == "unselected"
+
+    # 忽略模式: README、.gitattributes、其他32个配置、config-07的另外两个划分和去掉的100个分片
+    kind, patterns = tree.to_patterns()
+    assert kind == "ignore" and len(patterns) == 2 + 32 + 2 + len(removed)
+    assert "data/config-00/" in patterns and "data/config-07/test/" in patterns
+
+def test_tree_from_dataset_metadata(start_hub, tmp_path):
+    """文件选择器按仓库类型获取元数据"""
+    repo = make_test_repo("test/dataset", repo_type="dataset")
+    hub, endpoint = start_hub([repo])
+
+    job = DownloadJob(repo.repo_id, str(tmp_path), endpoint=endpoint, repo_type="dataset", proxies={})
+    tree = FileTree(job.load_metadata()["files"])
+
+    assert [path for path, is_dir in tree.children()] == sorted(repo.files)
+    assert tree.selection_totals() == (len(repo.files), repo.total_bytes)
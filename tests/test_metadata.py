@@ -0,0 +1,55 @@
+"""仓库元数据的磁盘缓存和ETag重新确认 (hfdl/metadata.py)"""
+from hfdl import HttpSession, MetadataCache, get_repo_metadata
+
+from .conftest import make_test_repo
+
+def fetch(repo, endpoint, cache):
+    session = HttpSession(proxies={})
+    try:
+        return get_repo_metadata(repo.repo_id, endpoint=endpoint, session=session, cache=cache)
+    finally:
+        session.close()
+
+def test_fresh_cache_skips_request(start_hub, tmp_path):
+    repo = make_test_repo()
+    hub, endpoint = start_hub([repo])
+    cache = MetadataCache(str(tmp_path), ttl=600)
+
+    first = fetch(repo, endpoint, cache)
+    second = fetch(repo, endpoint, cache)
+
+    assert (first["source"], second["source"]) == ("network", "cache")
+    assert second["files"] == first["files"]
+    assert hub.stats()["api_requests"] == 1
+
+def test_expired_cache_is_revalidated_with_etag(start_hub, tmp_path):
+    repo = make_test_repo()
+    hub, endpoint = start_hub([repo])
+    cache = MetadataCache(str(tmp_path), ttl=0)
+
+    first = fetch(repo, endpoint, cache)
+    second = fetch(repo, endpoint, cache)
+
+    assert (first["source"], second["source"]) == ("network", "revalidated")
+    # 服务器只返回304, 文件列表来自缓存
+    assert hub.stats()["not_modified"] == 1
+    assert second["sha"] == repo.sha
+    assert second["files"] == first["files"]
+    assert sorted(second["files"]) == sorted(repo.files)
+
+def test_cache_is_per_repo_type(start_hub, tmp_path):
+    model = make_test_repo("test/same-name")
+    dataset = make_test_repo("test/same-name", small_files=1, repo_type="dataset")
+    hub, endpoint = start_hub([model, dataset])
+    cache = MetadataCache(str(tmp_path), ttl=600)
+
+    fetch(model, endpoint, cache)
+    session = HttpSession(proxies={})
+    try:
+        metadata = get_repo_metadata(dataset.repo_id, endpoint=endpoint, session=session, cache=cache,
+                                     repo_type="dataset")
+    finally:
+        session.close()
+
+    assert metadata["source"] == "network"
+    assert sorted(metadata["files"]) == sorted(dataset.files)
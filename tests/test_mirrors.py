@@ -0,0 +1,36 @@
+"""多个下载地址的测速排序和按文件故障切换 (hfdl/mirrors.py)"""
+from hfdl import DownloadEngine, DownloadTracker, HttpSession, RetryPolicy
+from hfdl.mirrors import EndpointSelector
+
+from .conftest import make_test_repo, assert_downloaded, download_repo
+
+def test_probe_ranks_healthy_endpoint_first(start_hub, tmp_path):
+    repo = make_test_repo()
+    failing, failing_endpoint = start_hub([repo], error_rate=1)
+    healthy, healthy_endpoint = start_hub([repo])
+
+    job = download_repo(repo, failing_endpoint, tmp_path, mirrors=[healthy_endpoint], transfer_mode="threads")
+
+    selector = job.engine.endpoint_selector
+    assert selector.ranking == [healthy_endpoint, failing_endpoint]
+    assert selector.results[failing_endpoint]["error"] == "HTTP 503"
+    assert failing.stats()["bytes_sent"] == 0
+
+def test_failed_files_move_to_next_endpoint(start_hub, tmp_path):
+    repo = make_test_repo()
+    failing, failing_endpoint = start_hub([repo], error_rate=1)
+    healthy, healthy_endpoint = start_hub([repo])
+
+    # 不测速, 按配置的顺序先使用出错的地址
+    tracker = DownloadTracker()
+    tracker.start()
+    selector = EndpointSelector([failing_endpoint, healthy_endpoint], tracker)
+    engine = DownloadEngine(repo.repo_id, str(tmp_path), tracker, endpoint=failing_endpoint,
+                            endpoint_selector=selector, retry_policy=RetryPolicy(attempts=1),
+                            session=HttpSession(proxies={}), max_workers=1, segments=1)
+    assert_downloaded(repo, tmp_path, engine.run(list(repo.files)), tracker)
+
+    # 连续失败max_failures次后降为最后选择, 之后的文件直接从健康的地址下载
+    assert failing.stats()["errors"] == selector.max_failures
+    assert failing.stats()["bytes_sent"] == 0
+    assert selector.candidates()[0] == healthy_endpoint
@@ -0,0 +1,105 @@
+"""局域网节点共享 (hfdl/peers.py): hfdl serve提供文件, 下载时用--peer从节点获取LFS文件"""
+import io
+import os
+import sys
+import json
+import socket
+import subprocess
+import contextlib
+
+import pytest
+
+from hfdl.cli import main
+from hfdl.manifest import load_manifest, save_manifest, local_path
+
+from .conftest import make_test_repo, assert_repo_files, download_repo
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture
+def serve_peer():
+    """serve_peer(目录) 在子进程中运行hfdl serve, 返回节点地址; 测试结束时停止"""
+    processes = []
+
+    def serve(directory):
+        port = free_port()
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        process = subprocess.Popen([sys.executable, "-m", "hfdl", "serve", directory, "--port", str(port),
+                                    "--host", "127.0.0.1", "--no-announce", "--json"],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, cwd=ROOT)
+        processes.append(process)
+        for line in process.stdout:
+            if json.loads(line)["event"] == "serving":
+                return f"127.0.0.1:{port}"
+        pytest.fail(f"hfdl serve 没有启动: {process.stderr.read().decode('utf-8', 'replace')}")
+
+    yield serve
+    for process in processes:
+        process.terminate()
+        process.wait(10)
+
+@pytest.fixture
+def no_proxy(monkeypatch):
+    monkeypatch.setenv("NO_PROXY", "127.0.0.1,localhost")
+    monkeypatch.setenv("no_proxy", "127.0.0.1,localhost")
+
+def download(repo, endpoint, directory, peer):
+    """用命令行下载, 返回 (退出码, JSON事件列表)"""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        code = main([repo.repo_id, "-d", directory, "--endpoint", endpoint, "--peer", peer, "--json"])
+    return code, [json.loads(line) for line in output.getvalue().splitlines()]
+
+def lfs_bytes(repo):
+    return sum(f.size for f in repo.files.values() if f.lfs)
+
+def test_download_from_peer(start_hub, serve_peer, no_proxy, tmp_path):
+    repo = make_test_repo()
+    hub, endpoint = start_hub([repo])
+    download_repo(repo, endpoint, tmp_path / "seed")
+    peer = serve_peer(str(tmp_path / "seed"))
+
+    sent = hub.stats()["bytes_sent"]
+    code, events = download(repo, endpoint, str(tmp_path / "target"), peer)
+
+    assert code == 0
+    summary = events[-1]
+    assert summary["event"] == "summary"
+    assert summary["peer_bytes"] == lfs_bytes(repo)
+    # LFS文件全部来自节点, Hub只发送了小文件
+    assert hub.stats()["bytes_sent"] - sent == repo.total_bytes - lfs_bytes(repo)
+    assert_repo_files(repo, str(tmp_path / "target"))
+
+def test_corrupted_peer_falls_back_to_hub(start_hub, serve_peer, no_proxy, tmp_path):
+    repo = make_test_repo()
+    hub, endpoint = start_hub([repo])
+    seed_dir = str(tmp_path / "seed")
+    download_repo(repo, endpoint, seed_dir)
+
+    # 改写LFS文件的内容但保持大小, 并更新清单中的修改时间, 节点仍会提供这些文件
+    manifest = load_manifest(seed_dir)
+    for f in repo.files.values():
+        if not f.lfs:
+            continue
+        path = local_path(seed_dir, f.path)
+        with open(path, "r+b") as out:
+            out.seek(f.size // 2)
+            out.write(b"corrupted")
+        manifest["files"][f.path]["mtime"] = os.stat(path).st_mtime
+    save_manifest(seed_dir, manifest)
+    peer = serve_peer(seed_dir)
+
+    sent = hub.stats()["bytes_sent"]
+    code, events = download(repo, endpoint, str(tmp_path / "target"), peer)
+
+    assert code == 0
+    assert events[-1]["peer_bytes"] == 0
+    messages = [event.get("message", "") for event in events]
+    assert sum("sha256校验失败" in message and "改从Hub下载" in message for message in messages) == 2
+    assert hub.stats()["bytes_sent"] - sent == repo.total_bytes
+    assert_repo_files(repo, str(tmp_path / "target"))
@@ -0,0 +1,29 @@
+"""数据集和Space仓库使用带前缀的元数据接口和文件网址"""
+import pytest
+
+from hfdl import DownloadJob
+from hfdl.errors import NotFoundError
+
+from .conftest import make_test_repo, download_repo
+
+@pytest.mark.parametrize("transfer_mode", ["threads", "async"])
+def test_download_dataset(start_hub, tmp_path, transfer_mode):
+    repo = make_test_repo("test/dataset", repo_type="dataset")
+    hub, endpoint = start_hub([repo])
+
+    # fakehub只在datasets/前缀下提供该仓库
+    job = download_repo(repo, endpoint, tmp_path, transfer_mode=transfer_mode)
+    assert job.repo_type == "dataset"
+    assert job.engine.get_file_url("small-0.json") == f"{endpoint}/datasets/test/dataset/resolve/main/small-0.json"
+
+def test_dataset_is_not_found_as_model(start_hub, tmp_path):
+    repo = make_test_repo("test/dataset", repo_type="dataset")
+    hub, endpoint = start_hub([repo])
+
+    job = DownloadJob(repo.repo_id, str(tmp_path), endpoint=endpoint, proxies={})
+    with pytest.raises(NotFoundError):
+        job.run()
+
+def test_unknown_repo_type():
+    with pytest.raises(ValueError):
+        DownloadJob("test/repo", "./repo", repo_type="datasets")
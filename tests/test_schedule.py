@@ -0,0 +1,53 @@
+"""下载顺序 (hfdl/schedule.py) 和加载所需文件就绪时的metadata_ready事件"""
+from benchmarks.fakehub import SyntheticFile, SyntheticRepo
+from hfdl import DownloadTracker
+from hfdl.schedule import schedule_files, LOAD_METADATA_MAX_SIZE
+
+from .conftest import download_repo
+
+def test_schedule_files():
+    sizes = {
+        "model-00001-of-00002.safetensors": 5000,
+        "model-00002-of-00002.safetensors": 9000,
+        "model.safetensors.index.json": 800,
+        "config.json": 600,
+        "tokenizer.json": 2000,
+        "text_encoder/config.json": 300,
+        "README.md": 100,
+        "huge/vocab.json": LOAD_METADATA_MAX_SIZE + 1,  # 过大的同名文件不提前下载
+    }
+    order, ready = schedule_files(list(sizes), sizes)
+
+    # 加载所需的文件从小到大排在最前, 其余从大到小
+    assert ready == ["text_encoder/config.json", "config.json", "model.safetensors.index.json", "tokenizer.json"]
+    assert order == ready + ["huge/vocab.json", "model-00002-of-00002.safetensors",
+                             "model-00001-of-00002.safetensors", "README.md"]
+
+def test_schedule_files_ties_are_sorted_by_name():
+    sizes = {"b.bin": 10, "a.bin": 10, "vocab.txt": 5, "merges.txt": 5}
+    order, ready = schedule_files(list(sizes), sizes)
+    assert order == ["merges.txt", "vocab.txt", "a.bin", "b.bin"]
+    assert ready == ["merges.txt", "vocab.txt"]
+
+def test_metadata_ready_fires_once_before_last_shard(start_hub, tmp_path):
+    shards = [f"model-0000{i}-of-00003.safetensors" for i in (1, 2, 3)]
+    files = [SyntheticFile(shard, 2 * 1024 * 1024 + i, f"shard:{i}") for i, shard in enumerate(shards)]
+    files += [SyntheticFile(name, 400 + i, f"meta:{i}") for i, name in
+              enumerate(["config.json", "tokenizer.json", "model.safetensors.index.json"])]
+    files.append(SyntheticFile("README.md", 300, "readme"))
+    repo = SyntheticRepo("test/shards", files)
+    hub, endpoint = start_hub([repo])
+
+    events = []
+    tracker = DownloadTracker(listener=lambda event, data: events.append((event, data.get("file"))))
+    download_repo(repo, endpoint, tmp_path, tracker=tracker, transfer_mode="threads", max_workers=1)
+
+    names = [event for event, _ in events]
+    assert names.count("metadata_ready") == 1
+    done = [filename for event, filename in events if event == "file_done"]
+    ready_at = names.index("metadata_ready")
+    # 三个加载所需的文件最先完成, 事件在它们之后、任何分片之前发出
+    assert set(done[:3]) == {"config.json", "tokenizer.json", "model.safetensors.index.json"}
+    last_shard = max(events.index(("file_done", shard)) for shard in shards)
+    assert events.index(("file_done", done[2])) < ready_at < last_shard
+    assert all(ready_at < events.index(("file_done", shard)) for shard in shards)
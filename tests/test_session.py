@@ -0,0 +1,42 @@
+"""HttpSession和小文件模式的连接池对环境变量代理和NO_PROXY的处理"""
+import pytest
+
+from hfdl import HttpSession
+
+from .conftest import make_test_repo, download_repo
+
+UNREACHABLE_PROXY = "http://10.255.255.1:9"
+
+@pytest.fixture
+def proxy_env(monkeypatch):
+    """环境变量中配置一个连不上的代理, 本机地址在NO_PROXY中"""
+    for name in ("http_proxy", "https_proxy", "all_proxy", "no_proxy"):
+        monkeypatch.delenv(name, raising=False)
+        monkeypatch.delenv(name.upper(), raising=False)
+    monkeypatch.setenv("HTTP_PROXY", UNREACHABLE_PROXY)
+    monkeypatch.setenv("NO_PROXY", "127.0.0.1,localhost")
+
+def test_session_bypasses_proxy_for_no_proxy_hosts(proxy_env):
+    session = HttpSession()
+    try:
+        assert session.proxies == {"http": UNREACHABLE_PROXY}
+        assert session.bypasses_proxy("127.0.0.1")
+        assert not session.bypasses_proxy("huggingface.co")
+    finally:
+        session.close()
+
+def test_explicit_proxies_ignore_no_proxy(proxy_env):
+    session = HttpSession(proxies={"http": UNREACHABLE_PROXY})
+    try:
+        assert not session.bypasses_proxy("127.0.0.1")
+    finally:
+        session.close()
+
+@pytest.mark.parametrize("transfer_mode", ["threads", "async"])
+def test_download_honours_no_proxy(proxy_env, start_hub, tmp_path, transfer_mode):
+    repo = make_test_repo(lfs_files=1, lfs_size=1024 * 1024)
+    hub, endpoint = start_hub([repo])
+
+    # proxies为None: 沿用环境变量中的代理, 本机地址按NO_PROXY直连
+    download_repo(repo, endpoint, tmp_path, proxies=None, transfer_mode=transfer_mode)
+    assert hub.stats()["bytes_sent"] == repo.total_bytes
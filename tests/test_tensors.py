@@ -0,0 +1,106 @@
+"""按张量下载safetensors分片 (hfdl/tensors.py)"""
+import os
+import json
+import random
+
+from benchmarks.fakehub import ContentFile, SyntheticRepo
+from hfdl import DownloadEngine, DownloadJob, DownloadTracker, HttpSession, RetryPolicy
+from hfdl import tensors
+from hfdl.tensors import ShardPlan, build_header, parse_header, read_remote_header
+
+INDEX = "model.safetensors.index.json"
+SHARDS = ["model-00001-of-00003.safetensors", "model-00002-of-00003.safetensors", "model-00003-of-00003.safetensors"]
+
+def make_shard(path, shapes, metadata=None):
+    """按 [(名称, shape)] 生成F32张量的safetensors文件, 返回 (ContentFile, {名称: 张量数据})"""
+    data = {}
+    for name, shape in shapes:
+        length = 4
+        for dim in shape:
+            length *= dim
+        data[name] = random.Random(name).getrandbits(8 * length).to_bytes(length, "little")
+    header = build_header([(name, "F32", shape, len(data[name])) for name, shape in shapes], metadata)
+    return ContentFile(path, header + b"".join(data[name] for name, _ in shapes)), data
+
+def make_tensor_repo():
+    """三个分片和分片索引; 第一个分片中选中的张量之间隔着一个超过RANGE_GAP的张量"""
+    shard1, data1 = make_shard(SHARDS[0], [("embed.weight", [64, 64]), ("layers.0.a", [32]),
+                                           ("layers.0.mlp", [640, 1024]), ("layers.0.c", [16])],
+                               {"format": "pt"})
+    shard2, data2 = make_shard(SHARDS[1], [("layers.1.a", [32]), ("layers.1.mlp", [64, 64]),
+                                           ("lm_head.weight", [64, 64])])
+    shard3, data3 = make_shard(SHARDS[2], [("unused.weight", [64, 64])])
+    weight_map = {name: shard.path for shard, data in [(shard1, data1), (shard2, data2), (shard3, data3)]
+                  for name in data}
+    index = ContentFile(INDEX, json.dumps({"metadata": {}, "weight_map": weight_map}).encode("utf-8"))
+    config = ContentFile("config.json", b'{"model_type": "test"}')
+    repo = SyntheticRepo("test/tensors", [shard1, shard2, shard3, index, config])
+    return repo, dict(data1, **data2, **data3)
+
+def read_shard(path):
+    """读取本地的safetensors文件, 返回 ({名称: 张量数据}, __metadata__)"""
+    with open(path, "rb") as f:
+        data = f.read()
+    header_size, header = parse_header(data)
+    start = 8 + header_size
+    tensors = {name: data[start + info["data_offsets"][0]:start + info["data_offsets"][1]]
+               for name, info in header.items() if name != "__metadata__"}
+    return tensors, header.get("__metadata__")
+
+def test_read_remote_header_in_several_probes(start_hub, tmp_path, monkeypatch):
+    repo, _ = make_tensor_repo()
+    hub, endpoint = start_hub([repo])
+    shard = repo.files[SHARDS[0]]
+    # 第一次请求读不完头部, 需要按头部长度再读取一次
+    monkeypatch.setattr(tensors, "HEADER_PROBE_SIZE", 100)
+    engine = DownloadEngine(repo.repo_id, str(tmp_path), DownloadTracker(), endpoint=endpoint,
+                            session=HttpSession(proxies={}))
+    released = []
+    release = engine._release
+    monkeypatch.setattr(engine, "_release", lambda response, completed: (released.append(completed),
+                                                                         release(response, completed)))
+
+    size, header_size, header = read_remote_header(engine, shard.path)
+
+    expected_size, expected = parse_header(shard.content)
+    assert (size, header_size, header) == (shard.size, expected_size, expected)
+    assert header["__metadata__"] == {"format": "pt"}
+    # 读完的206响应都放回连接池
+    assert released == [True, True]
+
+def test_shard_plan_merges_close_ranges():
+    info = {"size": 10000, "data_start": 200, "metadata": None,
+            "tensors": {"a": ["F32", [4], 0, 16], "b": ["F32", [4], 32, 48], "c": ["F32", [4], 2000, 2016]}}
+    plan = ShardPlan("model.safetensors", info, ["c", "a", "b"])
+
+    header = len(plan.header)
+    assert plan.names == ["a", "b", "c"]
+    assert plan.ranges == [(200, 216, header), (232, 248, header + 16), (2200, 2216, header + 32)]
+    assert (plan.size, plan.data_size) == (header + 48, 48)
+    assert [(start, end, len(ranges)) for start, end, ranges in plan.groups(gap=100)] == [(200, 248, 2),
+                                                                                            (2200, 2216, 1)]
+    assert len(plan.groups(gap=2000)) == 1
+
+def test_download_selected_tensors(start_hub, tmp_path):
+    repo, data = make_tensor_repo()
+    hub, endpoint = start_hub([repo])
+    selected = {SHARDS[0]: ["embed.weight", "layers.0.a", "layers.0.c"], SHARDS[1]: ["layers.1.a", "lm_head.weight"]}
+
+    job = DownloadJob(repo.repo_id, str(tmp_path), endpoint=endpoint, proxies={}, retry_policy=RetryPolicy(attempts=1),
+                      tensors=["embed.*", "layers.*.a", "layers.0.c", "lm_head.*"])
+    succeeded = job.run()
+
+    assert sorted(succeeded) == ["config.json"] + sorted(selected)
+    assert not os.path.exists(os.path.join(str(tmp_path), SHARDS[2]))
+    # 写出的分片只包含选中的张量, 内容与远程分片中的相同
+    for shard, names in selected.items():
+        written, metadata = read_shard(os.path.join(str(tmp_path), shard))
+        assert written == {name: data[name] for name in names}
+        assert metadata == ({"format": "pt"} if shard == SHARDS[0] else None)
+    # 未选中的大张量没有下载
+    assert hub.stats()["bytes_sent"] < repo.files[SHARDS[0]].size // 2
+
+    with open(os.path.join(str(tmp_path), INDEX), encoding="utf-8") as f:
+        index = json.load(f)
+    assert index["weight_map"] == {name: shard for shard, names in selected.items() for name in names}
+    assert index["metadata"]["total_size"] == sum(len(data[name]) for names in selected.values() for name in names)